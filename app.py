@@ -1,7 +1,5 @@
 import streamlit as st
 import pandas as pd
-import vertexai
-from vertexai.generative_models import GenerativeModel
 from google.cloud import firestore
 import json
 import uuid
@@ -11,15 +9,29 @@ import base64
 import os
 import extra_streamlit_components as stx
 from contextlib import contextmanager
-from google.cloud import documentai
-from google.api_core.client_options import ClientOptions
-from google.cloud import storage
 import requests
 import firebase_admin
 from firebase_admin import auth, credentials
 from dotenv import load_dotenv
 
-from google.oauth2 import service_account
+from coin_standards import DISPLAY_ORDER
+from coin_programs import US_PROGRAMS
+from coin_dedup import annotate_near_duplicates, identify_duplicates
+from coin_normalize import normalize_coin_data
+from dedup_index import load_index, mark_index_dirty, stage_index_writes
+from import_preview import VIEWS, apply_deltas, delta_counts, merge_page, new_deltas, page_bounds, page_count, preview_summary, view_labels
+from column_mapping import resolve_column_mapping
+from spreadsheet_import import STREAM_MIN_BYTES, estimate_rows, import_id, load_import, map_dataframe, read_header, stream_import
+from program_histories import build_program_histories, find_program, generate_program_history, get_program_history
+from melt_calculator import compute_melt_values
+from spot_prices import get_spot_prices, load_spot_history, revalue_if_spot_moved
+from llm_json import APPRAISAL_SCHEMA, json_config, parse_model_json
+from deepdive_context import DEEPDIVE_MAX_TURNS, build_deepdive_prompt, get_collection_index
+from invoice_cache import content_hash, mark_imported, previous_import
+from gcp_clients import UPLOADS_BUCKET, ensure_bucket, get_bucket, get_client_stats, get_firestore, get_model, init_vertex
+from invoice_ingest import INGEST_MODE, get_ingestor
+from invoice_pipeline import feed_active, fill_header_fields, get_batch, record_upload, start_batch, stream_invoice_data, upload_feed
+from llm_client import call_model, set_call_context, get_metrics_snapshot, get_recent_calls, render_prometheus
 
 # --- CONFIGURATION ---
 load_dotenv()
@@ -56,32 +68,21 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- INITIALIZATION ---
-# Use Explicit Service Account Key if available to avoid 403 errors on Vertex
-key_path = "serviceAccountKey.json.json"
-vertex_creds = None
-if os.path.exists(key_path):
-    try:
-        vertex_creds = service_account.Credentials.from_service_account_file(key_path)
-    except: pass
-
-if "vertex_init" not in st.session_state:
-    vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=vertex_creds)
-    st.session_state.vertex_init = True
-    
-# --- CREDENTIALS (ADC) ---
-# Use Application Default Credentials (works on Cloud Run & Local with `gcloud auth application-default login`)
-import google.auth
+# Clients come from the process-wide registry (gcp_clients): built once per process, not per rerun.
+# Vertex uses the explicit service account key if available (avoids 403s), everything else ADC.
+init_vertex(LOCATION)
 
 # 1. Init Firebase Admin
 if not firebase_admin._apps:
     firebase_admin.initialize_app(options={'projectId': PROJECT_ID})
 
-# 2. Init Firestore Client
-# google.auth.default() automatically finds credentials
-credentials, project = google.auth.default()
-db = firestore.Client(credentials=credentials, project=PROJECT_ID)
+# 2. Firestore Client + Model
+db = get_firestore()
+model = get_model("gemini-2.5-flash")
 
-model = GenerativeModel("gemini-2.5-flash")
+# Tag every model call from this script run with the user & browser session (see llm_client)
+if 'llm_session_id' not in st.session_state: st.session_state['llm_session_id'] = str(uuid.uuid4())
+set_call_context(user=st.session_state.get('user_email'), session=st.session_state['llm_session_id'])
 
 # --- FIREBASE CLIENT API KEY ---
 # Required for Client-Side Operations from Python (Login, Reset Password)
@@ -586,50 +587,46 @@ def get_user_collection_path():
     return f"users/{email}/coins"
 
 # --- GCS QUEUE HELPERS ---
-from google.cloud import storage
-
-def get_bucket():
-    # Helper to get bucket object
-    if vertex_creds:
-        client = storage.Client(credentials=vertex_creds, project=PROJECT_ID)
-    else:
-        client = storage.Client(project=PROJECT_ID)
-    # Assume default bucket is the project's appspot or defined one
-    # For Cloud Run, 'PROJECT_ID.appspot.com' is standard default for Firebase
-    # bucket_name = f"{PROJECT_ID}.appspot.com" 
-    bucket_name = "numista-uploads-studio-9101802118-8c9a8"
-    return client.bucket(bucket_name)
-
-def list_queue_files(prefix="invoices/queue/"):
-    try:
-        bucket = get_bucket()
-        blobs = list(bucket.list_blobs(prefix=prefix))
-        # Filter out the folder itself if returned
-        return [b for b in blobs if not b.name.endswith('/')]
-    except Exception as e:
-        print(f"Queue List Error: {e}")
-        return []
-
-def move_blob(blob, dest_name):
-    try:
-        bucket = get_bucket()
-        bucket.rename_blob(blob, dest_name)
-    except Exception as e:
-        print(f"Move Error: {e}")
-
-def upload_to_gcs_queue(file_obj):
+def upload_to_gcs_queue(file_obj, user_email):
     try:
         bucket = get_bucket()
         blob_name = f"invoices/queue/{uuid.uuid4()}_{file_obj.name}"
         blob = bucket.blob(blob_name)
+        sha = content_hash(file_obj.getvalue())
+        # sha256 lets workers skip re-hashing; uploader routes the finalize event to this user
+        blob.metadata = {"sha256": sha, "uploader": user_email}
         file_obj.seek(0)
         blob.upload_from_file(file_obj, content_type=file_obj.type)
         print(f"DEBUG: Successfully uploaded {blob_name}")
+        record_upload(db, user_email, sha, blob_name)
+        if INGEST_MODE == "app": get_ingestor(bucket, db, model).enqueue(blob_name, user_email)
         return True, None
     except Exception as e:
         print(f"DEBUG: Upload failed: {e}")
         return False, str(e)
 
+def render_upload_feed(user_email):
+    # Status of this user's uploads from the job checkpoints; only polls while an upload is in flight
+    feed = upload_feed(db, user_email, limit=25)
+    if feed_active(feed):
+        st.session_state['upload_feed'] = feed
+        render_live_upload_feed(user_email)
+    else:
+        draw_upload_feed(feed)
+
+@st.fragment(run_every=5)
+def render_live_upload_feed(user_email):
+    # First pass reuses the feed just read; timer passes re-read it without a full rerun
+    feed = st.session_state.pop('upload_feed', None)
+    if feed is None: feed = upload_feed(db, user_email, limit=25)
+    draw_upload_feed(feed)
+    if not feed_active(feed): st.rerun()  # all settled: full rerun draws the static feed and drops the timer
+
+def draw_upload_feed(feed):
+    if not feed: return
+    st.markdown("##### 📡 Your Uploads")
+    st.dataframe(pd.DataFrame(feed), use_container_width=True, hide_index=True)
+
 @contextmanager
 def numista_loader(message="AI is analyzing data..."):
     placeholder = st.empty()
@@ -648,70 +645,11 @@ def numista_loader(message="AI is analyzing data..."):
     finally:
         placeholder.empty()
 
-COIN_STANDARDS = {
-    "denominations": {
-        "Penny": ["1c", "Cent", "One Cent", "Lincoln Cent", "Indian Head Cent"],
-        "Nickel": ["5c", "Five Cents", "Half Dime", "V Nickel", "Buffalo Nickel", "Jefferson Nickel"],
-        "Dime": ["10c", "Ten Cents", "Mercury Dime", "Roosevelt Dime"],
-        "Quarter": ["25c", "Quarter Dollar", "Washington Quarter", "State Quarter"],
-        "Half Dollar": ["50c", "Fifty Cents", "Kennedy Half", "Franklin Half", "Walking Liberty"],
-        "Dollar": ["$1", "Silver Dollar", "Morgan Dollar", "Peace Dollar", "Eisenhower Dollar", "SBA Dollar", "Sacagawea"]
-    },
-    "metals": {
-        "90% Silver": ["90% Silver, 10% Copper", "Fine Silver", "Silver Clad (.900)"],
-        "40% Silver": ["40% Silver Clad", "Silver Clad (.400)"],
-        "Cupro-Nickel": ["Copper-Nickel", "75% Copper, 25% Nickel", "Nickel Clad", "Clad"],
-        "Copper-plated Zinc": ["97.5% Zinc, 2.5% Copper", "Zinc"],
-        "Manganese-Brass": ["Golden Dollar Metal", "88.5% Cu, 6% Zn, 3.5% Mn, 2% Ni"]
-    }
-}
-
-
-
-US_PROGRAMS = {
-    "Circulating Coin Programs": [
-        {"id": "bicentennial", "name": "Bicentennial Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/bicentennial-coins", "years": "1976", "coins": ["Quarter", "Half Dollar", "Dollar"]},
-        {"id": "50state", "name": "50 State Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/50-state-quarters", "years": "1999-2008", "coins": ['Delaware', 'Pennsylvania', 'New Jersey', 'Georgia', 'Connecticut', 'Massachusetts', 'Maryland', 'South Carolina', 'New Hampshire', 'Virginia', 'New York', 'North Carolina', 'Rhode Island', 'Vermont', 'Kentucky', 'Tennessee', 'Ohio', 'Louisiana', 'Indiana', 'Mississippi', 'Illinois', 'Alabama', 'Maine', 'Missouri', 'Arkansas', 'Michigan', 'Florida', 'Texas', 'Iowa', 'Wisconsin', 'California', 'Minnesota', 'Oregon', 'Kansas', 'West Virginia', 'Nevada', 'Nebraska', 'Colorado', 'North Dakota', 'South Dakota', 'Montana', 'Washington', 'Idaho', 'Wyoming', 'Utah', 'Oklahoma', 'New Mexico', 'Arizona', 'Alaska', 'Hawaii']},
-        {"id": "dc_territories", "name": "District of Columbia and U.S. Territories Quarters", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/dc-and-us-territories", "years": "2009", "coins": ["District of Columbia", "Puerto Rico", "Guam", "American Samoa", "U.S. Virgin Islands", "Northern Mariana Islands"]},
-        {"id": "westward", "name": "Westward Journey Nickel Series", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/westward-journey-nickel-series", "years": "2004-2005", "coins": ["Peace Medal", "Keelboat", "American Bison", "Ocean in View"]},
-        {"id": "lincoln", "name": "Lincoln Bicentennial One-Cent Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/lincoln-bicentennial-one-cent", "years": "2009", "coins": ["Birth and Early Childhood", "Formative Years", "Professional Life", "Presidency"]},
-        {"id": "sba", "name": "Susan B. Anthony Dollar", "url": "https://www.usmint.gov/coins/coin-medal-programs/circulating-coins/susan-b-anthony-dollar", "years": "1979-1981, 1999", "coins": ["1979-P", "1979-D", "1979-S", "1980-P", "1980-D", "1980-S", "1981-P", "1981-D", "1981-S", "1999-P", "1999-D"]},
-        {"id": "sacagawea", "name": "Sacagawea Golden Dollar", "url": "https://www.usmint.gov/coins/coin-medal-programs/sacagawea-golden-dollar", "years": "2000-2008", "coins": ["2000-P", "2000-D", "2000-S", "2001-P", "2001-D", "2001-S", "2002-P", "2002-D", "2002-S", "2003-P", "2003-D", "2003-S", "2004-P", "2004-D", "2004-S", "2005-P", "2005-D", "2005-S", "2006-P", "2006-D", "2006-S", "2007-P", "2007-D", "2007-S", "2008-P", "2008-D", "2008-S"]},
-        {"id": "atb", "name": "America the Beautiful Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/america-the-beautiful-quarters", "years": "2010-2021", "coins": ["Hot Springs", "Yellowstone", "Yosemite", "Grand Canyon", "Mount Hood", "Gettysburg", "Glacier", "Olympic", "Vicksburg", "Chickasaw", "El Yunque", "Chaco Culture", "Acadia", "Hawaii Volcanoes", "Denali", "White Mountain", "Perry's Victory", "Great Basin", "Fort McHenry", "Mount Rushmore", "Great Smoky Mountains", "Shenandoah", "Arches", "Great Sand Dunes", "Everglades", "Homestead", "Kisatchie", "Blue Ridge Parkway", "Bombay Hook", "Saratoga", "Shawnee", "Cumberland Gap", "Harpers Ferry", "Theodore Roosevelt", "Fort Moultrie", "Effigy Mounds", "Frederick Douglass", "Ozark", "Ellis Island", "George Rogers Clark", "Pictured Rocks", "Apostle Islands", "Voyageurs", "Cumberland Island", "Block Island", "Lowell", "American Memorial", "War in the Pacific", "San Antonio Missions", "Frank Church River of No Return", "National Park of American Samoa", "Weir Farm", "Salt River Bay", "Marsh-Billings-Rockefeller", "Tallgrass Prairie", "Tuskegee Airmen"]},
-        {"id": "presidential", "name": "Presidential $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/presidential-dollar-coin", "years": "2007-2016, 2020", "coins": ["Washington", "Adams", "Jefferson", "Madison", "Monroe", "J.Q. Adams", "Jackson", "Van Buren", "Harrison", "Tyler", "Polk", "Taylor", "Fillmore", "Pierce", "Buchanan", "Lincoln", "Johnson", "Grant", "Hayes", "Garfield", "Arthur", "Cleveland (1st)", "Harrison", "Cleveland (2nd)", "McKinley", "Roosevelt", "Taft", "Wilson", "Harding", "Coolidge", "Hoover", "F.D. Roosevelt", "Truman", "Eisenhower", "Kennedy", "Johnson", "Nixon", "Ford", "Reagan", "G.H.W. Bush"]},
-        {"id": "native", "name": "Native American $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/native-american-dollar-coins", "years": "2009-Present", "coins": ["Three Sisters (2009)", "Great Tree of Peace (2010)", "Wampanoag Treaty (2011)", "Trade Routes (2012)", "Delaware Treaty (2013)", "Native Hospitality (2014)", "Mohawk Ironworkers (2015)", "Code Talkers (2016)", "Sequoyah (2017)", "Jim Thorpe (2018)", "Space Program (2019)", "Elizabeth Peratrovich (2020)", "Military Service (2021)", "Ely S. Parker (2022)", "Maria Tallchief (2023)", "Indian Citizenship Act (2024)", "Northeast Tech (2025)"]},
-        {"id": "innovation", "name": "American Innovation $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-innovation-dollar-coins", "years": "2018-2032", "coins": ['Intro Coin', 'Delaware', 'Pennsylvania', 'New Jersey', 'Georgia', 'Connecticut', 'Massachusetts', 'Maryland', 'South Carolina', 'New Hampshire', 'Virginia', 'New York', 'North Carolina', 'Rhode Island', 'Vermont', 'Kentucky', 'Tennessee', 'Ohio', 'Louisiana', 'Indiana', 'Mississippi', 'Illinois', 'Alabama', 'Maine', 'Missouri', 'Arkansas', 'Michigan', 'Florida', 'Texas', 'Iowa', 'Wisconsin', 'California', 'Minnesota', 'Oregon', 'Kansas', 'West Virginia', 'Nevada', 'Nebraska', 'Colorado', 'North Dakota', 'South Dakota', 'Montana', 'Washington', 'Idaho', 'Wyoming', 'Utah', 'Oklahoma', 'New Mexico', 'Arizona', 'Alaska', 'Hawaii']},
-        {"id": "women", "name": "American Women Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-women-quarters", "years": "2022-2025", "coins": ['Maya Angelou', 'Dr. Sally Ride', 'Wilma Mankiller', 'Adelina Otero-Warren', 'Anna May Wong', 'Bessie Coleman', 'Edith Kanakaʻole', 'Eleanor Roosevelt', 'Jovita Idar', 'Maria Tallchief', 'Rev. Dr. Pauli Murray', 'Patsy Takemoto Mink', 'Dr. Mary Edwards Walker', 'Celia Cruz', 'Zitkala-Ša']},
-        {"id": "semiquin", "name": "2026 Semiquincentennial Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/semiquincentennial-coins", "years": "2026", "coins": ["Mayflower Compact Quarter (Pending)", "Revolutionary War Quarter (Pending)", "Declaration of Independence Quarter (Pending)", "U.S. Constitution Quarter (Pending)", "Gettysburg Address Quarter (Pending)"]}
-    ],
-    "Bullion and Investment Programs": [
-        {"id": "ase", "name": "American Eagle Silver Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-silver-bullion-coins", "years": "1986-Present", "coins": ["Type 1 (1986-2021)", "Type 2 (2021-Present)"]},
-        {"id": "age", "name": "American Eagle Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-gold-bullion-coins", "years": "1986-Present", "coins": ["Type 1 (1986-2021)", "Type 2 (2021-Present)"]},
-        {"id": "ape", "name": "American Eagle Platinum Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-platinum-bullion-coins", "years": "1997-Present", "coins": ["Proof Series", "Uncirculated Series", "Bullion"]},
-        {"id": "apall", "name": "American Eagle Palladium Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-palladium-bullion-coins", "years": "2017-Present", "coins": ["Bullion", "Proof", "Reverse Proof", "Uncirculated"]},
-        {"id": "buffalo", "name": "American Buffalo Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-buffalo-coin", "years": "2006-Present", "coins": ["Bullion (1oz)", "Proof (1oz)", "Fractional (2008 Only)"]},
-        {"id": "liberty", "name": "American Liberty High Relief Gold and Silver Medal Series", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-liberty-high-relief-gold-coins", "years": "2015-Present", "coins": ["2015 High Relief Gold", "2016 Silver Medal", "2017 Gold Coin", "2018 Gold Coin", "2019 High Relief Gold", "2019 Silver Medal", "2021 High Relief Gold", "2022 Silver Medal", "2023 High Relief Gold", "2024 Silver Medal"]},
-        {"id": "spouse", "name": "First Spouse Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/first-spouse-gold-coins", "years": "2007-2016, 2020", "coins": ["Martha Washington", "Abigail Adams", "Jefferson's Liberty", "Dolley Madison", "Elizabeth Monroe", "Louisa Adams", "Jackson's Liberty", "Van Buren's Liberty", "Anna Harrison", "Letitia Tyler", "Julia Tyler", "Sarah Polk", "Margaret Taylor", "Abigail Fillmore", "Jane Pierce", "Buchanan's Liberty", "Mary Todd Lincoln", "Eliza Johnson", "Julia Grant", "Lucy Hayes", "Lucretia Garfield", "Alice Paul", "Frances Cleveland (1st)", "Caroline Harrison", "Frances Cleveland (2nd)", "Ida McKinley", "Edith Roosevelt", "Helen Taft", "Ellen Wilson", "Edith Wilson", "Florence Harding", "Grace Coolidge", "Lou Hoover", "Eleanor Roosevelt", "Bess Truman", "Mamie Eisenhower", "Jacqueline Kennedy", "Lady Bird Johnson", "Pat Nixon", "Betty Ford", "Nancy Reagan", "Barbara Bush"]},
-        {"id": "dc_comics", "name": "DC Comics Bullion Series", "url": "https://catalog.usmint.gov/", "years": "2025-2027", "coins": ["Superman (2025 Pending)", "Batman (2025 Pending)", "Wonder Woman (2025 Pending)", "2026 Release 1 (Pending)", "2026 Release 2 (Pending)", "2026 Release 3 (Pending)", "2027 Release 1 (Pending)", "2027 Release 2 (Pending)", "2027 Release 3 (Pending)"]}
-    ],
-    "Upcoming Officially Announced Programs": [
-        {"id": "fifa", "name": "2026 FIFA World Cup Commemorative Coin Program", "url": "https://www.usmint.gov/", "years": "2026", "coins": ["$5 Gold Coin (Pending)", "$1 Silver Coin (Pending)", "Half Dollar Clad (Pending)"]},
-        {"id": "youth_post_2026", "name": "Youth and Paralympic Sports Quarters and Half Dollars", "url": "https://www.usmint.gov/news/press-releases", "years": "Post-2026", "coins": ["Youth Sports Quarter 1 (Pending)", "Youth Sports Quarter 2 (Pending)", "Youth Sports Quarter 3 (Pending)", "Youth Sports Quarter 4 (Pending)", "Youth Sports Quarter 5 (Pending)", "Paralympic Half Dollar (Pending)"]},
-        {"id": "youth_2027", "name": "2027 Youth and Paralympic Sports Program", "url": "https://www.usmint.gov/news/press-releases", "years": "2027", "coins": ["2027 Quarter 1 (Pending)", "2027 Quarter 2 (Pending)", "2027 Quarter 3 (Pending)", "2027 Quarter 4 (Pending)", "2027 Quarter 5 (Pending)", "2027 Half Dollar (Pending)"]}
-    ]
-}
-
 
 # --- POPUP MODE FUNCTION ---
 def render_popup_history_mode(prog_id):
     # Locate Program
-    program = None
-    for cat, progs in US_PROGRAMS.items():
-        for p in progs:
-            if p['id'] == prog_id:
-                program = p
-                break
-        if program: break
+    program = find_program(prog_id)
     
     if not program:
         st.error("Program not found.")
@@ -720,19 +658,15 @@ def render_popup_history_mode(prog_id):
     st.markdown(f"## 📚 History: {program['name']}")
     st.caption(f"Years: {program['years']}")
     
-    # Generate History
-    with st.spinner("Consulting the archives..."):
-        # Helper to generate history (duplicated or shared)
-        prompt = f"Provide a brief, engaging history of the US Mint '{program['name']}' coin program. Include authorization (law), years, designer info if key, and purpose. Format with markdown."
-        try:
-             # Direct Gemini Call (Bypass collection check)
-             chat_session = model.start_chat()
-             max_retries = 3
-             # Simple retry logic or just direct call
-             response = chat_session.send_message(prompt)
-             st.markdown(response.text)
-        except Exception as e:
-             st.error(f"AI Gemini Error: {e}")
+    # Precomputed History (static asset / shared doc) - generate only if missing or catalog changed
+    history = get_program_history(program, db=db)
+    if history is None:
+        with st.spinner("Consulting the archives..."):
+            try:
+                 history = generate_program_history(program, model, db=db)
+            except Exception as e:
+                 st.error(f"AI Gemini Error: {e}")
+    if history: st.markdown(history)
     
     st.divider()
     st.markdown(f"**Official Source:** [{program['url']}]({program['url']})")
@@ -859,38 +793,33 @@ def render_programs():
         
         with st.expander("📚 Program History & Info", expanded=show_history):
             
-            # Helper to generate history
-            def get_history(p_name):
-                prompt = f"Provide a brief, engaging history of the US Mint '{p_name}' coin program. Include authorization (law), years, designer info if key, and purpose. Format with markdown."
+            # Helper to generate history (only when missing from the precomputed set)
+            def get_history(p):
                 try:
-                    # Assuming ask_deepdive is defined elsewhere and can take a prompt and df
-                    # If df is not needed for this specific prompt, pass None or an empty df
-                    return ask_deepdive(prompt, df) # Reusing deepdive as it has context, or just generic model
+                    return generate_program_history(p, model, db=db)
                 except Exception as e:
                     print(f"Error generating history: {e}")
-                    return "AI History currently unavailable."
+                    return None
 
-            # If triggered, generate automatically if not present? 
-            # OR just show a button to generate. User asked for "Gemini powered history... where the hyperlink points to"
-            # implying immediate view.
-            
-            if show_history:
-                 if f"history_{prog['id']}" not in st.session_state:
-                     with st.spinner(f"Generating history for {prog['name']}..."):
-                         st.session_state[f"history_{prog['id']}"] = get_history(prog['name'])
+            # Precomputed histories load instantly (shared by all users)
+            history = get_program_history(prog, db=db)
+            if history is None and show_history:
+                with st.spinner(f"Generating history for {prog['name']}..."):
+                    history = get_history(prog)
             
             # Display History if available
-            if f"history_{prog['id']}" in st.session_state:
-                st.markdown(st.session_state[f"history_{prog['id']}"])
+            if history:
+                st.markdown(history)
                 st.caption(f"Source Reference: [{prog['url']}]({prog['url']})")
                 if st.button("🔄 Refresh History", key=f"refresh_{prog['id']}"):
-                    del st.session_state[f"history_{prog['id']}"]
+                    with st.spinner(f"Regenerating history for {prog['name']}..."):
+                        get_history(prog)
                     st.rerun()
             else:
                 st.info("Click below to generate a detailed history of this program provided by Vertex AI.")
                 if st.button("✨ Generate AI History Summary", key=f"gen_{prog['id']}"):
-                    st.session_state.show_history_for = prog['id'] # Set flag to auto-trigger next render logic logic via rerun or just run it now
-                    st.session_state[f"history_{prog['id']}"] = get_history(prog['name'])
+                    st.session_state.show_history_for = prog['id']
+                    get_history(prog)
                     st.rerun()
                 st.markdown(f"**Official Source:** [{prog['url']}]({prog['url']})")
         
@@ -935,52 +864,6 @@ def render_programs():
                 
         st.info("ℹ️ Missing items are automatically added to your 'My Wishlist' page.")
 
-def normalize_coin_data(df):
-    if df.empty: return df
-    
-    # helper for mapping
-    def get_canonical(val, category):
-        if not val: return val
-        s_val = str(val).strip()
-        for canonical, aliases in COIN_STANDARDS[category].items():
-            if s_val.lower() == canonical.lower(): return canonical
-            for alias in aliases:
-                if s_val.lower() == alias.lower(): return canonical
-        return val # no match found, keep original
-
-    # 1. Normalize Denomination & Metal
-    if 'Denomination' in df.columns:
-        df['Denomination'] = df['Denomination'].apply(lambda x: get_canonical(x, 'denominations'))
-    if 'Metal Content' in df.columns:
-        df['Metal Content'] = df['Metal Content'].apply(lambda x: get_canonical(x, 'metals'))
-
-    # 2. Date Cleanup (Purchase Date)
-    if 'Purchase Date' in df.columns:
-        def clean_date(d):
-            if not d or str(d).lower() in ['nan', 'nat', 'none', '']: return datetime.today().strftime('%Y-%m-%d')
-            try:
-                # Try simple casting first
-                return pd.to_datetime(d).strftime('%Y-%m-%d')
-            except:
-                return datetime.today().strftime('%Y-%m-%d')
-        df['Purchase Date'] = df['Purchase Date'].apply(clean_date)
-
-    # 3. Text Cleanup (Theme, etc) - N/A or Blank -> ""
-    text_cols = ['Theme/Subject', 'Program/Series', 'Mint Mark']
-    for col in text_cols:
-        if col in df.columns:
-            df[col] = df[col].apply(lambda x: "" if str(x).lower().strip() in ['n/a', 'blank', 'nan', 'none'] else x)
-            
-    return df
-
-DISPLAY_ORDER = [
-    "Country", "Year", "Mint Mark", "Denomination", "Quantity", 
-    "Program/Series", "Theme/Subject", "Condition", "Surface & Strike Quality", 
-    "Grading Service", "Grading Cert #", "Cost", "Purchase Date", 
-    "Retailer/Website", "Retailer Invoice #", "Retailer Item No.", "Metal Content", "Melt Value", "Personal Notes", 
-    "Personal Ref #", "AI Estimated Value", "Storage Location"
-]
-
 def get_empty_collection_df():
     system_cols = ['id', 'deep_dive_status', 'Numismatic Report', 'potentialVariety', 'imageUrlObverse', 'imageUrlReverse', 'inventoryStatus', 'category', 'file_ref', 'source_file']
     final_cols = DISPLAY_ORDER + [c for c in system_cols if c not in DISPLAY_ORDER]
@@ -1062,7 +945,9 @@ def save_edits(edited_df, original_df):
         batch.set(ref, data, merge=True)
         count += 1
         if count >= 400: batch.commit(); batch = db.batch(); count = 0
-    if count > 0: batch.commit()
+    # Duplicate-key index: new keys are added, a changed key marks it for rebuild
+    stage_index_writes(batch, db, st.session_state.get('user_email'), edited_df, before=original_df)
+    batch.commit()
 
 def delete_coins(coin_ids):
     path = get_user_collection_path()
@@ -1070,6 +955,7 @@ def delete_coins(coin_ids):
     for cid in coin_ids:
         ref = db.collection(path).document(cid)
         batch.delete(ref)
+    mark_index_dirty(db, st.session_state.get('user_email'), batch=batch)
     batch.commit()
 
 
@@ -1077,18 +963,11 @@ def delete_coins(coin_ids):
 def upload_to_gcs(file_bytes, destination_blob_name, content_type="application/octet-stream"):
     """Uploads bytes to Google Cloud Storage and returns the GS URI."""
     try:
-        storage_client = storage.Client()
-        bucket_name = f"{PROJECT_ID}-uploads"
-        
-        # Create bucket if not exists
-        try:
-            bucket = storage_client.get_bucket(bucket_name)
-        except:
-            bucket = storage_client.create_bucket(bucket_name, location=LOCATION)
-            
+        # Bucket existence is checked (and created if missing) once per process
+        bucket = ensure_bucket(UPLOADS_BUCKET, location=LOCATION)
         blob = bucket.blob(destination_blob_name)
         blob.upload_from_string(file_bytes, content_type=content_type)
-        return f"gs://{bucket_name}/{destination_blob_name}"
+        return f"gs://{UPLOADS_BUCKET}/{destination_blob_name}"
     except Exception as e:
         print(f"GCS Upload Failed: {e}")
         return None
@@ -1114,16 +993,6 @@ def handle_image_upload(file, coin_id, side):
     db.collection(path).document(coin_id).set(update_data, merge=True)
     st.toast("Image saved!", icon="📸"); time.sleep(1); st.rerun()
 
-def process_invoice(file_content):
-    # Processor ID: c113e9bb62be1554
-    opts = ClientOptions(api_endpoint=f"us-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
-    name = client.processor_path(PROJECT_ID, "us", "c113e9bb62be1554")
-    raw_document = documentai.RawDocument(content=file_content, mime_type="application/pdf")
-    request = documentai.ProcessRequest(name=name, raw_document=raw_document)
-    result = client.process_document(request=request)
-    return result.document
-
 # --- RESEARCHER ENGINE ---
 def generate_ai_reports(df_to_process, silver_p, gold_p):
     path = get_user_collection_path()
@@ -1131,6 +1000,10 @@ def generate_ai_reports(df_to_process, silver_p, gold_p):
     progress_bar = status_box.progress(0)
     chat = model.start_chat()
     
+    # Melt is pure arithmetic - computed locally from the composition table in one pass.
+    # The model only estimates market value (it sees the melt figure as a floor).
+    melt_values = compute_melt_values(df_to_process, silver_p, gold_p)
+    
     RESEARCH_PROMPT = f"""
     You are an expert Numismatic Appraiser.
     Analyze the coin and generate a comprehensive JSON report.
@@ -1138,13 +1011,11 @@ def generate_ai_reports(df_to_process, silver_p, gold_p):
     
     INSTRUCTIONS:
     1. Fill any missing technical data (Composition, Series, Theme).
-    2. Melt Value: Calculate (Weight * Purity * Spot). Return formatted string (e.g. "$18.42"). If not precious, return "N/A".
-    3. AI Estimated Value: Estimate fair market range for this specific coin condition.
-    4. Numismatic Report: Brief history/significance.
+    2. AI Estimated Value: Estimate fair market range for this specific coin condition. Never below the provided Melt Value.
+    3. Numismatic Report: Brief history/significance.
     
     CRITICAL: OUTPUT VALID JSON ONLY matching this structure:
     {{
-        "Melt Value": "string",
         "AI Estimated Value": "string",
         "Program/Series": "string",
         "Theme/Subject": "string",
@@ -1157,21 +1028,22 @@ def generate_ai_reports(df_to_process, silver_p, gold_p):
     
     total = len(df_to_process)
     count = 0
+    rekeyed = False
     
     for index, row in df_to_process.iterrows():
         d = row.to_dict()
+        d['Melt Value'] = melt_values.loc[index]
         coin_desc = f"{d.get('Year')} {d.get('Country')} {d.get('Denomination')} {d.get('Mint Mark')} {d.get('Condition')}"
         status_box.write(f"Analyzing: **{coin_desc}**")
         try:
-            response = chat.send_message([RESEARCH_PROMPT, f"Known Data: {json.dumps(d, default=str)}"])
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
-            ai_data = json.loads(clean_text)
+            response = call_model("appraisal", [RESEARCH_PROMPT, f"Known Data: {json.dumps(d, default=str)}"], chat=chat, generation_config=json_config(APPRAISAL_SCHEMA))
+            ai_data = parse_model_json(response.text, "appraisal", expect=dict)
             
             doc_ref = db.collection(path).document(row['id'])
             
             # Merge AI data with existing data, preferring AI for empty fields
             update_data = {
-                "Melt Value": ai_data.get("Melt Value", "N/A"),
+                "Melt Value": melt_values.loc[index],
                 "AI Estimated Value": ai_data.get("AI Estimated Value", "Pending"),
                 "Numismatic Report": ai_data.get("Numismatic Report", ""),
                 "potentialVariety": ai_data.get("potentialVariety"),
@@ -1185,11 +1057,14 @@ def generate_ai_reports(df_to_process, silver_p, gold_p):
             if not d.get('Metal Content') and ai_data.get('Metal Content'): update_data['Metal Content'] = ai_data['Metal Content']
             
             doc_ref.set(update_data, merge=True)
+            if 'Metal Content' in update_data: rekeyed = True
             time.sleep(1.0)
         except Exception as e: status_box.error(f"FAIL: {e}")
         count += 1
         progress_bar.progress(count / total)
     
+    # A filled-in metal changes the coin's duplicate key
+    if rekeyed: mark_index_dirty(db, st.session_state.get('user_email'))
     status_box.update(label="Syncing...", state="complete", expanded=False)
     time.sleep(2)
     st.rerun()
@@ -1198,14 +1073,24 @@ def generate_ai_report_single(coin_data, silver_p, gold_p):
     df_single = pd.DataFrame([coin_data])
     generate_ai_reports(df_single, silver_p, gold_p)
 
-def ask_deepdive(query, df):
+def ask_deepdive(query, df, feature="deepdive"):
     if df.empty: return "Your collection is empty."
-    summary_df = df[['Year', 'Country', 'Denomination', 'Condition', 'Cost', 'AI Estimated Value']].to_string()
-    chat_prompt = f"User Question: '{query}'\nData:\n{summary_df}\nAnswer as an expert numismatist."
+    # Bounded context: precomputed summary + only the coins relevant to the question
+    index = get_collection_index(df, key=st.session_state.get('user_email'))
+    
+    # Reuse one chat per session so follow-ups keep context; restart when the
+    # collection changes or the history gets long. One-off features get a fresh chat.
+    dd = st.session_state.get('deepdive_chat') if feature == "deepdive" else None
+    if not dd or dd['signature'] != index['signature'] or dd['turns'] >= DEEPDIVE_MAX_TURNS:
+        dd = {'chat': model.start_chat(), 'signature': index['signature'], 'turns': 0}
+        if feature == "deepdive": st.session_state['deepdive_chat'] = dd
+    
+    chat_prompt = build_deepdive_prompt(index, query, include_summary=(dd['turns'] == 0))
     try:
         with numista_loader("Numista AI is researching your collection..."):
-            chat = model.start_chat()
-            return chat.send_message(chat_prompt).text
+            answer = call_model(feature, chat_prompt, chat=dd['chat']).text
+            dd['turns'] += 1
+            return answer
     except Exception as e: return f"Error: {e}"
 
 # --- POPUP EXECUTION (Placed here to ensure functions are defined) ---
@@ -1229,76 +1114,6 @@ def dismiss_variety(coin_data):
     db.collection(path).document(coin_data['id']).set({"potentialVariety": firestore.DELETE_FIELD}, merge=True)
     st.toast("Dismissed.", icon="👍"); time.sleep(1); st.rerun()
 
-def identify_duplicates(new_df, existing_df):
-    if existing_df.empty:
-        new_df['Status'] = 'NEW'
-        new_df['Duplicate Check Key'] = 'No Existing Data'
-        return new_df
-
-    # --- Helper 1: Attribute Key (Legacy compatible) ---
-    def get_attr_key(row):
-        y = str(row.get('Year', '')).strip()
-        m = str(row.get('Mint Mark', '')).strip().replace('None', '').replace('nan', '')
-        d = str(row.get('Denomination', '')).strip()
-        mt = str(row.get('Metal Content', '')).strip()
-
-        # Condition Normalization (Remove CAC/Sticker noise)
-        raw_c = str(row.get('Condition', '')).upper()
-        c = raw_c.replace("CAC", "").replace("STICKER", "").replace("APPROVED", "").replace("CERTIFIED", "").strip()
-        
-        # Strike Normalization
-        raw_s = str(row.get('Surface & Strike Quality', '')).upper()
-        s = raw_s.replace("CAC", "").replace("APPROVED", "").replace("CERTIFIED", "").strip()
-
-        # Aggressive Denomination Normalization
-        d_lower = d.lower()
-        if d_lower == "dollar":
-            try:
-                yi = int(y)
-                if 1878 <= yi <= 1921: d = "Morgan Silver Dollar"
-                elif 1921 < yi <= 1935: d = "Peace Silver Dollar"
-            except: pass
-
-        return f"{y}|{m}|{d}|{c}|{mt}|{s}".lower()
-
-    # --- Helper 2: Invoice Key (New strict logic) ---
-    def get_inv_key(row):
-        inv = str(row.get('Retailer Invoice #', '')).strip().lower()
-        item = str(row.get('Retailer Item No.', '')).strip().lower()
-        
-        if inv and item and inv != 'nan' and item != 'nan':
-            return f"{inv}|{item}"
-        return None
-
-    # --- Build Indices ---
-    existing_attr_keys = set(existing_df.apply(get_attr_key, axis=1))
-    existing_inv_keys = set(existing_df.apply(get_inv_key, axis=1))
-    # Remove None from set to avoid false positives
-    existing_inv_keys.discard(None) 
-
-    # --- Check New Rows ---
-    def check_dupe(row):
-        k_attr = get_attr_key(row)
-        k_inv = get_inv_key(row)
-        
-        # HYBRID CHECK: If EITHER matches, it's a duplicate
-        is_dupe_attr = k_attr in existing_attr_keys
-        is_dupe_inv = (k_inv is not None) and (k_inv in existing_inv_keys)
-        
-        status = 'DUPLICATE' if (is_dupe_attr or is_dupe_inv) else 'NEW'
-        
-        # Debug String
-        debug_str = f"ATTR: {k_attr}"
-        if k_inv: debug_str += f" || INV: {k_inv}"
-        if is_dupe_inv: debug_str += " [MATCH: INV]"
-        elif is_dupe_attr: debug_str += " [MATCH: ATTR]"
-        
-        return pd.Series([status, debug_str])
-
-    new_df[['Status', 'Duplicate Check Key']] = new_df.apply(check_dupe, axis=1)
-    
-    return new_df
-
 def save_to_firestore(df_to_save):
     if df_to_save.empty: return
     path = get_user_collection_path()
@@ -1306,13 +1121,14 @@ def save_to_firestore(df_to_save):
     
     for index, row in df_to_save.iterrows():
         # Ensure ID
-        if 'id' not in row or not row['id']: row['id'] = str(uuid.uuid4())
+        if 'id' not in row or pd.isna(row['id']) or not row['id']: row['id'] = str(uuid.uuid4())
         
         doc_data = row.to_dict()
         
         # Clean up temporary columns
         if 'Status' in doc_data: del doc_data['Status']
         if 'Duplicate Check Key' in doc_data: del doc_data['Duplicate Check Key']
+        for col in ('Near Duplicate', 'Near Confidence'): doc_data.pop(col, None)
         if '_index' in doc_data: del doc_data['_index'] # Streamlit editor artifact
         
         # Ensure critical fields
@@ -1324,83 +1140,106 @@ def save_to_firestore(df_to_save):
         count += 1
         if count >= 400: batch.commit(); batch = db.batch(); count = 0
         
-    if count > 0: batch.commit()
+    # Duplicate-key index rides in the last batch, so it never lists a coin that failed to write
+    stage_index_writes(batch, db, st.session_state.get('user_email'), df_to_save)
+    batch.commit()
     st.success(f"Successfully imported {count} coins!"); st.balloons(); time.sleep(1.5); st.rerun()
 
-def get_column_mapping(source_columns):
-    target_columns = DISPLAY_ORDER
-    # We want to be smart about mapping.
-    prompt = f"""
-    You are an expert Data Engineer. Map the Source Columns from a user's spreadsheet to the Target Database Schema.
-    
-    Target Schema: {target_columns}
-    Source Columns: {source_columns}
-    
-    INSTRUCTIONS:
-    1. Return a JSON object where Key = Source Column, Value = Target Column.
-    2. If a Source Column has NO clear match in Target, map it to "EXTRA_METADATA".
-    3. Be generous with matching (e.g. "Date" -> "Purchase Date", "Grade" -> "Condition").
-    4. "Cost" should map to "Cost".
-    
-    OUTPUT JSON ONLY.
-    """
-    try:
-        chat = model.start_chat()
-        response = chat.send_message(prompt)
-        text = response.text.replace("```json", "").replace("```", "").strip()
-        mapping = json.loads(text)
-        return mapping
-    except Exception as e:
-        st.error(f"Mapping Failed: {e}")
-        return {}
-
-def process_row_with_mapping(row, mapping):
-    """
-    Applies strict mapping to a single row.
-    Returns: (processed_dict, list_of_errors)
-    """
-    data = {}
-    extra_metadata = {}
-    errors = []
-    
-    # Initialize Defaults
-    data['id'] = str(uuid.uuid4())
-    for col in DISPLAY_ORDER:
-        data[col] = "" # Default to empty string
-    
-    data['deep_dive_status'] = "PENDING"
-    data['inventoryStatus'] = "UNCHECKED"
-    data['AI Estimated Value'] = "Pending"
-    if 'Cost' not in data or not data['Cost']: data['Cost'] = "$0.00"
+def set_upload_stage(staged_df):
+    # Each stage gets its own token, so preview edits made on an earlier stage never carry over
+    st.session_state['upload_stage'] = staged_df
+    st.session_state['upload_stage_token'] = str(uuid.uuid4())
+
+def render_import_preview(staged_df, key, failed=0, column_config=None):
+    # Stats first, then one page in the editor; edits live as deltas until import (see import_preview)
+    stage = st.session_state.get('upload_stage_token')
+    deltas = st.session_state.get(f"{key}_deltas")
+    if deltas is None or stage is None or deltas["stage"] != stage:
+        deltas = st.session_state[f"{key}_deltas"] = new_deltas(stage)
+    view_df = apply_deltas(staged_df, deltas)
+
+    cached = st.session_state.get(f"{key}_summary")
+    if not cached or cached[0] != (deltas["stage"], deltas["version"]):
+        cached = st.session_state[f"{key}_summary"] = ((deltas["stage"], deltas["version"]), preview_summary(view_df, failed))
+    summary = cached[1]
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Rows", f"{summary['rows']:,}")
+    m2.metric("New", f"{summary['new']:,}")
+    m3.metric("Duplicates", f"{summary['duplicates']:,}")
+    m4.metric("Near Duplicates", f"{summary['near']:,}")
+    m5.metric("Failed Rows", f"{summary['failed']:,}")
+    with st.expander("Column fill rates"):
+        hidden = set(k for k, v in (column_config or {}).items() if v is None) | {'Status', 'Duplicate Check Key', 'Near Confidence', 'Near Duplicate'}
+        fill = summary['fill'].drop(labels=[c for c in summary['fill'].index if c in hidden]).mul(100).round(1)
+        st.dataframe(fill.rename("Filled").to_frame(), use_container_width=True,
+                     column_config={"Filled": st.column_config.ProgressColumn("Filled", format="%.0f%%", min_value=0, max_value=100)})
+    n_edit, n_del, n_add = delta_counts(deltas)
+    if n_edit or n_del or n_add:
+        st.caption(f"Pending changes (applied on import): {n_edit:,} edited, {n_del:,} removed, {n_add:,} added")
+
+    c_view, c_page = st.columns([2, 1])
+    view = c_view.radio("Show", VIEWS, horizontal=True, key=f"{key}_view")
+    labels = view_labels(view_df, view)
+    pages = page_count(len(labels))
+    page_key = f"{key}_page_{view}"
+    if st.session_state.get(page_key, 1) > pages: st.session_state[page_key] = pages  # rows were removed
+    page = c_page.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=page_key)
+    start, end = page_bounds(page, len(labels))
+    st.caption(f"Rows {start + 1 if end else 0:,}–{end:,} of {len(labels):,}")
+
+    shown = view_df.loc[labels[start:end]]
+    edited = st.data_editor(shown, use_container_width=True, num_rows="dynamic",
+                            key=f"{key}_{deltas['version']}_{view}_{page}", column_config=column_config)
+    # New widget key per delta version, so the next render starts from the merged rows
+    if merge_page(deltas, shown, edited): st.rerun()
+    return view_df
+
+def render_stream_import(uploaded_file):
+    # Constant-memory mode: header-only mapping, then read / map / dedup / commit one chunk at a time
+    user_email = st.session_state.get('user_email')
+    iid = import_id(user_email, content_hash(uploaded_file.getvalue()))
+    state = load_import(db, user_email, iid)
+    total = state.get('total_rows') or estimate_rows(uploaded_file, uploaded_file.name)
+    of_total = f"/{total:,}" if total else ""
+    st.info(f"📦 Large file{f' (~{total:,} rows)' if total else ''}: it will be imported in chunks without a full preview.")
+    if state.get('status') == 'done':
+        st.success(f"This file was already imported: {state.get('imported', 0):,} coins, {state.get('duplicates', 0):,} duplicates.")
+        return
+    if state.get('rows_done'):
+        st.warning(f"An earlier import of this file stopped at row {state['rows_done']:,}. Importing resumes from there.")
+    skip_dupes = st.checkbox("Skip potential duplicates", value=True, key="stream_skip_dupes")
+
+    if st.button("Stream Import", type="primary"):
+        with st.spinner("Resolving columns..."):
+            mapping = get_column_mapping(read_header(uploaded_file, uploaded_file.name))
+            # Snapshot taken once: rows committed by this run don't flag later chunks
+            key_index = load_index(db, user_email)
+        bar = st.progress(0.0)
+        line = st.empty()
+
+        def on_progress(s):
+            if total: bar.progress(min(s['rows_done'] / total, 1.0))
+            line.caption(f"{s['rows_done']:,}{of_total} rows · {s['imported']:,} imported · "
+                         f"{s['duplicates']:,} duplicates · {s['failed']:,} failed · {s['rows_per_s'] or 0:,} rows/s")
+
+        result = stream_import(uploaded_file, uploaded_file.name, mapping, db, user_email, iid,
+                               file_ref=st.session_state.get('current_file_gcs_uri'),
+                               normalize=normalize_coin_data,
+                               dedupe=lambda chunk: annotate_near_duplicates(identify_duplicates(chunk, index=key_index), index=key_index),
+                               skip_duplicates=skip_dupes, total_rows=total, progress=on_progress)
+        bar.progress(1.0)
+        st.success(f"Imported {result['imported']:,} coins ({result['duplicates']:,} duplicates, {result['failed']:,} failed rows).")
+        if result.get('near_duplicates'):
+            st.info(f"🔎 {result['near_duplicates']:,} imported rows closely resemble coins already in your vault.")
+        if result.get('failed_rows'):
+            csv = pd.DataFrame(result['failed_rows']).to_csv(index=False).encode('utf-8')
+            st.download_button("Download Failed Rows CSV", csv, "failed_rows.csv", "text/csv")
 
-    try:
-        for source_col, val in row.items():
-            # Handle NaN
-            if pd.isna(val) or val == "" or str(val).lower() == 'nan':
-                continue
-                
-            val_str = str(val).strip()
-            
-            target = mapping.get(source_col, "EXTRA_METADATA")
-            
-            if target == "EXTRA_METADATA":
-                extra_metadata[source_col] = val_str
-            elif target in DISPLAY_ORDER:
-                data[target] = val_str
-            else:
-                extra_metadata[source_col] = val_str # Fallback
-        
-        # Add basic cleanup
-        if 'Year' in data: 
-            try: data['Year'] = int(float(data['Year']))
-            except: pass
-            
-        data['extra_metadata'] = extra_metadata
-        return data, errors
-        
-    except Exception as e:
-        errors.append(str(e))
-        return None, errors
+def get_column_mapping(source_columns):
+    # Template / known headers resolve locally; the model only sees columns nothing else could map
+    mapping, info = resolve_column_mapping(source_columns, db=db, user_email=st.session_state.get('user_email'), model=model)
+    st.session_state['mapping_info'] = info
+    return mapping
 
 def render_add_excel():
     st.info("📂 Upload Excel or CSV to Fast Map coins.")
@@ -1415,6 +1254,10 @@ def render_add_excel():
         st.session_state['upload_stage'] = None
         st.session_state['mapping_stage'] = None
         st.session_state['failed_rows'] = []
+        st.session_state.pop('import_stats', None)
+        st.session_state.pop('mapping_info', None)
+        st.session_state.pop('editor_upload_deltas', None)
+        st.session_state.pop('editor_upload_summary', None)
         if 'current_file_gcs_uri' in st.session_state: del st.session_state['current_file_gcs_uri']
         if 'gcs_upload_done' in st.session_state: del st.session_state['gcs_upload_done']
         st.session_state['excel_uploader_key'] += 1
@@ -1429,9 +1272,6 @@ def render_add_excel():
         )
         
         if uploaded_file:
-            if uploaded_file.name.endswith('csv'): df = pd.read_csv(uploaded_file)
-            else: df = pd.read_excel(uploaded_file)
-            
             # --- PERSIST RAW FILE ---
             if 'gcs_upload_done' not in st.session_state:
                 timestamp = int(time.time())
@@ -1439,7 +1279,14 @@ def render_add_excel():
                 gcs_uri = upload_to_gcs(uploaded_file.getvalue(), blob_name, content_type=uploaded_file.type)
                 st.session_state['current_file_gcs_uri'] = gcs_uri
                 st.session_state['gcs_upload_done'] = True
-            
+
+            if uploaded_file.size > STREAM_MIN_BYTES:
+                render_stream_import(uploaded_file)
+                return
+
+            if uploaded_file.name.endswith('csv'): df = pd.read_csv(uploaded_file)
+            else: df = pd.read_excel(uploaded_file)
+
             # --- AUTO-PROCESS (Skip Confirmation) ---
             if st.button("Process & Import File", type="primary"):
                 with st.spinner("AI is analyzing & mapping columns..."):
@@ -1448,34 +1295,18 @@ def render_add_excel():
                     mapping = get_column_mapping(columns)
                     st.session_state['mapping_stage'] = mapping
                     
-                    # 2. Process
-                    processed_coins = []
-                    failed_rows = []
-                    gcs_ref = st.session_state.get('current_file_gcs_uri')
-                    
-                    progress = st.progress(0)
-                    total = len(df)
-                    
-                    for i, row in df.iterrows():
-                        data, errs = process_row_with_mapping(row, mapping)
-                        if data:
-                            if gcs_ref: data['file_ref'] = gcs_ref
-                            processed_coins.append(data)
-                        else:
-                            failed_rows.append({"Row Index": i, "Data": str(row.to_dict()), "Error": str(errs)})
-                        
-                        if i % 10 == 0: progress.progress((i+1)/total)
-                    
+                    # 2. Process (columnar - see spreadsheet_import)
+                    new_df, failed_rows, map_stats = map_dataframe(df, mapping, file_ref=st.session_state.get('current_file_gcs_uri'))
                     st.session_state['failed_rows'] = failed_rows
+                    st.session_state['import_stats'] = map_stats
                     
-                    if processed_coins:
-                        new_df = pd.DataFrame(processed_coins)
-                        existing_df = load_collection(limit_n=None)
+                    if not new_df.empty:
+                        key_index = load_index(db, st.session_state.get('user_email'))
                         new_df = normalize_coin_data(new_df)
-                        staged_df = identify_duplicates(new_df, existing_df)
+                        staged_df = annotate_near_duplicates(identify_duplicates(new_df, index=key_index), index=key_index)
                         
                         cols = ['Status'] + [c for c in staged_df.columns if c != 'Status']
-                        st.session_state['upload_stage'] = staged_df[cols]
+                        set_upload_stage(staged_df[cols])
                         st.rerun()
                     else:
                         st.error("No valid rows extracted.")
@@ -1485,6 +1316,15 @@ def render_add_excel():
         st.divider()
         st.subheader("Import Preview")
         
+        map_stats = st.session_state.get('import_stats')
+        if map_stats:
+            st.caption(f"Mapped {map_stats['mapped']:,} of {map_stats['rows']:,} rows in {map_stats['seconds']}s"
+                       + (f" ({map_stats['blank']:,} blank rows skipped)" if map_stats['blank'] else ""))
+        mapping_info = st.session_state.get('mapping_info')
+        if mapping_info:
+            how = ", ".join(f"{n} {m}" for m, n in mapping_info['methods'].items())
+            st.caption(f"Columns resolved: {how} ({mapping_info['model_calls']} AI calls)")
+
         # --- ERROR REPORTING ---
         failures = st.session_state['failed_rows']
         if failures:
@@ -1511,13 +1351,7 @@ def render_add_excel():
             "Duplicate Check Key": None
         }
         
-        edited_df = st.data_editor(
-            staged_df, 
-            use_container_width=True, 
-            num_rows="dynamic", 
-            key="editor_upload",
-            column_config=column_config
-        )
+        edited_df = render_import_preview(staged_df, "editor_upload", failed=len(failures), column_config=column_config)
         
         c1, c2, c3 = st.columns([1, 2, 2])
         
@@ -1646,15 +1480,15 @@ def render_add_manual():
                 else:
                     # 2. Check Duplicates
                     new_df = pd.DataFrame([data])
-                    existing_df = load_collection(limit_n=None)
+                    key_index = load_index(db, st.session_state.get('user_email'))
                     
                     # NORMALIZE
                     new_df = normalize_coin_data(new_df)
                     
-                    staged_df = identify_duplicates(new_df, existing_df)
+                    staged_df = annotate_near_duplicates(identify_duplicates(new_df, index=key_index), index=key_index)
                     
                     cols = ['Status'] + [c for c in staged_df.columns if c != 'Status']
-                    st.session_state['upload_stage'] = staged_df[cols]
+                    set_upload_stage(staged_df[cols])
                     st.rerun()
 
 # --- POPUP MODE CHECK ---
@@ -1671,13 +1505,7 @@ if st.session_state.get('POPUP_MODE_ID'):
 
 def render_popup_history_mode(prog_id):
     # Locate Program
-    program = None
-    for cat, progs in US_PROGRAMS.items():
-        for p in progs:
-            if p['id'] == prog_id:
-                program = p
-                break
-        if program: break
+    program = find_program(prog_id)
     
     if not program:
         st.error("Program not found.")
@@ -1686,17 +1514,15 @@ def render_popup_history_mode(prog_id):
     st.markdown(f"## 📚 History: {program['name']}")
     st.caption(f"Years: {program['years']}")
     
-    # Generate History
-    with st.spinner("consulting the archives..."):
-        # Helper to generate history (duplicated or shared)
-        prompt = f"Provide a brief, engaging history of the US Mint '{program['name']}' coin program. Include authorization (law), years, designer info if key, and purpose. Format with markdown."
-        try:
-             # Basic load to get context if needed, or just None
-             df = load_collection(limit_n=1) 
-             response = ask_deepdive(prompt, df)
-             st.markdown(response)
-        except Exception as e:
-             st.error(f"AI Error: {e}")
+    # Precomputed History - generate only if missing or catalog changed
+    history = get_program_history(program, db=db)
+    if history is None:
+        with st.spinner("consulting the archives..."):
+            try:
+                 history = generate_program_history(program, model, db=db)
+            except Exception as e:
+                 st.error(f"AI Error: {e}")
+    if history: st.markdown(history)
     
     st.divider()
     st.markdown(f"**Official Source:** [{program['url']}]({program['url']})")
@@ -1732,121 +1558,6 @@ def render_popup_history_mode(prog_id):
                 save_to_firestore(edited_df)
                 st.session_state['upload_stage'] = None
 
-def extract_invoice_data(file_bytes):
-    """
-    Helper to run DocAI OCR + Gemini Extraction and return raw items list.
-    """
-    # 1. OCR (DocAI)
-    doc = process_invoice(file_bytes)
-    
-    # 2. AI Extraction (Gemini)
-    chat = model.start_chat()
-    
-    COIN_DICTIONARY = [
-        { "val": 0.01, "formal": "Lincoln Cent", "slang": ["penny", "wheatie", "steelie", "red cent", "lincoln wheat cent", "wheat cent"] },
-        { "val": 0.05, "formal": "Jefferson Nickel", "slang": ["nickel", "buffalo", "war nickel", "v-nickel", "buffalo nickel"] },
-        { "val": 0.10, "formal": "Roosevelt Dime", "slang": ["dime", "mercury", "rosie", "winged liberty", "mercury dime"] },
-        { "val": 0.25, "formal": "Washington Quarter", "slang": ["quarter", "two bits", "state quarter", "2026 semiquin"] },
-        { "val": 0.50, "formal": "Kennedy Half Dollar", "slang": ["half", "fifty cent", "franklin", "walker", "walking liberty"] },
-        { "val": 1.00, "formal": "Morgan Silver Dollar", "slang": ["morgan", "silver dollar", "cartwheel", "peace dollar", "peace"] }
-    ]
-
-    SYSTEM_PROMPT = (
-        "You are an expert Numismatist. Extract items from this invoice text. "
-        "Return a JSON LIST of objects using this validation rules: \n"
-        "1. CLASSIFY each item into 'category': 'US Coin', 'Paper Currency', 'Foreign Currency', 'Supply/Other'.\n"
-        "2. CONFIDENCE SCORING: For each item, add:\n"
-        "   - 'confidence_score': Float 0.0 to 1.0 (1.0 = perfect match, 0.0 = total guess)\n"
-        "   - 'needs_manual_review': Boolean (true if Date/Mint/Denomination is ambiguous or missing)\n"
-        "3. Use this schema for all items:\n"
-        "{ \"category\": \"String\", \"confidence_score\": 0.9, \"needs_manual_review\": false, \n"
-        "  \"Country\": \"US\", \"Year\": \"Year\", \"Denomination\": \"Name\", \"Mint Mark\": \"Letter\", \n"
-        "  \"Quantity\": \"1\", \"Program/Series\": \"Name\", \"Theme/Subject\": \"Name\", \"Condition\": \"Grade\", \n"
-        "  \"Surface & Strike Quality\": \"Notes\", \"Grading Service\": \"Name\", \"Grading Cert #\": \"Num\", \n"
-        "  \"Cost\": \"$0.00\", \"Purchase Date\": \"Date\", \"Retailer/Website\": \"Name\", \"Retailer Invoice #\": \"String\", \n"
-        "  \"Retailer Item No.\": \"String\", \n"
-        "  \"Metal Content\": \"Composition\", \"Melt Value\": \"Pending\", \"Personal Notes\": \"Notes\", \n"
-        "  \"Personal Ref #\": \"Num\", \"AI Estimated Value\": \"Pending\", \"inventoryStatus\": \"UNCHECKED\", \"Storage Location\": \"\" }\n\n"
-        f"IMPORTANT: Use this dictionary to map slang to formal coin names: {json.dumps(COIN_DICTIONARY)}"
-    )
-    resp = chat.send_message([SYSTEM_PROMPT, f"Invoice Text: {doc.text}"])
-    
-    # 3. Parse JSON
-    clean_json = resp.text.replace("```json", "").replace("```", "").strip()
-    if clean_json.startswith("{"): clean_json = f"[{clean_json}]"
-    items = json.loads(clean_json)
-    return items
-
-def process_invoice_workflow(file_bytes, filename, user_email):
-    try:
-        # 1. Extract Data (Refactored)
-        items = extract_invoice_data(file_bytes)
-        
-        process_list = []
-        holding_list = []
-        review_queue_list = []
-        
-        # 4. Filter & Route
-        for item in items:
-            cat = item.get('category', 'US Coin')
-            item['id'] = str(uuid.uuid4())
-            item['source_file'] = filename # Link to GCS file
-            
-            if cat == 'US Coin':
-                conf = item.get('confidence_score', 0.0)
-                needs_review = item.get('needs_manual_review', True)
-                
-                if conf >= 0.85 and not needs_review:
-                    # High Confidence -> Main Collection
-                    for col in DISPLAY_ORDER:
-                        if col not in item: item[col] = ""
-                    process_list.append(item)
-                else:
-                    # Low Confidence -> Review Queue
-                    item['review_reason'] = f"Low Confidence ({conf})" if conf < 0.85 else "Flagged by AI"
-                    review_queue_list.append(item)
-
-            elif cat in ['Paper Currency', 'Foreign Currency']:
-                holding_list.append(item)
-
-        # 5. Batch Save
-        batch = db.batch()
-        
-        # A. Staging (Paper/Foreign)
-        if holding_list:
-            stage_ref = db.collection('staging_area')
-            for h_item in holding_list:
-                h_item['user_email'] = user_email
-                h_item['created_at'] = firestore.SERVER_TIMESTAMP
-                new_doc = stage_ref.document()
-                batch.set(new_doc, h_item)
-                
-        # B. Review Queue
-        if review_queue_list:
-            review_ref = db.collection('review_queue')
-            for r_item in review_queue_list:
-                r_item['user_email'] = user_email
-                r_item['created_at'] = firestore.SERVER_TIMESTAMP
-                new_doc = review_ref.document()
-                batch.set(new_doc, r_item)
-        
-        # C. Main Collection (High Confidence)
-        if process_list:
-             path = f"users/{user_email}/coins"
-             main_ref = db.collection(path)
-             for p_item in process_list:
-                 p_item['created_at'] = firestore.SERVER_TIMESTAMP
-                 # Ensure defaults
-                 if 'deep_dive_status' not in p_item: p_item['deep_dive_status'] = "PENDING"
-                 new_doc = main_ref.document(p_item['id'])
-                 batch.set(new_doc, p_item)
-
-        batch.commit()
-        return True, f"Imported {len(process_list)}, Review {len(review_queue_list)}, Staged {len(holding_list)}"
-
-    except Exception as e:
-        return False, str(e)
-
 def render_review_hub():
     st.info("👀 Review Hub: Correct items that the AI wasn't 100% sure about.")
     email = st.session_state.get('user_email')
@@ -1916,7 +1627,8 @@ def render_review_hub():
                 batch = db.batch()
                 count = 0
         
-        if count > 0: batch.commit()
+        stage_index_writes(batch, db, st.session_state.get('user_email'), edited_df)
+        batch.commit()
         
         st.balloons()
         st.success("Items Imported Successfully!")
@@ -1927,7 +1639,6 @@ def render_add_scan():
     st.info("🧾 Invoice Processor: Batch & Review")
     
     if 'scan_uploader_key' not in st.session_state: st.session_state['scan_uploader_key'] = 0
-    if 'batch_processing' not in st.session_state: st.session_state['batch_processing'] = False
     
     # TABS
     tab_single, tab_upload, tab_batch, tab_review = st.tabs(["📄 Single Scan", "📤 Bulk Upload", "⚙️ Batch Processor", "👀 Review Hub"])
@@ -1938,15 +1649,25 @@ def render_add_scan():
         inv_file = st.file_uploader("Upload One PDF", type=['pdf'], key=f"single_{st.session_state.scan_uploader_key}")
         
         if inv_file and st.button("Process & Preview"):
-            with st.spinner("Analyzing Document..."):
-                try:
-                    # 1. Extract
-                    items = extract_invoice_data(inv_file.getvalue())
-                    
-                    # 2. Filter Lists
-                    process_list = []
-                    holding_list = []
-                    
+            status_box = st.status("Analyzing Document...", expanded=True)
+            live_table = st.empty()
+            process_list = []
+            holding_list = []
+            stream_error = None
+            try:
+                file_bytes = inv_file.getvalue()
+                file_hash = content_hash(file_bytes)
+                prev = previous_import(db, file_hash, st.session_state.get('user_email'))
+                if prev:
+                    st.warning(f"⚠️ This exact file was already imported ({prev.get('filename')}, {prev.get('imported_at', '')[:10]}).")
+                st.session_state['upload_stage_file'] = (file_hash, inv_file.name)
+                st.session_state.pop('upload_stage_warning', None)  # a warning from an earlier partial scan is not this file's
+                key_index = load_index(db, st.session_state.get('user_email'))
+                preview_parts = []
+                
+                # 1. Extract (streamed - items are previewed as the model writes them)
+                for items in stream_invoice_data(file_bytes, model, user=st.session_state.get('user_email'), bucket=get_bucket()):
+                    new_coins = []
                     for item in items:
                         item['id'] = str(uuid.uuid4())
                         item['source_file'] = inv_file.name
@@ -1955,56 +1676,82 @@ def render_add_scan():
                         if cat == 'US Coin':
                             for col in DISPLAY_ORDER:
                                 if col not in item: item[col] = ""
-                            process_list.append(item)
+                            new_coins.append(item)
                         elif cat in ['Paper Currency', 'Foreign Currency']:
                             holding_list.append(item)
+                    process_list.extend(new_coins)
                     
-                    # 3. Save Staging Immediately
-                    if holding_list:
-                        batch = db.batch()
-                        stage_ref = db.collection('staging_area')
-                        for h_item in holding_list:
-                            h_item['user_email'] = st.session_state.get('user_email', 'unknown')
-                            h_item['created_at'] = firestore.SERVER_TIMESTAMP
-                            new_doc = stage_ref.document()
-                            batch.set(new_doc, h_item)
-                        batch.commit()
-                        st.session_state['holding_stage'] = holding_list
-                        
-                    # 4. Preview Main Items
-                    if process_list:
-                        new_df = pd.DataFrame(process_list)
-                        existing_df = load_collection(limit_n=None)
-                        new_df = normalize_coin_data(new_df)
-                        staged_df = identify_duplicates(new_df, existing_df)
-                        
-                        cols = ['Status'] + [c for c in staged_df.columns if c != 'Status']
-                        st.session_state['upload_stage'] = staged_df[cols]
-                        st.rerun()
-                    elif holding_list:
-                        st.warning("Only non-coin items found (saved to Staging).")
-                    else:
-                        st.error("No items found.")
-                        
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                    if new_coins:
+                        preview_parts.append(identify_duplicates(normalize_coin_data(pd.DataFrame(new_coins)), index=key_index))
+                        live_df = pd.concat(preview_parts, ignore_index=True)
+                        live_table.dataframe(live_df[['Status'] + [c for c in DISPLAY_ORDER if c in live_df.columns]], use_container_width=True, hide_index=True)
+                    status_box.update(label=f"Extracting... {len(process_list)} coins, {len(holding_list)} other items so far")
+            except Exception as e:
+                stream_error = e
+            
+            # Items parsed before a failure are kept
+            fill_header_fields(process_list + holding_list)
+            if stream_error:
+                status_box.update(label="Extraction stopped early", state="error")
+                if process_list or holding_list:
+                    st.session_state['upload_stage_warning'] = f"Extraction stopped early ({stream_error}). Showing the {len(process_list) + len(holding_list)} items extracted before the failure."
+                else:
+                    st.error(f"Error: {stream_error}")
+            else:
+                status_box.update(label=f"Extracted {len(process_list)} coins, {len(holding_list)} other items", state="complete")
+            
+            try:
+                # 2. Save Staging Immediately
+                if holding_list:
+                    batch = db.batch()
+                    stage_ref = db.collection('staging_area')
+                    for h_item in holding_list:
+                        h_item['user_email'] = st.session_state.get('user_email', 'unknown')
+                        h_item['created_at'] = firestore.SERVER_TIMESTAMP
+                        new_doc = stage_ref.document()
+                        batch.set(new_doc, h_item)
+                    batch.commit()
+                    st.session_state['holding_stage'] = holding_list
+                    
+                # 3. Preview Main Items (recomputed once header fields are filled in)
+                if process_list:
+                    new_df = pd.DataFrame(process_list)
+                    new_df = normalize_coin_data(new_df)
+                    staged_df = annotate_near_duplicates(identify_duplicates(new_df, index=key_index), index=key_index)
+                    
+                    cols = ['Status'] + [c for c in staged_df.columns if c != 'Status']
+                    set_upload_stage(staged_df[cols])
+                    st.rerun()
+                elif holding_list:
+                    st.warning("Only non-coin items found (saved to Staging).")
+                elif not stream_error:
+                    st.error("No items found.")
+                    
+            except Exception as e:
+                st.error(f"Error: {e}")
 
         # --- PREVIEW STAGE (REUSED FROM OLD LOGIC) ---
         if st.session_state.get('upload_stage') is not None:
              st.divider()
              st.subheader("Confirm & Import")
+             if st.session_state.get('upload_stage_warning'): st.warning(st.session_state['upload_stage_warning'])
              staged_df = st.session_state['upload_stage']
              
              # Show Editor
-             edited_df = st.data_editor(staged_df, num_rows="dynamic", use_container_width=True, key="single_editor")
+             edited_df = render_import_preview(staged_df, "single_editor")
              
              c1, c2 = st.columns(2)
              with c1:
                  if st.button("Cancel", key="cancel_single"):
                      st.session_state['upload_stage'] = None
+                     st.session_state.pop('upload_stage_warning', None)
                      st.rerun()
              with c2:
                  if st.button("Import All", type="primary", key="import_single"):
+                     stage_file = st.session_state.pop('upload_stage_file', None)
+                     # A partial extraction is not recorded as a full import of the file
+                     if stage_file and not st.session_state.pop('upload_stage_warning', None):
+                         mark_imported(db, stage_file[0], st.session_state.user_email, stage_file[1], f"Imported {len(edited_df)} (single scan)")
                      save_to_firestore(edited_df)
                      st.session_state['upload_stage'] = None
                      st.success("Import Complete!")
@@ -2027,7 +1774,7 @@ def render_add_scan():
                 errors = []
                 
                 for i, f in enumerate(files):
-                    ok, err = upload_to_gcs_queue(f)
+                    ok, err = upload_to_gcs_queue(f, st.session_state.user_email)
                     if ok:
                         success_count += 1
                     else:
@@ -2045,47 +1792,55 @@ def render_add_scan():
                     st.session_state.scan_uploader_key += 1
                     st.rerun()
 
+        render_upload_feed(st.session_state.user_email)
+
     # --- TAB 2: BATCH PROCESSOR ---
     with tab_batch:
-        queue = list_queue_files()
-        st.subheader(f"Batch Queue ({len(queue)} Files)")
+        # Work runs on a background worker pool (invoice_pipeline.BatchRun); this tab only starts it and polls status
+        run = get_batch(st.session_state.user_email)
+        snap = run.snapshot() if run else None
+        
+        if snap and snap['running']:
+            st.subheader(f"Batch Running ({snap['finished']}/{snap['total']} Files)")
+        else:
+            st.subheader("Batch Queue")
+            if INGEST_MODE != "manual":
+                st.caption("New uploads are processed automatically; use Start to drain files left in the queue (older uploads, retries).")
         
         c1, c2 = st.columns([1, 1])
         with c1:
-            if st.button("▶️ Start Batch Processing") or st.session_state.batch_processing:
-                st.session_state.batch_processing = True
-        with c2:
-            if st.button("⏹️ Stop"): st.session_state.batch_processing = False; st.rerun()
-
-        if st.session_state.batch_processing:
-            if not queue:
-                st.success("Queue Empty - Batch Complete!")
-                st.session_state.batch_processing = False
-                st.balloons()
+            if st.button("▶️ Start Batch Processing", disabled=bool(snap and snap['running'])):
+                run = start_batch(get_bucket(), db, model, st.session_state.user_email)
                 st.rerun()
-            
-            # PROCESS NEXT FILE
-            blob = queue[0]
-            st.info(f"Processing: {blob.name}...")
-            
-            try:
-                content = blob.download_as_bytes()
-                success, msg = process_invoice_workflow(content, blob.name, st.session_state.user_email)
-                
-                if success:
-                    st.success(f"Done: {msg}")
-                    # Move to processed
-                    move_blob(blob, f"invoices/processed/{blob.name.split('/')[-1]}")
-                else:
-                    st.error(f"Failed: {msg}")
-                    # Move to failed
-                    move_blob(blob, f"invoices/failed/{blob.name.split('/')[-1]}")
-                
-                time.sleep(1)
-                st.rerun() # LOOP
-            except Exception as e:
-                st.error(f"System Error: {e}")
-                st.session_state.batch_processing = False
+        with c2:
+            if st.button("⏹️ Stop", disabled=not (snap and snap['running'])):
+                run.stop(); st.rerun()
+
+        if snap:
+            st.progress(snap['finished'] / snap['total'] if snap['total'] else 1.0)
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Processed", snap['done'])
+            m2.metric("Failed / Retrying", f"{snap['failed']} / {snap['retrying']}")
+            m3.metric("Throughput", f"{snap['per_minute']}/min")
+            m4.metric("ETA", f"{int(snap['eta_s'] // 60)}m {int(snap['eta_s'] % 60)}s" if snap['eta_s'] else "—")
+            
+            if snap['files']:
+                status_df = pd.DataFrame(snap['files'])[['name', 'status', 'message']]
+                status_df['name'] = status_df['name'].str.split('/').str[-1]
+                st.dataframe(status_df, use_container_width=True, hide_index=True)
+            
+            if snap['running']:
+                if snap['stopping']: st.info("Stopping after in-flight invoices finish...")
+                time.sleep(2)
+                st.rerun() # Refresh status view only
+            elif snap['total']:
+                st.success(f"Batch Complete! {snap['done']} processed, {snap['failed']} failed in {snap['elapsed_s']}s.")
+            if snap['duplicates'] or snap['cache_hits'] or snap['text_layer']:
+                st.caption(f"Skipped {snap['duplicates']} already-imported files; {snap['cache_hits']} reused cached OCR/extraction; "
+                           f"{snap['text_layer']} digital PDFs read without OCR.")
+            if snap['tokens_before']:
+                saved = 1 - snap['tokens_after'] / snap['tokens_before']
+                st.caption(f"Pre-filter: ~{snap['tokens_before']:,} -> {snap['tokens_after']:,} prompt tokens ({saved:.0%} fewer).")
 
     # --- TAB 3: REVIEW HUB ---
     with tab_review:
@@ -2110,7 +1865,7 @@ else:
         # We should probably clear it from URL so refresh goes back?
         # For now, just set state.
         
-    nav_options = ["Home Dashboard", "My Collection", "Coin Programs", "Add New Coins", "Inventory", "My Wishlist", "Settings & Backup", "Our Team", "Customer Service"]
+    nav_options = ["Home Dashboard", "My Collection", "Coin Programs", "Add New Coins", "Inventory", "My Wishlist", "Metal Spot Prices", "Settings & Backup", "Our Team", "Customer Service"]
     
     default_ix = 0
     if page_param == "collection": default_ix = 1
@@ -2118,9 +1873,10 @@ else:
     elif page_param == "add": default_ix = 3
     elif page_param == "inventory": default_ix = 4
     elif page_param == "wishlist": default_ix = 5
-    elif page_param == "settings": default_ix = 6
-    elif page_param == "team": default_ix = 7
-    elif page_param == "support": default_ix = 8
+    elif page_param == "spot": default_ix = 6
+    elif page_param == "settings": default_ix = 7
+    elif page_param == "team": default_ix = 8
+    elif page_param == "support": default_ix = 9
     
     with st.sidebar:
         try:
@@ -2156,16 +1912,27 @@ else:
              st.session_state.user_email = None
              st.rerun()
 
-    # --- MARKET DATA (Hidden/Default for now if not on dashboard) ---
-    # We can move this to the dashboard or settings, for now set defaults if not visible
-    silver_p = 72.56
-    gold_p = 3100.00
+    # --- MARKET DATA ---
+    # Served from the spot-price TTL cache (provider configured via SPOT_PRICE_PROVIDER)
+    spot = get_spot_prices(db=db)
+    silver_p = spot['silver']
+    gold_p = spot['gold']
 
     # --- 2. HOME DASHBOARD ---
     if selection == 'Home Dashboard':
         st.markdown(f"<div style='text-align:center; background:#FFF8DC; color:#856404; padding:5px; border-radius:5px; font-weight:bold; margin-bottom:10px;'>🚧 BETA TESTING MODE 🚧</div>", unsafe_allow_html=True)
         
         df = load_collection(limit_n=None)
+        
+        # Incremental melt revaluation (precious coins only) when spot has moved
+        path = get_user_collection_path()
+        if path and not df.empty:
+            try:
+                n_revalued = revalue_if_spot_moved(db, path, df, spot)
+                if n_revalued: st.toast(f"Spot moved - Melt Value updated for {n_revalued} coins.", icon="🪙")
+            except Exception as e:
+                print(f"Melt Revaluation Error: {e}")
+        
         h1, h2 = st.columns([3, 1])
         with h1:
             st.markdown("""<div class="dash-title">DASHBOARD</div><div class="dash-subtitle">AI Powered Coin Collection Manager</div>""", unsafe_allow_html=True)
@@ -2224,10 +1991,12 @@ else:
         df['Cost_Clean'] = df['Cost'].apply(clean_money_string)
         total_cost = df['Cost_Clean'].sum()
         
-        m1, m2 = st.columns(2)
+        m1, m2, m3, m4 = st.columns(4)
         with m1: st.markdown(f"""<div class="metric-box"><div style="color:gray; font-size:14px;">Total Coins</div><div class="metric-value">{len(df)}</div></div>""", unsafe_allow_html=True)
         cost_fmt = "{:,.2f}".format(total_cost)
         with m2: st.markdown(f"""<div class="metric-box"><div style="color:gray; font-size:14px;">Acquisition Cost</div><div class="metric-value">${cost_fmt}</div></div>""", unsafe_allow_html=True)
+        with m3: st.markdown(f"""<div class="metric-box"><div style="color:gray; font-size:14px;">Silver Spot</div><div class="metric-value">${silver_p:,.2f}</div></div>""", unsafe_allow_html=True)
+        with m4: st.markdown(f"""<div class="metric-box"><div style="color:gray; font-size:14px;">Gold Spot</div><div class="metric-value">${gold_p:,.2f}</div></div>""", unsafe_allow_html=True)
             
         st.write(""); st.write("")
 
@@ -2774,9 +2543,41 @@ else:
             else:
                 st.success("🎉 No missing items found in tracked programs!")
 
-    elif selection == 'Metal spot prices':
+    elif selection == 'Metal Spot Prices':
         st.title("Metal Spot Prices")
-        st.markdown(f"<div class='coming-soon'>Feature Coming Soon</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='beta-tag'>MARKET DATA</div>", unsafe_allow_html=True)
+        st.caption(f"Source: {spot.get('source')} | As of: {spot.get('as_of')}")
+        
+        s1, s2, s3 = st.columns([1, 1, 1])
+        s1.metric("Silver (oz)", f"${silver_p:,.2f}")
+        s2.metric("Gold (oz)", f"${gold_p:,.2f}")
+        with s3:
+            if st.button("🔄 Refresh Spot", use_container_width=True):
+                get_spot_prices(db=db, force=True)
+                st.rerun()
+        
+        # --- DAILY HISTORY ---
+        st.divider()
+        st.subheader("Daily History")
+        history = load_spot_history(db, days=90)
+        if history:
+            hist_df = pd.DataFrame(history).set_index('date')
+            h1, h2 = st.columns(2)
+            with h1: st.line_chart(hist_df[['silver']])
+            with h2: st.line_chart(hist_df[['gold']])
+        else:
+            st.info("No spot history recorded yet.")
+        
+        # --- MANUAL REVALUATION ---
+        st.divider()
+        st.subheader("Melt Revaluation")
+        st.caption("Melt values are refreshed automatically for silver/gold coins when spot moves. Force a refresh here.")
+        path = get_user_collection_path()
+        if path and st.button("🪙 Revalue Melt Now", type="primary"):
+            df = load_collection(limit_n=None)
+            bar = st.progress(0)
+            n = revalue_if_spot_moved(db, path, df, spot, threshold=0, progress_cb=lambda done, total: bar.progress(done / max(total, 1)))
+            st.success(f"Melt Value updated for {n} coins.")
 
     elif selection == 'Settings & Backup':
         st.title("Settings & Backup")
@@ -2828,10 +2629,41 @@ else:
                         for w in wish:
                             ref = db.collection(w_path).document(w['id'])
                             batch.set(ref, w)
+                        mark_index_dirty(db, st.session_state.get('user_email'), batch=batch)
                         batch.commit()
                         st.success("Restore Complete!"); st.rerun()
                     except Exception as e: st.error(f"Restore Failed: {e}")
 
+        st.divider()
+        with st.expander("📚 Catalog Maintenance", expanded=False):
+            st.caption("Program histories are precomputed and shared by all users. Rebuild after the program catalog changes.")
+            force_hist = st.checkbox("Regenerate all (not only stale)", key="force_hist_rebuild")
+            if st.button("📚 Rebuild Program Histories", key="rebuild_histories"):
+                bar = st.progress(0)
+                n, total = build_program_histories(model, db=db, force=force_hist, progress_cb=lambda d, t: bar.progress(d / max(t, 1)))
+                st.success(f"Generated {n} of {total} program histories.")
+
+        st.divider()
+        with st.expander("🛠️ AI Usage & Latency (Debug)", expanded=False):
+            st.caption("Process-wide model usage per feature (since last restart).")
+            metrics = get_metrics_snapshot()
+            if metrics:
+                metric_cols = ['calls', 'errors', 'retries', 'parse_failures', 'parse_repairs', 'parse_failure_rate', 'input_tokens', 'output_tokens', 'cost_usd', 'avg_latency_s', 'p50_latency_s', 'p95_latency_s']
+                st.dataframe(pd.DataFrame(metrics).T[metric_cols], use_container_width=True)
+                st.download_button("📈 Download Metrics (Prometheus)", render_prometheus(), "llm_metrics.prom", "text/plain")
+            else:
+                st.info("No AI calls recorded yet.")
+            
+            st.caption("This Session")
+            recent = get_recent_calls(session=st.session_state.get('llm_session_id'))
+            if recent:
+                st.dataframe(pd.DataFrame(recent).drop(columns=['session']), use_container_width=True, hide_index=True)
+            else:
+                st.write("No AI calls in this session.")
+            
+            st.caption("GCP Clients (constructed once per process vs. requested)")
+            st.dataframe(pd.DataFrame(get_client_stats()).T, use_container_width=True)
+
         st.divider()
         st.subheader("Account Actions")
         if st.button("🚪 Log Out", key="logout_page"): logout()
@@ -0,0 +1,275 @@
+"""
+Duplicate detection for imports.
+Two keys per coin, built with vectorized string ops over whole columns:
+  ATTR  year|mint|denomination|condition|metal|strike (grading-sticker noise
+        stripped, a bare "Dollar" rewritten to Morgan / Peace by year)
+  INV   retailer invoice #|retailer item no. (only when both are present)
+A new row is a DUPLICATE when either key is already in the vault; matching is
+a hashed isin() against the existing key sets, taken either from a vault
+DataFrame or from the persistent key index (dedup_index.KeyIndex).
+
+Near duplicates ("MS63" vs "MS-63 CAC", "Lincoln Cent" vs "Penny", a missing
+mint mark) are found by find_near_duplicates(): candidates are blocked on
+year + canonical denomination (oversized blocks are split by grade), so only
+coins of the same issue are ever compared, and each candidate pair is scored
+on grade, mint, cert #, retailer, cost and purchase date. Pairs come back
+ranked with a 0-1 confidence and a short explanation.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from melt_calculator import DENOM_LOOKUP
+
+CONDITION_NOISE = ["CAC", "STICKER", "APPROVED", "CERTIFIED"]
+STRIKE_NOISE = ["CAC", "APPROVED", "CERTIFIED"]
+DOLLAR_ERAS = [(1878, 1921, "Morgan Silver Dollar"), (1922, 1935, "Peace Silver Dollar")]
+
+
+def _str(df, col):
+    """str(value) for every cell, exactly as str() renders it ('None', 'nan', '1921.0'); '' when the column is missing."""
+    if col not in df.columns: return pd.Series("", index=df.index, dtype=object)
+    values = df[col]
+    out = values.astype(str).astype(object)
+    missing = values.isna().to_numpy()
+    if missing.any():
+        out[missing] = [str(v) for v in values.to_numpy(dtype=object)[missing]]  # None / NaN / NaT keep their own spelling
+    return out
+
+def _per_value(col, fn):
+    # String ops run once per distinct value (years, grades, mints repeat heavily), then are broadcast back
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    return pd.Series(fn(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)[codes], index=col.index)
+
+def _strip_noise(col, words):
+    col = col.str.upper()
+    for w in words:
+        col = col.str.replace(w, "", regex=False)
+    return col.str.strip()
+
+def attr_keys(df):
+    y = _per_value(_str(df, 'Year'), lambda u: u.str.strip())
+    m = _per_value(_str(df, 'Mint Mark'), lambda u: u.str.strip().str.replace('None', '', regex=False).str.replace('nan', '', regex=False).str.lower())
+    d = _per_value(_str(df, 'Denomination'), lambda u: u.str.strip())
+    mt = _per_value(_str(df, 'Metal Content'), lambda u: u.str.strip().str.lower())
+    c = _per_value(_str(df, 'Condition'), lambda u: _strip_noise(u, CONDITION_NOISE).str.lower())
+    s = _per_value(_str(df, 'Surface & Strike Quality'), lambda u: _strip_noise(u, STRIKE_NOISE).str.lower())
+
+    # Aggressive Denomination Normalization: a bare "Dollar" is dated to its series
+    year = _per_value(y, lambda u: pd.to_numeric(u.where(u.str.fullmatch(r"[+-]?\d+")), errors="coerce")).astype(float)
+    dollar = d.str.lower().eq("dollar")
+    for start, end, name in DOLLAR_ERAS:
+        d = d.mask(dollar & year.between(start, end), name)
+
+    y = _per_value(y, lambda u: u.str.lower())
+    d = _per_value(d, lambda u: u.str.lower())
+    return (y + "|" + m + "|" + d + "|" + c + "|" + mt + "|" + s).astype(object)
+
+def inv_keys(df):
+    """invoice|item (lowercase), or None when either part is blank."""
+    inv = _per_value(_str(df, 'Retailer Invoice #'), lambda u: u.str.strip().str.lower())
+    item = _per_value(_str(df, 'Retailer Item No.'), lambda u: u.str.strip().str.lower())
+    ok = inv.ne("") & item.ne("") & inv.ne("nan") & item.ne("nan")
+    return (inv + "|" + item).astype(object).where(ok, None)
+
+def identify_duplicates(new_df, existing_df=None, index=None):
+    # No index and no existing_df means an empty vault
+    if (existing_df is None or existing_df.empty) if index is None else index.empty:
+        new_df['Status'] = 'NEW'
+        new_df['Duplicate Check Key'] = 'No Existing Data'
+        return new_df
+
+    k_attr = attr_keys(new_df)
+    k_inv = inv_keys(new_df)
+    if index is not None:
+        is_dupe_attr, is_dupe_inv = index.matches(k_attr, k_inv)
+        is_dupe_inv = k_inv.notna() & is_dupe_inv
+    else:
+        is_dupe_attr = k_attr.isin(attr_keys(existing_df).unique())
+        is_dupe_inv = k_inv.notna() & k_inv.isin(inv_keys(existing_df).dropna().unique())
+
+    # HYBRID CHECK: If EITHER matches, it's a duplicate
+    new_df['Status'] = np.where(is_dupe_attr | is_dupe_inv, 'DUPLICATE', 'NEW')
+
+    # Debug String
+    debug = "ATTR: " + k_attr + (" || INV: " + k_inv).fillna("")
+    debug = debug + np.where(is_dupe_inv, " [MATCH: INV]", np.where(is_dupe_attr, " [MATCH: ATTR]", ""))
+    new_df['Duplicate Check Key'] = debug
+    return new_df
+
+
+# --- NEAR DUPLICATES ---
+NEAR_FIELDS = ["grade", "mint", "cert", "retailer", "cost", "date"]
+NEAR_WEIGHTS = {"grade": 3.0, "mint": 1.5, "retailer": 1.0, "cost": 1.0, "date": 1.0}
+EVIDENCE_FLOOR = 6.5       # below this much comparable evidence, confidence is held back
+NEAR_MIN_CONFIDENCE = 0.6  # pairs below this are not reported
+NEAR_LIKELY = 0.85         # "likely duplicate" (batch imports send these to review)
+BLOCK_PAIR_LIMIT = 50000   # larger year/denomination blocks are split by grade number
+GRADE_RE = r"(MS|PR|PF|SP|AU|XF|EF|VF|VG|AG|FR|F|G)?\s*-?\s*(\d{1,2})(?!\d)"
+GRADE_PREFIX = {"PF": "PR", "EF": "XF"}
+
+
+def _text(df, col, fn=lambda u: u):
+    # Stripped text with None / NaN / 'nan' / 'none' as ""
+    def clean(u):
+        u = u.str.strip()
+        return fn(u.where(~u.str.lower().isin(["none", "nan", "nat", "n/a"]), ""))
+    return _per_value(_str(df, col), clean)
+
+def _canonical_denomination(u):
+    key = u.str.lower().str.replace(r"\s+", " ", regex=True)
+    plain = key.str.replace(r"\b(silver|coin)\b", "", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    return key.map(DENOM_LOOKUP).fillna(plain.map(DENOM_LOOKUP)).fillna(key).str.lower()
+
+def block_keys(df):
+    """'year|canonical denomination' per row, or None when either is unknown."""
+    year = _text(df, 'Year', lambda u: u.str.extract(r"(\d{4})", expand=False).fillna(""))
+    denom = _text(df, 'Denomination', _canonical_denomination)
+    return (year + "|" + denom).astype(object).where(year.ne("") & denom.ne(""), None)
+
+def block_digest(keys):
+    return _per_value(keys.fillna(""), lambda u: u.map(lambda k: hashlib.sha1(k.encode("utf-8")).hexdigest()[:12] if k else ""))
+
+def near_fields(df):
+    """The normalized fields near-duplicate scoring compares ("" when missing)."""
+    money = lambda u: pd.to_numeric(u.str.replace(r"[$,\s]", "", regex=True), errors="coerce").map(lambda v: f"{v:.2f}" if v == v else "")
+    def dates(u):
+        parsed = pd.to_datetime(u.where(u.ne("")), errors="coerce", format="mixed")
+        return parsed.dt.strftime("%Y-%m-%d").fillna("")
+    return pd.DataFrame({
+        "grade": _text(df, 'Condition', lambda u: _strip_noise(u, CONDITION_NOISE)),
+        "mint": _text(df, 'Mint Mark', lambda u: u.str.upper().str.replace(r"[^A-Z]", "", regex=True)),
+        "cert": _text(df, 'Grading Cert #', lambda u: u.str.replace(r"\D", "", regex=True)),
+        "retailer": _text(df, 'Retailer/Website', lambda u: u.str.lower().str.replace(r"^(https?://)?(www\.)?|\.(com|net)\b|[^a-z0-9]", "", regex=True)),
+        "cost": _text(df, 'Cost', money),
+        "date": _text(df, 'Purchase Date', dates),
+    }, index=df.index).apply(lambda col: col.str.replace("|", "", regex=False))
+
+def near_records(df):
+    """near_fields packed into one 'grade|mint|cert|retailer|cost|date' string per row (key index storage)."""
+    f = near_fields(df)
+    out = f[NEAR_FIELDS[0]]
+    for col in NEAR_FIELDS[1:]:
+        out = out + "|" + f[col]
+    return out.astype(object)
+
+def _features(fields):
+    g = fields["grade"].str.extract(GRADE_RE)
+    return pd.DataFrame({
+        "grade": fields["grade"].to_numpy(),
+        "gpre": g[0].fillna("").replace(GRADE_PREFIX).to_numpy(),
+        "gnum": pd.to_numeric(g[1], errors="coerce").to_numpy(),
+        "mint": fields["mint"].to_numpy(),
+        "cert": fields["cert"].to_numpy(),
+        "retailer": fields["retailer"].to_numpy(),
+        "cost": pd.to_numeric(fields["cost"], errors="coerce").to_numpy(),
+        "date": pd.to_datetime(fields["date"].where(fields["date"].ne("")), errors="coerce").to_numpy(),
+    })
+
+def _field_scores(p):
+    """Per-field similarity (1 match, 0 mismatch, partial in between, NaN = nothing to compare)."""
+    g_ok = p.l_gnum.notna() & p.r_gnum.notna()
+    same_pre = p.l_gpre.eq(p.r_gpre) | p.l_gpre.eq("") | p.r_gpre.eq("")
+    diff = (p.l_gnum - p.r_gnum).abs()
+    grade = np.select([g_ok & diff.eq(0) & same_pre, g_ok & diff.eq(0), g_ok & diff.le(2) & same_pre, g_ok],
+                      [1.0, 0.3, 0.5, 0.0], np.nan)
+    text_ok = ~g_ok & p.l_grade.ne("") & p.r_grade.ne("")  # "Proof", "BU" ...
+    grade = np.where(text_ok, p.l_grade.eq(p.r_grade).astype(float), grade)
+
+    l_m, r_m = p.l_mint.ne(""), p.r_mint.ne("")
+    mint = np.select([l_m & r_m, l_m | r_m], [p.l_mint.eq(p.r_mint).astype(float), 0.5], np.nan)
+    both_r = p.l_retailer.ne("") & p.r_retailer.ne("")
+    retailer = np.where(both_r, p.l_retailer.eq(p.r_retailer).astype(float), np.nan)
+
+    rel = (p.l_cost - p.r_cost).abs() / p[["l_cost", "r_cost"]].max(axis=1).where(lambda v: v > 0)
+    cost = np.select([rel.le(0.02), rel.le(0.10), rel.notna()], [1.0, 0.5, 0.0], np.nan)
+    days = (p.l_date - p.r_date).abs().dt.days
+    date = np.select([days.eq(0), days.le(7), days.notna()], [1.0, 0.5, 0.0], np.nan)
+    return pd.DataFrame({"grade": grade, "mint": mint, "retailer": retailer, "cost": cost, "date": date}, index=p.index)
+
+def _explain(scores, cert):
+    parts = {}
+    for label, mask in (("match", scores.eq(1.0)), ("close", scores.gt(0) & scores.lt(1)), ("differ", scores.eq(0.0))):
+        names = pd.Series("", index=scores.index, dtype=object)
+        for col in scores.columns:
+            names = names + np.where(mask[col], col + ", ", "")
+        parts[label] = names.str.rstrip(", ")
+    cert_txt = np.select([cert.eq(1), cert.eq(0)], ["same cert #; ", "different cert #; "], "")
+    out = cert_txt + np.where(parts["match"].ne(""), parts["match"] + " match", "")
+    out = out + np.where(parts["close"].ne(""), "; " + parts["close"] + " close", "")
+    out = out + np.where(parts["differ"].ne(""), "; " + parts["differ"] + " differ", "")
+    return pd.Series(out, index=scores.index).str.strip("; ")
+
+def _candidates(left, right):
+    """Pairs sharing a block; blocks that would exceed BLOCK_PAIR_LIMIT pairs are split by grade number."""
+    sizes = left["block"].value_counts().mul(right["block"].value_counts(), fill_value=0)
+    big = set(sizes[sizes > BLOCK_PAIR_LIMIT].index)
+    if big:
+        for side in (left, right):
+            split = side["block"].isin(big)
+            side.loc[split, "block"] = side.loc[split, "block"] + "|" + side.loc[split, "gnum"].map(lambda v: "?" if v != v else str(int(v)))
+    return left.merge(right, on="block", suffixes=("", "_r"))
+
+def find_near_duplicates(new_df, existing_df=None, index=None, min_confidence=NEAR_MIN_CONFIDENCE, top_k=3):
+    """
+    Ranked likely-duplicate pairs between new_df rows and vault coins (an
+    existing_df with an 'id' column, or the block records of a KeyIndex):
+    DataFrame [row, match_id, confidence, explanation], best first, at most
+    top_k per row.
+    """
+    columns = ["row", "match_id", "confidence", "explanation"]
+    if new_df is None or new_df.empty: return pd.DataFrame(columns=columns)
+    blocks = block_keys(new_df)
+    left = _features(near_fields(new_df)).assign(block=block_digest(blocks).to_numpy(), row=new_df.index.to_numpy(),
+                                                 own_id=_str(new_df, 'id').to_numpy())
+    left = left[blocks.notna().to_numpy()].copy()
+    if left.empty: return pd.DataFrame(columns=columns)
+
+    if index is not None:
+        recs = [(b, cid, rec) for b in left["block"].unique() for cid, rec in index.blocks.get(b, {}).items()]
+        if not recs: return pd.DataFrame(columns=columns)
+        rb, rid, rrec = zip(*recs)
+        fields = pd.Series(rrec, dtype=object).str.split("|", expand=True, regex=False).reindex(columns=range(len(NEAR_FIELDS))).fillna("")
+        fields.columns = NEAR_FIELDS
+        right = _features(fields).assign(block=list(rb), match_id=list(rid))
+    else:
+        if existing_df is None or existing_df.empty: return pd.DataFrame(columns=columns)
+        eb = block_keys(existing_df)
+        right = _features(near_fields(existing_df)).assign(block=block_digest(eb).to_numpy(), match_id=_str(existing_df, 'id').to_numpy())
+        right = right[eb.notna().to_numpy()].copy()
+
+    pairs = _candidates(left, right.rename(columns=lambda c: c if c in ("block", "match_id") else f"r_{c}"))
+    pairs = pairs[pairs["own_id"] != pairs["match_id"]]  # a re-saved coin is not its own duplicate
+    if pairs.empty: return pd.DataFrame(columns=columns)
+    pairs = pairs.rename(columns={c: f"l_{c}" for c in ["grade", "gpre", "gnum", "mint", "cert", "retailer", "cost", "date"]})
+    pairs = pairs.reset_index(drop=True)
+
+    scores = _field_scores(pairs)
+    weights = pd.Series(NEAR_WEIGHTS)
+    have = scores.notna().mul(weights, axis=1).sum(axis=1)
+    got = scores.fillna(0).mul(weights, axis=1).sum(axis=1)
+    conf = 0.35 + 0.65 * got / np.maximum(have, EVIDENCE_FLOOR)
+    # Cert numbers are decisive either way
+    cert_ok = pairs.l_cert.ne("") & pairs.r_cert.ne("")
+    cert = pd.Series(np.where(cert_ok, pairs.l_cert.eq(pairs.r_cert).astype(float), np.nan), index=pairs.index)
+    conf = np.where(cert.eq(1), np.maximum(conf, 0.98), np.where(cert.eq(0), np.minimum(conf, 0.15), conf))
+
+    out = pd.DataFrame({"row": pairs["row"], "match_id": pairs["match_id"], "confidence": np.round(conf, 2)})
+    out = out[out["confidence"] >= min_confidence]
+    if out.empty: return pd.DataFrame(columns=columns)
+    out["explanation"] = _explain(scores.loc[out.index], cert.loc[out.index])
+    out = out.sort_values("confidence", ascending=False, kind="stable")
+    return out.groupby("row", sort=False).head(top_k).reset_index(drop=True)[columns]
+
+def annotate_near_duplicates(staged_df, existing_df=None, index=None):
+    """Adds 'Near Duplicate' (best match, e.g. "87%: grade, mint match; cost differ") and 'Near Confidence' to rows not already exact DUPLICATEs."""
+    staged_df['Near Confidence'] = np.nan
+    staged_df['Near Duplicate'] = ""
+    todo = staged_df if 'Status' not in staged_df.columns else staged_df[staged_df['Status'] != 'DUPLICATE']
+    best = find_near_duplicates(todo, existing_df=existing_df, index=index, top_k=1)
+    if best.empty: return staged_df
+    best = best.set_index("row")
+    staged_df.loc[best.index, 'Near Confidence'] = best["confidence"]
+    staged_df.loc[best.index, 'Near Duplicate'] = (best["confidence"].map(lambda c: f"{c:.0%}") + ": " + best["explanation"]).to_numpy()
+    return staged_df
@@ -0,0 +1,62 @@
+"""
+Vectorized clean-up of imported coin rows (Excel, manual, invoice scans).
+Denomination / Metal Content go through the lowercase alias maps compiled
+once in melt_calculator, Purchase Date is parsed in one to_datetime call,
+and placeholder text ("N/A", "blank", ...) is blanked with string ops.
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from melt_calculator import DENOM_LOOKUP, METAL_LOOKUP
+
+PLACEHOLDERS = ['n/a', 'blank', 'nan', 'none']
+TEXT_COLS = ['Theme/Subject', 'Program/Series', 'Mint Mark']
+EMPTY_DATES = ['nan', 'nat', 'none', '']
+
+
+def _keys(col):
+    # Lowercased, stripped text; None / NaN stay missing
+    return col.astype(str).str.strip().str.lower()
+
+def canonicalize(col, lookup):
+    """Canonical name for known aliases; everything else (incl. blanks) is kept as-is."""
+    canon = _keys(col).map(lookup)
+    hit = canon.notna() & col.notna() & col.astype(bool)
+    return col.where(~hit, canon).astype(object)
+
+def clean_dates(col, today=None):
+    """'%Y-%m-%d' strings; blank or unparseable dates become today."""
+    today = today or datetime.today().strftime('%Y-%m-%d')
+    col = col.astype(object)
+    # Each distinct value is checked and parsed once ("mixed": every cell may use its own format)
+    uniq = pd.Series(col.dropna().unique(), dtype=object)
+    uniq = uniq[~_keys(uniq).isin(EMPTY_DATES) & uniq.astype(bool)]
+    try:
+        parsed = pd.to_datetime(uniq, errors="coerce", format="mixed")
+    except (TypeError, ValueError):  # e.g. mixed UTC offsets
+        parsed = pd.Series([pd.to_datetime(v, errors="coerce") for v in uniq], dtype=object)
+        parsed = pd.to_datetime(parsed.map(lambda v: v.tz_localize(None) if getattr(v, "tzinfo", None) else v), errors="coerce")
+    lookup = dict(zip(uniq, parsed.dt.strftime('%Y-%m-%d')))
+    return col.map(lookup).fillna(today).astype(object)
+
+def normalize_coin_data(df):
+    if df.empty: return df
+
+    # 1. Normalize Denomination & Metal
+    if 'Denomination' in df.columns:
+        df['Denomination'] = canonicalize(df['Denomination'], DENOM_LOOKUP)
+    if 'Metal Content' in df.columns:
+        df['Metal Content'] = canonicalize(df['Metal Content'], METAL_LOOKUP)
+
+    # 2. Date Cleanup (Purchase Date)
+    if 'Purchase Date' in df.columns:
+        df['Purchase Date'] = clean_dates(df['Purchase Date'])
+
+    # 3. Text Cleanup (Theme, etc) - N/A or Blank -> ""
+    for col in TEXT_COLS:
+        if col in df.columns:
+            placeholder = df[col].isna() | _keys(df[col]).isin(PLACEHOLDERS).fillna(False)
+            df[col] = df[col].astype(object).where(~placeholder, "")
+
+    return df
@@ -0,0 +1,37 @@
+"""
+US Mint program catalog (checklists for the Program Manager).
+Kept free of Streamlit / GCP imports so offline jobs can load it.
+"""
+
+US_PROGRAMS = {
+    "Circulating Coin Programs": [
+        {"id": "bicentennial", "name": "Bicentennial Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/bicentennial-coins", "years": "1976", "coins": ["Quarter", "Half Dollar", "Dollar"]},
+        {"id": "50state", "name": "50 State Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/50-state-quarters", "years": "1999-2008", "coins": ['Delaware', 'Pennsylvania', 'New Jersey', 'Georgia', 'Connecticut', 'Massachusetts', 'Maryland', 'South Carolina', 'New Hampshire', 'Virginia', 'New York', 'North Carolina', 'Rhode Island', 'Vermont', 'Kentucky', 'Tennessee', 'Ohio', 'Louisiana', 'Indiana', 'Mississippi', 'Illinois', 'Alabama', 'Maine', 'Missouri', 'Arkansas', 'Michigan', 'Florida', 'Texas', 'Iowa', 'Wisconsin', 'California', 'Minnesota', 'Oregon', 'Kansas', 'West Virginia', 'Nevada', 'Nebraska', 'Colorado', 'North Dakota', 'South Dakota', 'Montana', 'Washington', 'Idaho', 'Wyoming', 'Utah', 'Oklahoma', 'New Mexico', 'Arizona', 'Alaska', 'Hawaii']},
+        {"id": "dc_territories", "name": "District of Columbia and U.S. Territories Quarters", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/dc-and-us-territories", "years": "2009", "coins": ["District of Columbia", "Puerto Rico", "Guam", "American Samoa", "U.S. Virgin Islands", "Northern Mariana Islands"]},
+        {"id": "westward", "name": "Westward Journey Nickel Series", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/westward-journey-nickel-series", "years": "2004-2005", "coins": ["Peace Medal", "Keelboat", "American Bison", "Ocean in View"]},
+        {"id": "lincoln", "name": "Lincoln Bicentennial One-Cent Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/lincoln-bicentennial-one-cent", "years": "2009", "coins": ["Birth and Early Childhood", "Formative Years", "Professional Life", "Presidency"]},
+        {"id": "sba", "name": "Susan B. Anthony Dollar", "url": "https://www.usmint.gov/coins/coin-medal-programs/circulating-coins/susan-b-anthony-dollar", "years": "1979-1981, 1999", "coins": ["1979-P", "1979-D", "1979-S", "1980-P", "1980-D", "1980-S", "1981-P", "1981-D", "1981-S", "1999-P", "1999-D"]},
+        {"id": "sacagawea", "name": "Sacagawea Golden Dollar", "url": "https://www.usmint.gov/coins/coin-medal-programs/sacagawea-golden-dollar", "years": "2000-2008", "coins": ["2000-P", "2000-D", "2000-S", "2001-P", "2001-D", "2001-S", "2002-P", "2002-D", "2002-S", "2003-P", "2003-D", "2003-S", "2004-P", "2004-D", "2004-S", "2005-P", "2005-D", "2005-S", "2006-P", "2006-D", "2006-S", "2007-P", "2007-D", "2007-S", "2008-P", "2008-D", "2008-S"]},
+        {"id": "atb", "name": "America the Beautiful Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/america-the-beautiful-quarters", "years": "2010-2021", "coins": ["Hot Springs", "Yellowstone", "Yosemite", "Grand Canyon", "Mount Hood", "Gettysburg", "Glacier", "Olympic", "Vicksburg", "Chickasaw", "El Yunque", "Chaco Culture", "Acadia", "Hawaii Volcanoes", "Denali", "White Mountain", "Perry's Victory", "Great Basin", "Fort McHenry", "Mount Rushmore", "Great Smoky Mountains", "Shenandoah", "Arches", "Great Sand Dunes", "Everglades", "Homestead", "Kisatchie", "Blue Ridge Parkway", "Bombay Hook", "Saratoga", "Shawnee", "Cumberland Gap", "Harpers Ferry", "Theodore Roosevelt", "Fort Moultrie", "Effigy Mounds", "Frederick Douglass", "Ozark", "Ellis Island", "George Rogers Clark", "Pictured Rocks", "Apostle Islands", "Voyageurs", "Cumberland Island", "Block Island", "Lowell", "American Memorial", "War in the Pacific", "San Antonio Missions", "Frank Church River of No Return", "National Park of American Samoa", "Weir Farm", "Salt River Bay", "Marsh-Billings-Rockefeller", "Tallgrass Prairie", "Tuskegee Airmen"]},
+        {"id": "presidential", "name": "Presidential $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/presidential-dollar-coin", "years": "2007-2016, 2020", "coins": ["Washington", "Adams", "Jefferson", "Madison", "Monroe", "J.Q. Adams", "Jackson", "Van Buren", "Harrison", "Tyler", "Polk", "Taylor", "Fillmore", "Pierce", "Buchanan", "Lincoln", "Johnson", "Grant", "Hayes", "Garfield", "Arthur", "Cleveland (1st)", "Harrison", "Cleveland (2nd)", "McKinley", "Roosevelt", "Taft", "Wilson", "Harding", "Coolidge", "Hoover", "F.D. Roosevelt", "Truman", "Eisenhower", "Kennedy", "Johnson", "Nixon", "Ford", "Reagan", "G.H.W. Bush"]},
+        {"id": "native", "name": "Native American $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/native-american-dollar-coins", "years": "2009-Present", "coins": ["Three Sisters (2009)", "Great Tree of Peace (2010)", "Wampanoag Treaty (2011)", "Trade Routes (2012)", "Delaware Treaty (2013)", "Native Hospitality (2014)", "Mohawk Ironworkers (2015)", "Code Talkers (2016)", "Sequoyah (2017)", "Jim Thorpe (2018)", "Space Program (2019)", "Elizabeth Peratrovich (2020)", "Military Service (2021)", "Ely S. Parker (2022)", "Maria Tallchief (2023)", "Indian Citizenship Act (2024)", "Northeast Tech (2025)"]},
+        {"id": "innovation", "name": "American Innovation $1 Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-innovation-dollar-coins", "years": "2018-2032", "coins": ['Intro Coin', 'Delaware', 'Pennsylvania', 'New Jersey', 'Georgia', 'Connecticut', 'Massachusetts', 'Maryland', 'South Carolina', 'New Hampshire', 'Virginia', 'New York', 'North Carolina', 'Rhode Island', 'Vermont', 'Kentucky', 'Tennessee', 'Ohio', 'Louisiana', 'Indiana', 'Mississippi', 'Illinois', 'Alabama', 'Maine', 'Missouri', 'Arkansas', 'Michigan', 'Florida', 'Texas', 'Iowa', 'Wisconsin', 'California', 'Minnesota', 'Oregon', 'Kansas', 'West Virginia', 'Nevada', 'Nebraska', 'Colorado', 'North Dakota', 'South Dakota', 'Montana', 'Washington', 'Idaho', 'Wyoming', 'Utah', 'Oklahoma', 'New Mexico', 'Arizona', 'Alaska', 'Hawaii']},
+        {"id": "women", "name": "American Women Quarters Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-women-quarters", "years": "2022-2025", "coins": ['Maya Angelou', 'Dr. Sally Ride', 'Wilma Mankiller', 'Adelina Otero-Warren', 'Anna May Wong', 'Bessie Coleman', 'Edith Kanakaʻole', 'Eleanor Roosevelt', 'Jovita Idar', 'Maria Tallchief', 'Rev. Dr. Pauli Murray', 'Patsy Takemoto Mink', 'Dr. Mary Edwards Walker', 'Celia Cruz', 'Zitkala-Ša']},
+        {"id": "semiquin", "name": "2026 Semiquincentennial Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/semiquincentennial-coins", "years": "2026", "coins": ["Mayflower Compact Quarter (Pending)", "Revolutionary War Quarter (Pending)", "Declaration of Independence Quarter (Pending)", "U.S. Constitution Quarter (Pending)", "Gettysburg Address Quarter (Pending)"]}
+    ],
+    "Bullion and Investment Programs": [
+        {"id": "ase", "name": "American Eagle Silver Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-silver-bullion-coins", "years": "1986-Present", "coins": ["Type 1 (1986-2021)", "Type 2 (2021-Present)"]},
+        {"id": "age", "name": "American Eagle Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-gold-bullion-coins", "years": "1986-Present", "coins": ["Type 1 (1986-2021)", "Type 2 (2021-Present)"]},
+        {"id": "ape", "name": "American Eagle Platinum Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-platinum-bullion-coins", "years": "1997-Present", "coins": ["Proof Series", "Uncirculated Series", "Bullion"]},
+        {"id": "apall", "name": "American Eagle Palladium Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-eagle-palladium-bullion-coins", "years": "2017-Present", "coins": ["Bullion", "Proof", "Reverse Proof", "Uncirculated"]},
+        {"id": "buffalo", "name": "American Buffalo Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-buffalo-coin", "years": "2006-Present", "coins": ["Bullion (1oz)", "Proof (1oz)", "Fractional (2008 Only)"]},
+        {"id": "liberty", "name": "American Liberty High Relief Gold and Silver Medal Series", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/american-liberty-high-relief-gold-coins", "years": "2015-Present", "coins": ["2015 High Relief Gold", "2016 Silver Medal", "2017 Gold Coin", "2018 Gold Coin", "2019 High Relief Gold", "2019 Silver Medal", "2021 High Relief Gold", "2022 Silver Medal", "2023 High Relief Gold", "2024 Silver Medal"]},
+        {"id": "spouse", "name": "First Spouse Gold Coin Program", "url": "https://www.usmint.gov/learn/coin-and-medal-programs/first-spouse-gold-coins", "years": "2007-2016, 2020", "coins": ["Martha Washington", "Abigail Adams", "Jefferson's Liberty", "Dolley Madison", "Elizabeth Monroe", "Louisa Adams", "Jackson's Liberty", "Van Buren's Liberty", "Anna Harrison", "Letitia Tyler", "Julia Tyler", "Sarah Polk", "Margaret Taylor", "Abigail Fillmore", "Jane Pierce", "Buchanan's Liberty", "Mary Todd Lincoln", "Eliza Johnson", "Julia Grant", "Lucy Hayes", "Lucretia Garfield", "Alice Paul", "Frances Cleveland (1st)", "Caroline Harrison", "Frances Cleveland (2nd)", "Ida McKinley", "Edith Roosevelt", "Helen Taft", "Ellen Wilson", "Edith Wilson", "Florence Harding", "Grace Coolidge", "Lou Hoover", "Eleanor Roosevelt", "Bess Truman", "Mamie Eisenhower", "Jacqueline Kennedy", "Lady Bird Johnson", "Pat Nixon", "Betty Ford", "Nancy Reagan", "Barbara Bush"]},
+        {"id": "dc_comics", "name": "DC Comics Bullion Series", "url": "https://catalog.usmint.gov/", "years": "2025-2027", "coins": ["Superman (2025 Pending)", "Batman (2025 Pending)", "Wonder Woman (2025 Pending)", "2026 Release 1 (Pending)", "2026 Release 2 (Pending)", "2026 Release 3 (Pending)", "2027 Release 1 (Pending)", "2027 Release 2 (Pending)", "2027 Release 3 (Pending)"]}
+    ],
+    "Upcoming Officially Announced Programs": [
+        {"id": "fifa", "name": "2026 FIFA World Cup Commemorative Coin Program", "url": "https://www.usmint.gov/", "years": "2026", "coins": ["$5 Gold Coin (Pending)", "$1 Silver Coin (Pending)", "Half Dollar Clad (Pending)"]},
+        {"id": "youth_post_2026", "name": "Youth and Paralympic Sports Quarters and Half Dollars", "url": "https://www.usmint.gov/news/press-releases", "years": "Post-2026", "coins": ["Youth Sports Quarter 1 (Pending)", "Youth Sports Quarter 2 (Pending)", "Youth Sports Quarter 3 (Pending)", "Youth Sports Quarter 4 (Pending)", "Youth Sports Quarter 5 (Pending)", "Paralympic Half Dollar (Pending)"]},
+        {"id": "youth_2027", "name": "2027 Youth and Paralympic Sports Program", "url": "https://www.usmint.gov/news/press-releases", "years": "2027", "coins": ["2027 Quarter 1 (Pending)", "2027 Quarter 2 (Pending)", "2027 Quarter 3 (Pending)", "2027 Quarter 4 (Pending)", "2027 Quarter 5 (Pending)", "2027 Half Dollar (Pending)"]}
+    ]
+}
@@ -0,0 +1,95 @@
+"""
+Canonical coin reference data shared by the app and the offline helpers.
+Kept free of Streamlit / GCP imports so it can be loaded anywhere.
+"""
+
+TROY_OZ_GRAMS = 31.1034768
+
+# Column order of a vault coin record (UI tables, imports, invoice routing)
+DISPLAY_ORDER = [
+    "Country", "Year", "Mint Mark", "Denomination", "Quantity", 
+    "Program/Series", "Theme/Subject", "Condition", "Surface & Strike Quality", 
+    "Grading Service", "Grading Cert #", "Cost", "Purchase Date", 
+    "Retailer/Website", "Retailer Invoice #", "Retailer Item No.", "Metal Content", "Melt Value", "Personal Notes", 
+    "Personal Ref #", "AI Estimated Value", "Storage Location"
+]
+
+COIN_STANDARDS = {
+    "denominations": {
+        "Penny": ["1c", "Cent", "One Cent", "Lincoln Cent", "Indian Head Cent"],
+        "Nickel": ["5c", "Five Cents", "Half Dime", "V Nickel", "Buffalo Nickel", "Jefferson Nickel"],
+        "Dime": ["10c", "Ten Cents", "Mercury Dime", "Roosevelt Dime"],
+        "Quarter": ["25c", "Quarter Dollar", "Washington Quarter", "State Quarter"],
+        "Half Dollar": ["50c", "Fifty Cents", "Kennedy Half", "Franklin Half", "Walking Liberty"],
+        "Dollar": ["$1", "Silver Dollar", "Morgan Dollar", "Peace Dollar", "Eisenhower Dollar", "SBA Dollar", "Sacagawea"],
+        "Silver Eagle": ["American Silver Eagle", "ASE", "Silver American Eagle"],
+        "Gold Eagle": ["American Gold Eagle", "AGE", "Gold American Eagle"],
+        "Gold Buffalo": ["American Gold Buffalo", "American Buffalo Gold"],
+        "Quarter Eagle": ["$2.5", "$2.50 Gold", "$2 1/2 Gold"],
+        "Half Eagle": ["$5 Gold", "Five Dollar Gold"],
+        "Eagle": ["$10 Gold", "Ten Dollar Gold"],
+        "Double Eagle": ["$20 Gold", "Twenty Dollar Gold", "Saint-Gaudens Double Eagle", "Liberty Double Eagle"]
+    },
+    "metals": {
+        "90% Silver": ["90% Silver, 10% Copper", "Fine Silver", "Silver Clad (.900)"],
+        "40% Silver": ["40% Silver Clad", "Silver Clad (.400)"],
+        "35% Silver": ["35% Silver, 56% Copper, 9% Manganese"],
+        "Cupro-Nickel": ["Copper-Nickel", "75% Copper, 25% Nickel", "Nickel Clad", "Clad"],
+        "Copper-plated Zinc": ["97.5% Zinc, 2.5% Copper", "Zinc"],
+        "Manganese-Brass": ["Golden Dollar Metal", "88.5% Cu, 6% Zn, 3.5% Mn, 2% Ni"],
+        "Gold": ["90% Gold", "Gold (.900)"]
+    }
+}
+
+# Precious metal (or "base") of each canonical Metal Content
+METAL_FAMILIES = {
+    "90% Silver": "silver", "40% Silver": "silver", "35% Silver": "silver", "Gold": "gold",
+    "Cupro-Nickel": "base", "Copper-plated Zinc": "base", "Manganese-Brass": "base",
+}
+
+# --- COMPOSITION TABLE (MELT VALUES) ---
+# One row per (canonical denomination, year range). Only precious-metal issues are
+# listed; anything not matched here has no melt value.
+# "requires_metal" gates collector-only issues (e.g. silver proofs struck in
+# clad-era years) on the coin's canonical Metal Content. Ungated rows still
+# skip coins whose Metal Content names a different metal (METAL_FAMILIES), so a
+# year range shared by two issues (half dime / Shield nickel, silver / gold
+# dollar) never prices the base or gold coin as silver.
+# Columns: denomination, start_year, end_year, weight_g, metal, fineness, requires_metal
+COIN_COMPOSITIONS = [
+    # Half Dimes (filed under Nickel) & War Nickels
+    ("Nickel", 1837, 1852, 1.34, "silver", 0.900, None),
+    ("Nickel", 1853, 1873, 1.24, "silver", 0.900, None),
+    ("Nickel", 1942, 1945, 5.00, "silver", 0.350, None),
+    # Dimes
+    ("Dime", 1837, 1852, 2.67, "silver", 0.900, None),
+    ("Dime", 1853, 1872, 2.49, "silver", 0.900, None),
+    ("Dime", 1873, 1964, 2.50, "silver", 0.900, None),
+    ("Dime", 1965, 2099, 2.50, "silver", 0.900, "90% Silver"),
+    # Quarters
+    ("Quarter", 1838, 1852, 6.68, "silver", 0.900, None),
+    ("Quarter", 1853, 1872, 6.22, "silver", 0.900, None),
+    ("Quarter", 1873, 1964, 6.25, "silver", 0.900, None),
+    ("Quarter", 1965, 2099, 6.25, "silver", 0.900, "90% Silver"),
+    ("Quarter", 1975, 1976, 5.75, "silver", 0.400, "40% Silver"),
+    # Half Dollars
+    ("Half Dollar", 1838, 1852, 13.36, "silver", 0.900, None),
+    ("Half Dollar", 1853, 1872, 12.44, "silver", 0.900, None),
+    ("Half Dollar", 1873, 1964, 12.50, "silver", 0.900, None),
+    ("Half Dollar", 1965, 1970, 11.50, "silver", 0.400, None),
+    ("Half Dollar", 1971, 1976, 11.50, "silver", 0.400, "40% Silver"),
+    ("Half Dollar", 1992, 2099, 12.50, "silver", 0.900, "90% Silver"),
+    # Dollars (Seated, Morgan, Peace, silver Ikes; gold dollars 1849-1889)
+    ("Dollar", 1840, 1935, 26.73, "silver", 0.900, None),
+    ("Dollar", 1849, 1889, 1.672, "gold", 0.900, "Gold"),
+    ("Dollar", 1971, 1976, 24.59, "silver", 0.400, "40% Silver"),
+    # Bullion
+    ("Silver Eagle", 1986, 2099, 31.103, "silver", 0.999, None),
+    ("Gold Eagle", 1986, 2099, 33.931, "gold", 0.9167, None),
+    ("Gold Buffalo", 2006, 2099, 31.108, "gold", 0.9999, None),
+    # Pre-1933 Gold
+    ("Quarter Eagle", 1840, 1929, 4.18, "gold", 0.900, None),
+    ("Half Eagle", 1839, 1929, 8.36, "gold", 0.900, None),
+    ("Eagle", 1838, 1933, 16.72, "gold", 0.900, None),
+    ("Double Eagle", 1850, 1933, 33.44, "gold", 0.900, None),
+]
@@ -0,0 +1,219 @@
+"""
+Column-mapping resolution for spreadsheet imports.
+
+Each source header is resolved by the first step that knows it:
+  1. exact match with a DISPLAY_ORDER field (case / punctuation / spacing ignored)
+  2. the synonym table: built-in synonyms (incl. every NumisMate template
+     header) plus synonyms learned from earlier model answers (catalog/column_synonyms)
+  3. fuzzy match (difflib) against fields and synonyms
+  4. the mapping cache for this exact header set, keyed by a signature of the
+     normalized headers: this user's first (users/{email}/column_mappings), then
+     everyone's (column_mappings)
+  5. Gemini, asked only about the headers still unresolved (temperature 0)
+Template uploads and layouts seen before resolve without a model call.
+"""
+import difflib
+import hashlib
+import re
+import threading
+from datetime import datetime
+
+from coin_standards import DISPLAY_ORDER
+from llm_client import call_model
+from llm_json import column_mapping_schema, json_config, parse_model_json
+
+EXTRA_METADATA = "EXTRA_METADATA"
+GLOBAL_COLLECTION = "column_mappings"
+USER_COLLECTION = "column_mappings"  # under users/{email}/
+SYNONYM_DOC = ("catalog", "column_synonyms")
+FUZZY_CUTOFF = 0.88
+
+SYNONYMS = {
+    # NumisMate_Collection_Template.xlsx headers that differ from DISPLAY_ORDER
+    "Grading Certification Number": "Grading Cert #", "Personal Reference #": "Personal Ref #",
+    "Variety (Legacy)": EXTRA_METADATA, "Notes (Legacy)": EXTRA_METADATA,
+    # Common dealer / spreadsheet wording
+    "Date": "Purchase Date", "Date Purchased": "Purchase Date", "Order Date": "Purchase Date", "Purchased": "Purchase Date",
+    "Grade": "Condition", "Coin Grade": "Condition",
+    "Mint": "Mint Mark", "Mintmark": "Mint Mark", "MM": "Mint Mark",
+    "Denom": "Denomination", "Type": "Denomination", "Coin Type": "Denomination",
+    "Price": "Cost", "Price Paid": "Cost", "Purchase Price": "Cost", "Paid": "Cost", "Amount": "Cost",
+    "Cert": "Grading Cert #", "Cert #": "Grading Cert #", "Cert Number": "Grading Cert #", "Certification #": "Grading Cert #",
+    "Grader": "Grading Service", "Grading Company": "Grading Service", "TPG": "Grading Service",
+    "Series": "Program/Series", "Program": "Program/Series",
+    "Theme": "Theme/Subject", "Subject": "Theme/Subject",
+    "Qty": "Quantity", "Count": "Quantity",
+    "Strike": "Surface & Strike Quality", "Surface": "Surface & Strike Quality", "Eye Appeal": "Surface & Strike Quality",
+    "Dealer": "Retailer/Website", "Retailer": "Retailer/Website", "Seller": "Retailer/Website", "Website": "Retailer/Website",
+    "Vendor": "Retailer/Website", "Source": "Retailer/Website",
+    "Invoice": "Retailer Invoice #", "Invoice #": "Retailer Invoice #", "Invoice Number": "Retailer Invoice #",
+    "Order #": "Retailer Invoice #", "Order Number": "Retailer Invoice #",
+    "SKU": "Retailer Item No.", "Item #": "Retailer Item No.", "Item Number": "Retailer Item No.", "Product ID": "Retailer Item No.",
+    "Metal": "Metal Content", "Composition": "Metal Content",
+    "Melt": "Melt Value",
+    "Notes": "Personal Notes", "Comments": "Personal Notes",
+    "Ref #": "Personal Ref #", "Reference #": "Personal Ref #", "Inventory #": "Personal Ref #",
+    "Location": "Storage Location", "Storage": "Storage Location", "Box": "Storage Location",
+    "Estimated Value": "AI Estimated Value", "Value": "AI Estimated Value",
+}
+
+_lock = threading.Lock()
+_learned = None      # normalized header -> target, loaded once per process
+_mapping_cache = {}  # (user or "", signature) -> {normalized header: target}
+
+
+def normalize_header(header):
+    return " ".join(re.sub(r"[^a-z0-9#]+", " ", str(header).lower()).split())
+
+def header_signature(headers):
+    return hashlib.sha256("|".join(sorted(normalize_header(h) for h in headers)).encode("utf-8")).hexdigest()[:24]
+
+_FIELDS = {normalize_header(f): f for f in DISPLAY_ORDER}
+_BUILTIN = {normalize_header(k): v for k, v in SYNONYMS.items()}
+
+
+# --- LEARNED SYNONYMS / CACHE (Firestore) ---
+def _load_learned(db):
+    global _learned
+    with _lock:
+        if _learned is not None: return _learned
+    learned = {}
+    if db is not None:
+        try:
+            snap = db.collection(SYNONYM_DOC[0]).document(SYNONYM_DOC[1]).get()
+            learned = ((snap.to_dict() or {}).get("synonyms") or {}) if snap.exists else {}
+        except Exception as e:
+            print(f"Column Synonym Load Error: {e}")
+    with _lock:
+        _learned = {k: v for k, v in learned.items() if v in DISPLAY_ORDER or v == EXTRA_METADATA}
+        return _learned
+
+def _learn(db, pairs):
+    """Records model answers (normalized header -> field) as synonyms for future uploads."""
+    pairs = {k: v for k, v in pairs.items() if v in DISPLAY_ORDER}
+    if not pairs: return
+    with _lock:
+        if _learned is not None: _learned.update(pairs)
+    if db is None: return
+    try:
+        db.collection(SYNONYM_DOC[0]).document(SYNONYM_DOC[1]).set({"synonyms": pairs}, merge=True)
+    except Exception as e:
+        print(f"Column Synonym Save Error: {e}")
+
+def _cache_refs(db, user_email, sig):
+    refs = []
+    if user_email: refs.append((user_email, db.collection(f"users/{user_email}/{USER_COLLECTION}").document(sig)))
+    refs.append(("", db.collection(GLOBAL_COLLECTION).document(sig)))
+    return refs
+
+def _cached_mapping(db, user_email, sig):
+    for owner, ref in (_cache_refs(db, user_email, sig) if db is not None else [(user_email or "", None), ("", None)]):
+        with _lock:
+            hit = _mapping_cache.get((owner, sig))
+        if hit is not None: return hit
+        if ref is None: continue
+        try:
+            snap = ref.get()
+            if snap.exists:
+                hit = (snap.to_dict() or {}).get("mapping") or {}
+                with _lock:
+                    _mapping_cache[(owner, sig)] = hit
+                return hit
+        except Exception as e:
+            print(f"Column Mapping Cache Error: {e}")
+    return {}
+
+def _store_mapping(db, user_email, sig, mapping):
+    with _lock:
+        for owner in {user_email or "", ""}:
+            _mapping_cache[(owner, sig)] = mapping
+    if db is None: return
+    for _, ref in _cache_refs(db, user_email, sig):
+        try:
+            ref.set({"mapping": mapping, "updated_at": datetime.now().isoformat()})
+        except Exception as e:
+            print(f"Column Mapping Cache Error: {e}")
+
+
+# --- LOCAL MATCHING ---
+def match_header(header, learned=None):
+    """(target, method) for one header, or (None, None) when only the cache / model can tell."""
+    key = normalize_header(header)
+    if key in _FIELDS: return _FIELDS[key], "exact"
+    synonyms = dict(learned or {}, **_BUILTIN)  # built-ins win over learned answers
+    if key in synonyms: return synonyms[key], "synonym"
+    candidates = list(_FIELDS) + list(synonyms)
+    close = difflib.get_close_matches(key, candidates, n=1, cutoff=FUZZY_CUTOFF)
+    if close: return _FIELDS.get(close[0]) or synonyms[close[0]], "fuzzy"
+    return None, None
+
+
+# --- MODEL ---
+def _model_mapping(columns, resolved, model, user_email=None):
+    taken = sorted({t for t in resolved.values() if t != EXTRA_METADATA})
+    prompt = f"""
+    You are an expert Data Engineer. Map the Source Columns from a user's spreadsheet to the Target Database Schema.
+
+    Target Schema: {DISPLAY_ORDER}
+    Source Columns: {columns}
+    Already mapped (avoid these targets unless clearly a second copy): {taken}
+
+    INSTRUCTIONS:
+    1. Return a JSON LIST with one {{"source": Source Column, "target": Target Column}} entry per Source Column.
+    2. If a Source Column has NO clear match in Target, map it to "EXTRA_METADATA".
+    3. Be generous with matching (e.g. "Date" -> "Purchase Date", "Grade" -> "Condition").
+    4. "Cost" should map to "Cost".
+
+    OUTPUT JSON ONLY.
+    """
+    response = call_model("column_mapping", prompt, model=model, user=user_email,
+                          generation_config=json_config(column_mapping_schema(DISPLAY_ORDER), temperature=0))
+    pairs = parse_model_json(response.text, "column_mapping", expect=list)
+    return {p['source']: p.get('target', EXTRA_METADATA) for p in pairs if isinstance(p, dict) and 'source' in p}
+
+
+def resolve_column_mapping(source_columns, db=None, user_email=None, model=None):
+    """
+    Returns (mapping {source column: field or EXTRA_METADATA}, info) where
+    info = {"methods": {method: n columns}, "model_calls": 0 or 1}.
+    """
+    columns = [str(c) for c in source_columns]
+    learned = _load_learned(db)
+    mapping, methods = {}, {}
+    unresolved = []
+    for col in columns:
+        target, method = match_header(col, learned)
+        if target is None:
+            unresolved.append(col)
+        else:
+            mapping[col] = target
+            methods[method] = methods.get(method, 0) + 1
+    info = {"methods": methods, "model_calls": 0}
+    if not unresolved: return mapping, info
+
+    sig = header_signature(columns)
+    cached = _cached_mapping(db, user_email, sig)
+    for col in list(unresolved):
+        target = cached.get(normalize_header(col))
+        if target in DISPLAY_ORDER or target == EXTRA_METADATA:
+            mapping[col] = target
+            unresolved.remove(col)
+            methods["cached"] = methods.get("cached", 0) + 1
+
+    if unresolved and model is not None:
+        try:
+            answer = _model_mapping(unresolved, mapping, model, user_email=user_email)
+            info["model_calls"] = 1
+            _learn(db, {normalize_header(c): answer.get(c) for c in unresolved})
+            for col in unresolved:
+                target = answer.get(col)
+                mapping[col] = target if target in DISPLAY_ORDER else EXTRA_METADATA
+            methods["model"] = len(unresolved)
+            unresolved = []
+            _store_mapping(db, user_email, sig, {normalize_header(c): t for c, t in mapping.items()})
+        except Exception as e:
+            print(f"Column Mapping Model Error: {e}")
+    for col in unresolved:
+        mapping[col] = EXTRA_METADATA  # no model / model failed: kept, not dropped
+        methods["unresolved"] = methods.get("unresolved", 0) + 1
+    return mapping, info
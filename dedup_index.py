@@ -0,0 +1,204 @@
+"""
+Persistent per-user index of duplicate-check keys, so no import path has to
+read the whole vault to flag duplicates.
+
+  users/{email}/dedup_index/meta        {version, generation, dirty, coins, built_at}
+  users/{email}/dedup_index/shard-NN    {attr: {digest: true}, inv: {digest: true},
+                                         blocks: {block digest: {coin id: near record}}}
+
+Keys are the ATTR / INV keys from coin_dedup, stored as 16-hex digests, plus
+each coin's near-duplicate record ('grade|mint|cert|retailer|cost|date')
+under its year + denomination block, so near-duplicate scoring needs no vault
+read either. Everything is spread over SHARDS documents (a 100k-coin vault is
+~150 KB per shard). Every
+path that writes coins stages the new digests into its final write batch
+(stage_index_writes) and bumps meta.generation, so the index never lists a
+coin that was not written. Paths that can remove or re-key coins (delete,
+edit, restore) set meta.dirty instead and the next check rebuilds the index
+from a projection of the key fields.
+
+load_index() keeps one KeyIndex per user in memory and only re-reads the
+shards when meta.generation moved (one document read per check otherwise).
+"""
+import hashlib
+import threading
+from datetime import datetime
+
+import pandas as pd
+from google.cloud import firestore
+
+from coin_dedup import attr_keys, block_digest, block_keys, inv_keys, near_records
+
+INDEX_COLLECTION = "dedup_index"  # under users/{email}/
+META_DOC = "meta"
+INDEX_VERSION = "3"               # bump when attr_keys / inv_keys / near_records change; forces a rebuild
+SHARDS = 64
+DIGEST_CHARS = 16
+KEY_FIELDS = ['Year', 'Mint Mark', 'Denomination', 'Metal Content', 'Condition', 'Surface & Strike Quality',
+              'Retailer Invoice #', 'Retailer Item No.', 'Grading Cert #', 'Retailer/Website', 'Cost', 'Purchase Date']
+
+_lock = threading.Lock()
+_cache = {}  # user email -> KeyIndex
+
+
+class KeyIndex:
+    """Digest sets of a vault's ATTR and INV keys, and its near-duplicate block records, at one index generation."""
+
+    def __init__(self, attr=(), inv=(), generation=0, blocks=None):
+        self.attr = set(attr)
+        self.inv = set(inv)
+        self.blocks = blocks or {}
+        self.generation = generation
+
+    @property
+    def empty(self):
+        return not self.attr and not self.inv
+
+    def matches(self, k_attr, k_inv):
+        """(attr match mask, inv match mask) for key Series from coin_dedup."""
+        return key_digests(k_attr).isin(self.attr), key_digests(k_inv).isin(self.inv)
+
+
+def key_digests(keys):
+    # One hash per distinct key; missing keys (no invoice/item) stay None
+    codes, uniques = pd.factorize(keys)
+    digests = [hashlib.sha1(k.encode("utf-8")).hexdigest()[:DIGEST_CHARS] for k in uniques]
+    out = pd.Series([None] * len(keys), index=keys.index, dtype=object)
+    found = codes >= 0
+    if found.any(): out[found] = pd.Series(digests, dtype=object).to_numpy()[codes[found]]
+    return out
+
+def _shard(digest):
+    return f"shard-{int(digest[:4], 16) % SHARDS:02d}"
+
+def _collection(db, user_email):
+    return db.collection(f"users/{user_email}/{INDEX_COLLECTION}")
+
+def _as_frame(coins):
+    return coins if isinstance(coins, pd.DataFrame) else pd.DataFrame(list(coins))
+
+def _shard_maps(coins):
+    """{shard id: {"attr": {digest: True}, "inv": {digest: True}, "blocks": {block: {id: record}}}} for the coins."""
+    df = _as_frame(coins)
+    shards = {}
+    if df.empty: return shards
+    shard = lambda digest: shards.setdefault(_shard(digest), {"attr": {}, "inv": {}, "blocks": {}})
+    for kind, keys in (("attr", attr_keys(df)), ("inv", inv_keys(df))):
+        for digest in key_digests(keys).dropna().unique():
+            shard(digest)[kind][digest] = True
+    if 'id' in df.columns:
+        for block, cid, record in zip(block_digest(block_keys(df)), df['id'], near_records(df)):
+            if block and cid: shard(block)["blocks"].setdefault(block, {})[str(cid)] = record
+    return shards
+
+def _members(shards):
+    out = set()
+    for data in shards.values():
+        out.update(("attr", d) for d in data["attr"])
+        out.update(("inv", d) for d in data["inv"])
+        out.update(("block", b, cid) for b, recs in data["blocks"].items() for cid in recs)
+    return out
+
+
+# --- WRITE PATH ---
+def stage_index_writes(batch, db, user_email, coins=None, before=None):
+    """
+    Adds the index updates for coins (DataFrame or list of dicts) just
+    written in `batch`. With `before` (the same coins as they were), a key
+    that disappeared marks the index dirty, since another coin may still
+    share it. Returns the number of index writes staged.
+    """
+    if db is None or not user_email: return 0
+    col = _collection(db, user_email)
+    shards = _shard_maps(coins) if coins is not None else {}
+    for shard_id, data in shards.items():
+        batch.set(col.document(shard_id), {k: v for k, v in data.items() if v}, merge=True)
+    meta = {"generation": firestore.Increment(1), "updated_at": datetime.now().isoformat()}
+    if before is not None and _members(_shard_maps(before)) - _members(shards):
+        meta["dirty"] = True
+    batch.set(col.document(META_DOC), meta, merge=True)
+    return len(shards) + 1
+
+def mark_index_dirty(db, user_email, batch=None):
+    """For writes that can remove or re-key coins: the next check rebuilds the index."""
+    if db is None or not user_email: return
+    ref = _collection(db, user_email).document(META_DOC)
+    data = {"dirty": True, "generation": firestore.Increment(1), "updated_at": datetime.now().isoformat()}
+    try:
+        if batch is not None: batch.set(ref, data, merge=True)
+        else: ref.set(data, merge=True)
+    except Exception as e:
+        print(f"Dedup Index Error ({user_email}): {e}")
+
+
+# --- READ PATH ---
+def _vault_shards(db, user_email):
+    """(shard maps, #coins) derived from the vault's key fields (projection only - no reports / images)."""
+    coins = db.collection(f"users/{user_email}/coins")
+    # A field the coin doesn't have keys as "" (like a column the written frame didn't have), not as NaN
+    blank = dict.fromkeys(KEY_FIELDS, "")
+    rows = [dict(blank, **(d.to_dict() or {}), id=d.id) for d in coins.select([firestore.Client.field_path(f) for f in KEY_FIELDS]).stream()]
+    df = pd.DataFrame(rows, columns=['id'] + KEY_FIELDS, dtype=object)
+    return _shard_maps(df), len(df)
+
+def _index_from(shards, generation):
+    return KeyIndex((d for s in shards.values() for d in s["attr"]), (d for s in shards.values() for d in s["inv"]), generation,
+                    {b: recs for s in shards.values() for b, recs in s["blocks"].items()})
+
+def rebuild_index(db, user_email, generation=0):
+    """
+    Re-derives the index from the vault. `generation` is the meta generation
+    read before the rebuild; it is bumped with Increment like every other
+    index write, and if another write landed meanwhile (its keys may be missing
+    from the rebuilt shards) the index stays dirty and is rebuilt on the next check.
+    """
+    shards, n_coins = _vault_shards(db, user_email)
+    col = _collection(db, user_email)
+    batch = db.batch()
+    for n in range(SHARDS):
+        shard_id = f"shard-{n:02d}"
+        batch.set(col.document(shard_id), shards.get(shard_id, {"attr": {}, "inv": {}, "blocks": {}}))
+    batch.set(col.document(META_DOC), {"version": INDEX_VERSION, "generation": firestore.Increment(1), "dirty": False,
+                                       "coins": n_coins, "built_at": datetime.now().isoformat()}, merge=True)
+    batch.commit()
+    index = _index_from(shards, generation + 1)
+    snap = col.document(META_DOC).get()
+    if ((snap.to_dict() or {}) if snap.exists else {}).get("generation") != index.generation:
+        mark_index_dirty(db, user_email)
+        return index  # not cached: its generation is not the current one
+    with _lock:
+        _cache[user_email] = index
+    return index
+
+def load_index(db, user_email):
+    """
+    The user's KeyIndex, from memory unless the index changed since it was read.
+    If the index can't be read or rebuilt, the keys are derived from a full
+    vault read instead (not cached); errors from that read propagate, so a
+    failed check never passes as "no duplicates".
+    """
+    if db is None or not user_email: return KeyIndex()
+    col = _collection(db, user_email)
+    try:
+        snap = col.document(META_DOC).get()
+        meta = (snap.to_dict() or {}) if snap.exists else {}
+        generation = meta.get("generation", 0)
+        if not meta or meta.get("dirty") or meta.get("version") != INDEX_VERSION:
+            return rebuild_index(db, user_email, generation)
+        with _lock:
+            hit = _cache.get(user_email)
+        if hit is not None and hit.generation == generation: return hit
+        attr, inv, blocks = set(), set(), {}
+        for shard in db.get_all([col.document(f"shard-{n:02d}") for n in range(SHARDS)]):
+            data = (shard.to_dict() or {}) if shard.exists else {}
+            attr.update(data.get("attr") or {})
+            inv.update(data.get("inv") or {})
+            for block, records in (data.get("blocks") or {}).items():
+                blocks.setdefault(block, {}).update(records)
+        index = KeyIndex(attr, inv, generation, blocks)
+        with _lock:
+            _cache[user_email] = index
+        return index
+    except Exception as e:
+        print(f"Dedup Index Load Error ({user_email}): {e} - checking against the full vault")
+    return _index_from(_vault_shards(db, user_email)[0], -1)
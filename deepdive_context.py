@@ -0,0 +1,161 @@
+"""
+Bounded-context retrieval for the AI Numismatic Deepdive chat.
+
+Instead of sending df.to_string() of the whole vault with every question,
+we precompute (once per collection version) aggregate summaries, one compact
+line per coin and an inverted token index, then pick only the coins relevant
+to the question and stop adding lines at a fixed token budget.
+"""
+import re
+import threading
+
+import pandas as pd
+
+from llm_client import estimate_tokens
+
+DEEPDIVE_TOKEN_BUDGET = 4000      # approx tokens per prompt
+DEEPDIVE_MAX_COINS = 60
+DEEPDIVE_MAX_TURNS = 12           # chat is restarted after this many turns
+
+INDEX_COLUMNS = [
+    'Year', 'Mint Mark', 'Denomination', 'Country', 'Condition', 'Program/Series', 'Theme/Subject',
+    'Grading Service', 'Retailer/Website', 'Metal Content', 'Purchase Date', 'Storage Location',
+]
+STOPWORDS = {
+    'the', 'a', 'an', 'my', 'me', 'i', 'of', 'in', 'on', 'for', 'to', 'is', 'are', 'what', 'which',
+    'do', 'does', 'have', 'show', 'tell', 'about', 'and', 'or', 'with', 'from', 'coin', 'coins',
+    'collection', 'how', 'many', 'much', 'any', 'all', 'it', 'based', 'next',
+}
+VALUE_WORDS = {'valuable', 'expensive', 'worth', 'value', 'best', 'top', 'priciest', 'rarest', 'rare'}
+RECENT_WORDS = {'recent', 'latest', 'newest', 'purchased', 'bought', 'added', 'last'}
+
+_cache_lock = threading.Lock()
+_index_cache = {}
+
+
+def _tokens(text):
+    return [t for t in re.findall(r"[a-z0-9$]+", str(text).lower()) if t not in STOPWORDS and t not in ('nan', 'none')]
+
+def parse_money(series):
+    """'$1,250.00' -> 1250.0, '$100 - $150' -> 125.0, anything else -> NaN (vectorized)."""
+    s = series.astype(str).str.replace(r'[$,]', '', regex=True)
+    nums = s.str.extractall(r'(\d+(?:\.\d+)?)')[0].astype(float)
+    return nums.groupby(level=0).mean().reindex(series.index)
+
+
+# --- INDEX ---
+def collection_signature(df):
+    cols = [c for c in INDEX_COLUMNS + ['id', 'Cost', 'AI Estimated Value'] if c in df.columns]
+    return f"{len(df)}:{int(pd.util.hash_pandas_object(df[cols].astype(str), index=False).sum())}"
+
+def build_collection_index(df):
+    df = df.reset_index(drop=True)
+    cols = [c for c in INDEX_COLUMNS if c in df.columns]
+    text = df[cols].fillna('').astype(str)
+
+    value = parse_money(df['AI Estimated Value']) if 'AI Estimated Value' in df.columns else pd.Series(float('nan'), index=df.index)
+    cost = parse_money(df['Cost']) if 'Cost' in df.columns else pd.Series(float('nan'), index=df.index)
+    purchased = pd.to_datetime(df['Purchase Date'], errors='coerce') if 'Purchase Date' in df.columns else pd.Series(pd.NaT, index=df.index)
+
+    def col(name):
+        return text[name] if name in text.columns else pd.Series('', index=df.index)
+
+    # One compact line per coin (the only per-coin text the model ever sees)
+    mint = col('Mint Mark').str.strip()
+    lines = (
+        col('Year') + mint.where(mint == '', '-' + mint) + ' ' + col('Country') + ' ' + col('Denomination')
+        + ' | ' + col('Condition') + ' ' + col('Grading Service')
+        + ' | series: ' + col('Program/Series')
+        + ' | cost: ' + df.get('Cost', pd.Series('', index=df.index)).fillna('').astype(str)
+        + ' | est: ' + df.get('AI Estimated Value', pd.Series('', index=df.index)).fillna('').astype(str)
+        + ' | bought: ' + col('Purchase Date')
+    ).str.replace(r'\s+', ' ', regex=True)
+
+    # Inverted index: token -> row positions
+    inverted = {}
+    joined = text[cols[0]].str.cat([text[c] for c in cols[1:]], sep=' ') if cols else pd.Series('', index=df.index)
+    for pos, row_text in enumerate(joined.tolist()):
+        for tok in set(_tokens(row_text)):
+            inverted.setdefault(tok, []).append(pos)
+
+    summary = _summarize(df, value, cost, purchased)
+    return {
+        'lines': lines.tolist(),
+        'inverted': inverted,
+        'value': value,
+        'purchased': purchased,
+        'summary': summary,
+        'size': len(df),
+    }
+
+def _summarize(df, value, cost, purchased):
+    out = [f"Total coins: {len(df)}"]
+    out.append(f"Total cost: ${cost.sum():,.2f} | Total AI estimated value: ${value.sum():,.2f} ({int(value.notna().sum())} valued)")
+    years = pd.to_numeric(df['Year'].astype(str).str.extract(r'(\d{4})', expand=False), errors='coerce') if 'Year' in df.columns else pd.Series(dtype=float)
+    if years.notna().any():
+        out.append(f"Year range: {int(years.min())}-{int(years.max())}")
+        decades = (years // 10 * 10).dropna().astype(int).value_counts().sort_index()
+        out.append("By decade: " + ", ".join(f"{d}s: {n}" for d, n in decades.items()))
+    for col, label in [('Denomination', 'By denomination'), ('Country', 'By country'), ('Grading Service', 'By grading service'), ('Metal Content', 'By metal')]:
+        if col in df.columns:
+            counts = df[col].replace('', pd.NA).dropna().astype(str).value_counts().head(12)
+            if not counts.empty: out.append(f"{label}: " + ", ".join(f"{k}: {v}" for k, v in counts.items()))
+    if purchased.notna().any():
+        by_year = purchased.dt.year.dropna().astype(int).value_counts().sort_index()
+        out.append("Purchases by year: " + ", ".join(f"{y}: {n}" for y, n in by_year.items()))
+    return "\n".join(out)
+
+def get_collection_index(df, key=None):
+    """Index for df, rebuilt only when the collection changes (cached per key)."""
+    sig = collection_signature(df)
+    with _cache_lock:
+        hit = _index_cache.get(key)
+        if hit and hit['signature'] == sig: return hit
+    index = build_collection_index(df)
+    index['signature'] = sig
+    with _cache_lock:
+        _index_cache[key] = index
+    return index
+
+
+# --- RETRIEVAL ---
+def select_relevant(index, query, max_coins=DEEPDIVE_MAX_COINS):
+    """
+    Row positions ranked by token overlap with the question; ties broken by
+    value (or recency for "recent/bought" questions). With no token match, the
+    most valuable / most recent coins stand in as representative context.
+    """
+    q_tokens = set(_tokens(query))
+    wants_recent = bool(q_tokens & RECENT_WORDS)
+    value = index['value'].fillna(-1.0).to_numpy()
+    recent = (index['purchased'] - pd.Timestamp(0)).dt.total_seconds().fillna(-1.0).to_numpy()
+    secondary = recent if wants_recent else value
+
+    scores = {}
+    for tok in q_tokens:
+        for pos in index['inverted'].get(tok, ()):
+            scores[pos] = scores.get(pos, 0) + 1
+    if scores:
+        return sorted(scores, key=lambda p: (-scores[p], -secondary[p]))[:max_coins]
+
+    if wants_recent:
+        return index['purchased'].dropna().sort_values(ascending=False).index.tolist()[:max_coins]
+    limit = max_coins if q_tokens & VALUE_WORDS else max_coins // 2
+    return index['value'].dropna().sort_values(ascending=False).index.tolist()[:limit]
+
+def build_deepdive_prompt(index, query, include_summary=True, token_budget=DEEPDIVE_TOKEN_BUDGET):
+    head = f"User Question: '{query}'\n"
+    if include_summary:
+        head += f"Collection Summary (all {index['size']} coins):\n{index['summary']}\n"
+    tail = "\nAnswer as an expert numismatist. The coin list is a relevant subset; use the summary for totals."
+
+    budget = token_budget - estimate_tokens(head + tail)
+    lines = []
+    for pos in select_relevant(index, query):
+        line = index['lines'][pos]
+        cost = estimate_tokens(line) + 1
+        if cost > budget: break
+        lines.append(line); budget -= cost
+
+    body = f"Relevant Coins ({len(lines)} of {index['size']}):\n" + "\n".join(lines) if lines else "Relevant Coins: none matched."
+    return head + body + tail
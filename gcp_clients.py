@@ -0,0 +1,100 @@
+"""
+Process-wide registry of GCP clients (Storage, Document AI, Firestore, Vertex).
+
+Clients are created lazily on first use, once per process, and shared by
+every Streamlit session and worker thread (the google-cloud clients are
+thread-safe). Bucket handles are memoized and bucket existence is checked
+once. get_client_stats() shows constructions vs. requests per client.
+"""
+import os
+import threading
+
+PROJECT_ID = "studio-9101802118-8c9a8"
+LOCATION = "us-central1"
+DOCAI_LOCATION = "us"
+BUCKET_NAME = "numista-uploads-studio-9101802118-8c9a8"
+UPLOADS_BUCKET = f"{PROJECT_ID}-uploads"  # coin images / spreadsheet archives
+KEY_PATH = "serviceAccountKey.json.json"
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+_lock = threading.RLock()
+_clients = {}
+_stats = {}  # key -> {"constructed": n, "requests": n}
+
+
+def _get(key, factory):
+    with _lock:
+        stats = _stats.setdefault(key, {"constructed": 0, "requests": 0})
+        stats["requests"] += 1
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+            stats["constructed"] += 1
+        return client
+
+def get_client_stats():
+    with _lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+# --- CREDENTIALS ---
+def _load_key_credentials():
+    # Explicit service account key if available (avoids 403s on Vertex); None -> ADC
+    if not os.path.exists(KEY_PATH): return None
+    try:
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_file(KEY_PATH)
+    except Exception as e:
+        print(f"Service Account Key Error: {e}")
+        return None
+
+def get_key_credentials():
+    return _get("key_credentials", lambda: _load_key_credentials() or False) or None
+
+def get_default_credentials():
+    import google.auth
+    return _get("adc", lambda: google.auth.default()[0])
+
+
+# --- CLIENTS ---
+def get_firestore():
+    from google.cloud import firestore
+    return _get("firestore", lambda: firestore.Client(credentials=get_default_credentials(), project=PROJECT_ID))
+
+def get_storage():
+    from google.cloud import storage
+    return _get("storage", lambda: storage.Client(credentials=get_key_credentials(), project=PROJECT_ID))
+
+def get_docai(location=DOCAI_LOCATION):
+    from google.api_core.client_options import ClientOptions
+    from google.cloud import documentai
+    return _get(f"docai:{location}", lambda: documentai.DocumentProcessorServiceClient(
+        client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")))
+
+def init_vertex(location=LOCATION):
+    import vertexai
+    def _init():
+        vertexai.init(project=PROJECT_ID, location=location, credentials=get_key_credentials())
+        return True
+    return _get(f"vertex:{location}", _init)
+
+def get_model(name=DEFAULT_MODEL):
+    from vertexai.generative_models import GenerativeModel
+    init_vertex()
+    return _get(f"model:{name}", lambda: GenerativeModel(name))
+
+
+# --- BUCKETS ---
+def get_bucket(name=BUCKET_NAME):
+    return _get(f"bucket:{name}", lambda: get_storage().bucket(name))
+
+def ensure_bucket(name, location=LOCATION):
+    """Bucket handle, created if missing; the existence check runs once per process."""
+    def _check():
+        client = get_storage()
+        bucket = client.lookup_bucket(name)
+        if bucket is None:
+            bucket = client.create_bucket(name, location=location)
+        return bucket
+    return _get(f"bucket_checked:{name}", _check)
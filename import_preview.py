@@ -0,0 +1,142 @@
+"""
+Paged preview of a staged import (Excel "Import Preview", Single Scan
+"Confirm & Import").
+
+The staged DataFrame stays in session state untouched; the browser only gets
+aggregate stats (preview_summary) and one page of rows at a time. Whatever
+the user changes on a page is diffed against what was shown (diff_page) and
+kept as deltas:
+
+  {"edits": {column: {row label: value}}, "deleted": {row label},
+   "added": {"added-N": row dict}, "version": n, "stage": token of the staged frame}
+
+apply_deltas() replays them onto the staged frame at import time. Row labels
+are the staged index as strings, so added rows can share the index.
+"""
+import numpy as np
+import pandas as pd
+
+from coin_dedup import NEAR_LIKELY
+
+PAGE_ROWS = 50
+VIEWS = ["All", "New", "Duplicates", "Near duplicates"]
+
+
+def new_deltas(stage=None):
+    """Empty deltas for the stage identified by `stage` (a token set whenever a new frame is staged)."""
+    return {"edits": {}, "deleted": set(), "added": {}, "version": 0, "next": 0, "stage": stage}
+
+def has_deltas(deltas):
+    return bool(deltas and (deltas["edits"] or deltas["deleted"] or deltas["added"]))
+
+def delta_counts(deltas):
+    """(rows edited, rows removed, rows added)."""
+    edited = set()
+    for labels in deltas["edits"].values(): edited.update(labels)
+    return len(edited - deltas["deleted"]), len(deltas["deleted"]), len(deltas["added"])
+
+def _blank(v):
+    return (isinstance(v, str) and not v.strip()) or (pd.api.types.is_scalar(v) and pd.isna(v))
+
+def _labelled(df):
+    return df.set_axis(df.index.astype(str))
+
+
+# --- APPLY ---
+def apply_deltas(staged_df, deltas):
+    """The staged frame with the user's edits, removals and added rows applied (string row labels)."""
+    out = _labelled(staged_df)
+    if not has_deltas(deltas): return out
+    if deltas["deleted"]: out = out[~out.index.isin(list(deltas["deleted"]))]
+    out = out.copy()
+    for col, cells in deltas["edits"].items():
+        pos = out.index.get_indexer(list(cells))
+        hit = pos >= 0
+        if not hit.any(): continue
+        values = out[col].to_numpy(dtype=object, copy=True) if col in out.columns else np.full(len(out), None, dtype=object)
+        values[pos[hit]] = np.array(list(cells.values()), dtype=object)[hit]
+        out[col] = values
+    if deltas["added"]:
+        added = pd.DataFrame.from_dict(deltas["added"], orient="index").reindex(columns=out.columns)
+        out = pd.concat([out, added.astype(object)])
+    return out
+
+
+# --- SUMMARY ---
+def fill_rates(df):
+    """Share of rows with a non-blank value, per column."""
+    if df.empty: return pd.Series(0.0, index=df.columns)
+    filled = {}
+    for col in df.columns:
+        s = df[col]
+        present = s.notna()
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            present &= s.astype(object).ne("")
+        filled[col] = float(present.mean())
+    return pd.Series(filled)
+
+def preview_summary(df, failed=0):
+    """Counts for the preview header: rows, NEW / DUPLICATE, likely near duplicates, failed rows, fill rates."""
+    status = df['Status'] if 'Status' in df.columns else pd.Series("NEW", index=df.index)
+    near = df['Near Confidence'].ge(NEAR_LIKELY).sum() if 'Near Confidence' in df.columns else 0
+    return {"rows": len(df), "new": int(status.eq('NEW').sum()), "duplicates": int(status.eq('DUPLICATE').sum()),
+            "near": int(near), "failed": int(failed), "fill": fill_rates(df)}
+
+
+# --- PAGING ---
+def view_labels(df, view="All"):
+    """Row labels shown under a VIEWS filter."""
+    if view == "New" and 'Status' in df.columns: return df.index[df['Status'].eq('NEW')]
+    if view == "Duplicates" and 'Status' in df.columns: return df.index[df['Status'].eq('DUPLICATE')]
+    if view == "Near duplicates" and 'Near Confidence' in df.columns: return df.index[df['Near Confidence'].ge(NEAR_LIKELY)]
+    return df.index
+
+def page_count(n_rows, page_rows=PAGE_ROWS):
+    return max(1, -(-n_rows // page_rows))
+
+def page_bounds(page, n_rows, page_rows=PAGE_ROWS):
+    """(start, end) row positions of a 1-based page."""
+    start = (min(max(page, 1), page_count(n_rows, page_rows)) - 1) * page_rows
+    return start, min(start + page_rows, n_rows)
+
+
+# --- DIFF ---
+def diff_page(shown, edited):
+    """
+    (edits {column: {label: value}}, removed labels, added row dicts) between
+    the page as shown and as returned by the editor.
+    """
+    kept = edited.index.isin(shown.index)
+    removed = shown.index[~shown.index.isin(edited.index)].tolist()
+    added = []
+    for row in edited[~kept].to_dict("records"):
+        row = {k: v for k, v in row.items() if not _blank(v)}
+        if row: added.append(row)
+    edits = {}
+    common = edited.index[kept]
+    cols = [c for c in shown.columns if c in edited.columns]
+    if len(common) and cols:
+        before = shown.loc[common, cols].astype(object)
+        after = edited.loc[common, cols].astype(object)
+        changed = before.ne(after) & ~(before.isna() & after.isna())
+        for col in cols:
+            labels = common[changed[col].to_numpy()]
+            if len(labels): edits[col] = dict(zip(labels.tolist(), after.loc[labels, col].tolist()))
+    return edits, removed, added
+
+def merge_page(deltas, shown, edited):
+    """Folds one editor round-trip into deltas. Returns True when anything changed."""
+    edits, removed, added = diff_page(shown, edited)
+    if not (edits or removed or added): return False
+    for col, cells in edits.items():
+        for label, value in cells.items():
+            if label in deltas["added"]: deltas["added"][label][col] = value
+            else: deltas["edits"].setdefault(col, {})[label] = value
+    for label in removed:
+        if deltas["added"].pop(label, None) is None: deltas["deleted"].add(label)
+    for row in added:
+        row.setdefault('Status', 'NEW')
+        deltas["added"][f"added-{deltas['next']}"] = row
+        deltas["next"] += 1
+    deltas["version"] += 1
+    return True
@@ -0,0 +1,91 @@
+"""
+Content-addressed cache for invoice OCR and extraction results.
+
+Keyed by the SHA-256 of the PDF bytes, so a retry, a duplicate bulk upload or a
+single scan of an already-batched file costs no DocAI / Gemini calls:
+  invoices/cache/{sha}/document.json          DocAI Document (text + layout)
+  invoices/cache/{sha}/items-{version}.json   extracted items, tagged with the
+                                              prompt/model version that made them
+  invoice_hashes/{sha}  (Firestore)           who imported this file, and when
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from google.cloud import documentai
+
+CACHE_PREFIX = "invoices/cache/"
+HASH_COLLECTION = "invoice_hashes"
+
+
+def content_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def blob_hash(blob):
+    # Uploads record the hash in object metadata; older blobs are hashed on download
+    sha = (getattr(blob, "metadata", None) or {}).get("sha256")
+    return sha or content_hash(blob.download_as_bytes())
+
+def _read(bucket, name):
+    blob = bucket.blob(name)
+    try:
+        if not blob.exists(): return None
+        return blob.download_as_bytes()
+    except Exception as e:
+        print(f"Invoice Cache Read Error ({name}): {e}")
+        return None
+
+def _write(bucket, name, data):
+    try:
+        bucket.blob(name).upload_from_string(data, content_type="application/json")
+    except Exception as e:
+        print(f"Invoice Cache Write Error ({name}): {e}")
+
+
+# --- OCR ---
+def get_cached_document(bucket, sha):
+    raw = _read(bucket, f"{CACHE_PREFIX}{sha}/document.json")
+    return documentai.Document.from_json(raw, ignore_unknown_fields=True) if raw else None
+
+def put_cached_document(bucket, sha, doc):
+    if not sha: return
+    _write(bucket, f"{CACHE_PREFIX}{sha}/document.json", documentai.Document.to_json(doc))
+
+
+# --- EXTRACTION ---
+def get_cached_items(bucket, sha, version):
+    raw = _read(bucket, f"{CACHE_PREFIX}{sha}/items-{version}.json")
+    if not raw: return None
+    try:
+        return json.loads(raw)["items"]
+    except Exception as e:
+        print(f"Invoice Cache Parse Error ({sha}): {e}")
+        return None
+
+def put_cached_items(bucket, sha, version, items, model_name=None):
+    if not sha: return
+    _write(bucket, f"{CACHE_PREFIX}{sha}/items-{version}.json", json.dumps({
+        "version": version,
+        "model": model_name,
+        "created_at": datetime.now().isoformat(),
+        "items": items,
+    }, default=str))
+
+
+# --- IMPORT LEDGER ---
+def mark_imported(db, sha, user_email, filename, summary=""):
+    try:
+        db.collection(HASH_COLLECTION).document(sha).set({
+            "imports": {user_email: {"filename": filename, "summary": summary, "imported_at": datetime.now().isoformat()}},
+        }, merge=True)
+    except Exception as e:
+        print(f"Import Ledger Error: {e}")
+
+def previous_import(db, sha, user_email):
+    """{filename, summary, imported_at} if this user already imported this exact file, else None."""
+    try:
+        snap = db.collection(HASH_COLLECTION).document(sha).get()
+        return ((snap.to_dict() or {}).get("imports") or {}).get(user_email) if snap.exists else None
+    except Exception as e:
+        print(f"Import Ledger Error: {e}")
+        return None
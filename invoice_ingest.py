@@ -0,0 +1,167 @@
+"""
+Event-driven ingestion of the invoice queue.
+
+Uploads to invoices/queue/ are processed as soon as they land instead of
+waiting for someone to press Start in the Batch Processor, and nothing lists
+the queue prefix:
+  app      upload_to_gcs_queue() hands each new blob to the process-wide
+           Ingestor right after the upload completes (INVOICE_INGEST=app, default)
+  events   a GCS object-finalize trigger runs on_invoice_finalized() (Cloud Run
+           function, INVOICE_INGEST=events), so uploads from anywhere are picked up:
+             gcloud functions deploy invoice-ingest --gen2 --runtime=python311 \\
+               --entry-point=on_invoice_finalized --source=. \\
+               --trigger-event-filters="type=google.cloud.storage.object.v1.finalized" \\
+               --trigger-event-filters="bucket=<BUCKET_NAME>"
+  local    watch_local_bucket() polls a LocalBucket directory and emits the same
+           events, so the flow runs without a GCS bucket or trigger:
+             python invoice_ingest.py ./local_bucket user@example.com
+The uploader comes from the blob's "uploader" metadata. Progress lands in
+invoice_jobs and is read back with invoice_pipeline.upload_feed().
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+from invoice_pipeline import QUEUE_PREFIX, BatchRun
+
+INGEST_MODE = os.environ.get("INVOICE_INGEST", "app")  # app | events | manual
+INGEST_WINDOW = 2.0        # seconds to collect a burst (bulk upload) into one run
+WATCH_POLL_SECONDS = 1.0
+
+
+def _is_queued_invoice(name):
+    return name.startswith(QUEUE_PREFIX) and not name.endswith('/')
+
+
+class Ingestor:
+    """
+    Turns upload events into BatchRuns over exactly the uploaded blobs.
+    Events arriving within `window` seconds are processed together, so a bulk
+    upload still shares worker pools and can use a DocAI batch job.
+    """
+
+    def __init__(self, bucket, db, model, window=INGEST_WINDOW, **run_kwargs):
+        self.bucket = bucket
+        self.db = db
+        self.model = model
+        self.window = window
+        self.run_kwargs = run_kwargs
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def handle_event(self, data):
+        """GCS object event payload ({bucket, name, metadata}); True if it was enqueued."""
+        name = data.get("name") or ""
+        if not _is_queued_invoice(name): return False  # e.g. the archive move into processed/
+        user_email = (data.get("metadata") or {}).get("uploader")
+        if not user_email:
+            print(f"Ingest Skipped ({name}): no uploader metadata, left for the Batch Processor")
+            return False
+        self.enqueue(name, user_email)
+        return True
+
+    def enqueue(self, name, user_email):
+        self._queue.put((user_email, name))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="invoice-ingest", daemon=True)
+                self._thread.start()
+
+    def process(self, user_email, names):
+        """Runs the pipeline over these queued blobs now (blocking); returns the run snapshot."""
+        return BatchRun(self.bucket, self.db, self.model, user_email, names=names, **self.run_kwargs).run()
+
+    def _loop(self):
+        while True:
+            burst = [self._queue.get()]
+            deadline = time.time() + self.window
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0: break
+                try:
+                    burst.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            by_user = {}
+            for user_email, name in burst:
+                by_user.setdefault(user_email, []).append(name)
+            for user_email, names in by_user.items():
+                try:
+                    self.process(user_email, names)
+                except Exception as e:
+                    print(f"Ingest Error ({user_email}): {e}")
+
+
+# --- PROCESS-WIDE INGESTOR (the app's upload hand-off) ---
+_ingestor_lock = threading.Lock()
+_ingestor = None
+
+def get_ingestor(bucket, db, model, **kwargs):
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = Ingestor(bucket, db, model, **kwargs)
+        return _ingestor
+
+
+# --- GCS FINALIZE TRIGGER (Cloud Run function entry point) ---
+def on_invoice_finalized(cloud_event):
+    """Processes the uploaded invoice inline, so the work finishes before the function returns."""
+    from gcp_clients import get_bucket, get_firestore, get_model
+
+    data = cloud_event.data
+    name = data.get("name") or ""
+    user_email = (data.get("metadata") or {}).get("uploader")
+    if not _is_queued_invoice(name) or not user_email: return
+    ingestor = get_ingestor(get_bucket(data.get("bucket")), get_firestore(), get_model())
+    snap = ingestor.process(user_email, [name])
+    for f in snap["files"]:
+        print(f"Ingested {f['name']}: {f['status']} {f['message']}")
+
+
+# --- LOCAL WATCHER (stand-in for finalize events) ---
+def watch_local_bucket(bucket, handler, uploader=None, poll_seconds=WATCH_POLL_SECONDS, stop_event=None):
+    """
+    Polls a LocalBucket's queue directory and calls handler(event) once per new
+    file, after its size is stable for one poll (i.e. the upload finished).
+    Local files carry no metadata, so `uploader` is attached to every event.
+    """
+    stop_event = stop_event or threading.Event()
+    sizes, emitted = {}, set()
+
+    def _loop():
+        while not stop_event.is_set():
+            current = {}
+            for blob in bucket.list_blobs(prefix=QUEUE_PREFIX):
+                try:
+                    current[blob.name] = os.path.getsize(blob._path)
+                except OSError:
+                    continue  # moved away between listing and stat
+            for name, size in current.items():
+                if name not in emitted and sizes.get(name) == size:
+                    emitted.add(name)
+                    handler({"bucket": bucket.name, "name": name, "metadata": {"uploader": uploader}})
+            sizes.clear(); sizes.update(current)
+            emitted.intersection_update(current)  # a re-upload under the same name fires again
+            stop_event.wait(poll_seconds)
+
+    threading.Thread(target=_loop, name="local-bucket-watch", daemon=True).start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    from gcp_clients import get_firestore, get_model
+    from local_gcp import LocalBucket
+
+    if len(sys.argv) < 3:
+        print("usage: python invoice_ingest.py <local_bucket_dir> <user_email>")
+        sys.exit(1)
+    local = LocalBucket(sys.argv[1])
+    ingestor = Ingestor(local, get_firestore(), get_model())
+    watch_local_bucket(local, ingestor.handle_event, uploader=sys.argv[2])
+    print(f"Watching {os.path.join(sys.argv[1], QUEUE_PREFIX)} (Ctrl+C to stop)")
+    while True:
+        time.sleep(60)
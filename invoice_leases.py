@@ -0,0 +1,151 @@
+"""
+Leases on queued invoices, so any number of workers (sessions, Cloud Run
+instances, ingest events) can drain invoices/queue/ together and each file is
+processed by exactly one of them.
+
+The manifest is queue_leases/{hash of blob name} in Firestore:
+  {blob, owner, expires_at (epoch s), claimed_at, renewed_at}
+Every write is a compare-and-swap: create() for a fresh claim, and
+update/delete guarded by the snapshot's update_time for takeover, renewal and
+release. Of two workers racing for the same file, one write fails and that
+worker skips the file. Holders renew their leases on a heartbeat thread. A
+crashed worker stops renewing, its leases expire, and the next pass reclaims
+the files. Before committing coins a worker re-checks that it still holds the
+lease (fencing). The commit ids are deterministic, so a late duplicate commit
+would only overwrite the same documents.
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from google.api_core import exceptions as gexc
+from google.cloud import firestore
+
+LEASE_COLLECTION = "queue_leases"
+LEASE_SECONDS = 120       # a lease not renewed for this long can be taken over
+HEARTBEAT_SECONDS = 30    # renewal interval (well inside LEASE_SECONDS)
+
+_CAS_ERRORS = (gexc.AlreadyExists, gexc.FailedPrecondition, gexc.Conflict, gexc.NotFound)
+
+
+class LeaseLost(Exception):
+    """The lease on a file expired and another worker took it over."""
+
+
+def lease_id(blob_name):
+    return hashlib.sha256(blob_name.encode("utf-8")).hexdigest()[:32]
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class LeaseManager:
+    """Claims, renews and releases leases for one worker (one BatchRun)."""
+
+    def __init__(self, db, owner=None, ttl=LEASE_SECONDS, heartbeat=HEARTBEAT_SECONDS):
+        self.db = db
+        self.owner = owner or worker_id()
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ref(self, name):
+        return self.db.collection(LEASE_COLLECTION).document(lease_id(name))
+
+    def _data(self, name):
+        return {"blob": name, "owner": self.owner, "expires_at": time.time() + self.ttl,
+                "renewed_at": datetime.now().isoformat()}
+
+    def _write_if_unchanged(self, ref, snap, data):
+        ref.update(data, option=firestore.Client.write_option(last_update_time=snap.update_time))
+
+    # --- claim / release ---
+    def claim(self, name):
+        """True if this worker now holds the lease on `name`."""
+        if self.db is None: return True
+        ref = self._ref(name)
+        try:
+            snap = ref.get()
+            lease = (snap.to_dict() or {}) if snap.exists else None
+            if lease is None:
+                ref.create(dict(self._data(name), claimed_at=datetime.now().isoformat()))
+            elif lease.get("owner") == self.owner or lease.get("expires_at", 0) < time.time():
+                # Expired (holder crashed or stalled) - take over unless someone beat us to it
+                self._write_if_unchanged(ref, snap, dict(self._data(name), claimed_at=datetime.now().isoformat(),
+                                                         previous_owner=lease.get("owner")))
+            else:
+                return False
+        except _CAS_ERRORS:
+            return False
+        except Exception as e:
+            print(f"Lease Claim Error ({name}): {e}")
+            return False
+        with self._lock:
+            self._held.add(name)
+        return True
+
+    def release(self, name):
+        with self._lock:
+            if name not in self._held: return
+            self._held.discard(name)
+        if self.db is None: return
+        ref = self._ref(name)
+        try:
+            snap = ref.get()
+            if snap.exists and (snap.to_dict() or {}).get("owner") == self.owner:
+                ref.delete(option=firestore.Client.write_option(last_update_time=snap.update_time))
+        except _CAS_ERRORS:
+            pass  # taken over meanwhile; nothing of ours to delete
+        except Exception as e:
+            print(f"Lease Release Error ({name}): {e}")
+
+    def verify(self, name):
+        """Fencing check before side effects: raises LeaseLost unless we still hold a live lease."""
+        if self.db is None: return
+        lease = self._ref(name).get().to_dict() or {}
+        if lease.get("owner") != self.owner or lease.get("expires_at", 0) < time.time():
+            with self._lock:
+                self._held.discard(name)
+            raise LeaseLost(f"Lease on {name} lost to {lease.get('owner') or 'nobody'}")
+
+    # --- heartbeat ---
+    def renew_all(self):
+        with self._lock:
+            names = list(self._held)
+        for name in names:
+            ref = self._ref(name)
+            try:
+                snap = ref.get()
+                if not snap.exists or (snap.to_dict() or {}).get("owner") != self.owner:
+                    with self._lock:
+                        self._held.discard(name)
+                    continue
+                self._write_if_unchanged(ref, snap, self._data(name))
+            except _CAS_ERRORS:
+                continue  # raced with a takeover; verify() will notice
+            except Exception as e:
+                print(f"Lease Renew Error ({name}): {e}")
+
+    def start(self):
+        if self.db is None or self._thread is not None: return self
+        def _loop():
+            while not self._stop.wait(self.heartbeat):
+                self.renew_all()
+        self._thread = threading.Thread(target=_loop, name=f"lease-{self.owner}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the heartbeat and releases whatever is still held."""
+        self._stop.set()
+        with self._lock:
+            names = list(self._held)
+        for name in names:
+            self.release(name)
@@ -0,0 +1,932 @@
+"""
+Headless invoice pipeline: PDF text layer or DocAI OCR -> local pre-filter -> Gemini extraction -> routing -> Firestore.
+
+Nothing here imports Streamlit; db / model / bucket are passed in, so the same
+code runs from the "Batch Processor" tab, a Cloud Run job or the command line:
+    python invoice_pipeline.py user@example.com
+
+BatchRun drains the GCS queue with a worker pool per stage: OCR for the next
+invoices runs while extraction runs for the current ones, with a bounded
+number of OCR'd documents waiting so memory stays flat. Large queues are OCR'd
+with one asynchronous DocAI batch job (GCS in / sharded JSON out) instead of
+one online request per file; single scans keep the online path. Digital
+PDFs with a usable text layer skip DocAI entirely (invoice_textlayer).
+"""
+import copy
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from google.cloud import documentai, firestore
+
+from coin_dedup import NEAR_LIKELY, annotate_near_duplicates, identify_duplicates
+from coin_normalize import normalize_coin_data
+from coin_standards import DISPLAY_ORDER
+from dedup_index import load_index, stage_index_writes
+from gcp_clients import DOCAI_LOCATION, PROJECT_ID, get_docai
+from invoice_leases import LeaseLost, LeaseManager
+from invoice_textlayer import text_layer_document
+from invoice_prefilter import FILTER_VERSION, filter_document
+from invoice_cache import (blob_hash, content_hash, get_cached_document, get_cached_items, mark_imported,
+                           previous_import, put_cached_document, put_cached_items)
+from llm_client import DEFAULT_MODEL_NAME, call_model, estimate_tokens, record_prompt_trim
+from llm_json import INVOICE_ITEMS_SCHEMA, JsonObjectStream, json_config, parse_model_json
+
+DOCAI_PROCESSOR_ID = "c113e9bb62be1554"
+
+QUEUE_PREFIX = "invoices/queue/"
+PROCESSED_PREFIX = "invoices/processed/"
+FAILED_PREFIX = "invoices/failed/"
+BATCH_OUTPUT_PREFIX = "invoices/docai_batch/"
+
+JOB_COLLECTION = "invoice_jobs"
+ACTIVE_STATUSES = ("Uploaded", "Queued", "Reading", "Importing", "Retrying")  # upload_feed statuses still in flight
+JOB_STAGES = ["queued", "ocr_done", "extracted", "committed", "archived"]
+MAX_ATTEMPTS = 3          # failures before a file is moved to invoices/failed/
+COMMIT_BATCH_SIZE = 400   # Firestore batches cap at 500 writes
+
+AUTO_IMPORT_CONFIDENCE = 0.85
+OCR_WORKERS = 4
+EXTRACT_WORKERS = 3
+PREFETCH = 4  # OCR'd invoices allowed to wait for an extraction worker
+BATCH_OCR_MIN_FILES = 10  # queues at least this long use a DocAI batch job
+BATCH_POLL_SECONDS = 10
+BATCH_TIMEOUT = 60 * 60
+CHUNK_CHARS = 6000        # long invoices are extracted in page chunks of about this size
+CHUNK_WORKERS = 4         # concurrent chunk calls, shared by every invoice in the process
+HEADER_CHARS = 1200       # start of page 1 sent with every chunk (retailer / invoice # / date)
+CONTEXT_LINES = 3         # tail of the previous chunk, so a row split across pages is still readable
+HEADER_FIELDS = ["Retailer/Website", "Retailer Invoice #", "Purchase Date"]
+
+COIN_DICTIONARY = [
+    { "val": 0.01, "formal": "Lincoln Cent", "slang": ["penny", "wheatie", "steelie", "red cent", "lincoln wheat cent", "wheat cent"] },
+    { "val": 0.05, "formal": "Jefferson Nickel", "slang": ["nickel", "buffalo", "war nickel", "v-nickel", "buffalo nickel"] },
+    { "val": 0.10, "formal": "Roosevelt Dime", "slang": ["dime", "mercury", "rosie", "winged liberty", "mercury dime"] },
+    { "val": 0.25, "formal": "Washington Quarter", "slang": ["quarter", "two bits", "state quarter", "2026 semiquin"] },
+    { "val": 0.50, "formal": "Kennedy Half Dollar", "slang": ["half", "fifty cent", "franklin", "walker", "walking liberty"] },
+    { "val": 1.00, "formal": "Morgan Silver Dollar", "slang": ["morgan", "silver dollar", "cartwheel", "peace dollar", "peace"] }
+]
+
+PROMPT_RULES = (
+    "You are an expert Numismatist. Extract items from this invoice text. "
+    "Return a JSON LIST of objects using this validation rules: \n"
+    "1. CLASSIFY each item into 'category': 'US Coin', 'Paper Currency', 'Foreign Currency', 'Supply/Other'.\n"
+    "2. CONFIDENCE SCORING: For each item, add:\n"
+    "   - 'confidence_score': Float 0.0 to 1.0 (1.0 = perfect match, 0.0 = total guess)\n"
+    "   - 'needs_manual_review': Boolean (true if Date/Mint/Denomination is ambiguous or missing)\n"
+    "3. Use this schema for all items:\n"
+    "{ \"category\": \"String\", \"confidence_score\": 0.9, \"needs_manual_review\": false, \n"
+    "  \"Country\": \"US\", \"Year\": \"Year\", \"Denomination\": \"Name\", \"Mint Mark\": \"Letter\", \n"
+    "  \"Quantity\": \"1\", \"Program/Series\": \"Name\", \"Theme/Subject\": \"Name\", \"Condition\": \"Grade\", \n"
+    "  \"Surface & Strike Quality\": \"Notes\", \"Grading Service\": \"Name\", \"Grading Cert #\": \"Num\", \n"
+    "  \"Cost\": \"$0.00\", \"Purchase Date\": \"Date\", \"Retailer/Website\": \"Name\", \"Retailer Invoice #\": \"String\", \n"
+    "  \"Retailer Item No.\": \"String\", \n"
+    "  \"Metal Content\": \"Composition\", \"Melt Value\": \"Pending\", \"Personal Notes\": \"Notes\", \n"
+    "  \"Personal Ref #\": \"Num\", \"AI Estimated Value\": \"Pending\", \"inventoryStatus\": \"UNCHECKED\", \"Storage Location\": \"\" }"
+)
+
+def system_prompt(invoice_text=None):
+    """Rules + slang dictionary; with invoice_text, only the entries whose terms appear in it."""
+    entries = COIN_DICTIONARY
+    if invoice_text is not None:
+        low = invoice_text.lower()
+        entries = [e for e in COIN_DICTIONARY if any(t in low for t in [e["formal"].lower()] + e["slang"])]
+    if not entries: return PROMPT_RULES
+    return PROMPT_RULES + f"\n\nIMPORTANT: Use this dictionary to map slang to formal coin names: {json.dumps(entries)}"
+
+SYSTEM_PROMPT = system_prompt()
+
+# Cached extractions are only reused when made by the same prompt + filter + schema + model
+EXTRACTION_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + FILTER_VERSION + json.dumps(INVOICE_ITEMS_SCHEMA, sort_keys=True) + DEFAULT_MODEL_NAME).encode("utf-8")
+).hexdigest()[:12]
+
+
+# --- OCR (ONLINE) ---
+def process_invoice(file_content, client=None):
+    # Processor ID: c113e9bb62be1554 (shared client from the registry unless one is injected)
+    client = client or get_docai(DOCAI_LOCATION)
+    name = client.processor_path(PROJECT_ID, DOCAI_LOCATION, DOCAI_PROCESSOR_ID)
+    raw_document = documentai.RawDocument(content=file_content, mime_type="application/pdf")
+    request = documentai.ProcessRequest(name=name, raw_document=raw_document)
+    result = client.process_document(request=request)
+    return result.document
+
+
+# --- OCR (BATCH) ---
+def _gcs_uri(bucket, name):
+    return f"gs://{bucket.name}/{name}"
+
+def _blob_name(bucket, uri):
+    return uri.split(f"gs://{bucket.name}/", 1)[-1]
+
+def load_batch_document(bucket, dest_uri):
+    """Reads the sharded Document JSON a batch job wrote for one input file."""
+    shards = [
+        documentai.Document.from_json(b.download_as_bytes(), ignore_unknown_fields=True)
+        for b in bucket.list_blobs(prefix=_blob_name(bucket, dest_uri).rstrip('/') + '/')
+        if b.name.endswith('.json')
+    ]
+    if not shards: raise ValueError(f"No batch output at {dest_uri}")
+    if len(shards) == 1: return shards[0]
+    # Layout anchors are shard-relative, so only the text is merged
+    shards.sort(key=lambda d: d.shard_info.shard_index)
+    return documentai.Document(text="".join(d.text for d in shards))
+
+def batch_ocr(bucket, blobs, client=None, poll_seconds=BATCH_POLL_SECONDS, timeout=BATCH_TIMEOUT, progress_cb=None):
+    """
+    OCRs queued blobs with one asynchronous DocAI batch job and returns
+    {blob name: Document}. Files the job failed on are simply absent, so the
+    caller can fall back to the online path for them. The job's output under
+    BATCH_OUTPUT_PREFIX is deleted once read (or when the job fails); callers
+    keep what they need in the content-hash cache.
+    """
+    client = client or get_docai(DOCAI_LOCATION)
+    out_prefix = f"{BATCH_OUTPUT_PREFIX}{uuid.uuid4().hex[:12]}/"
+    out_uri = _gcs_uri(bucket, out_prefix)
+    request = documentai.BatchProcessRequest(
+        name=client.processor_path(PROJECT_ID, DOCAI_LOCATION, DOCAI_PROCESSOR_ID),
+        input_documents=documentai.BatchDocumentsInputConfig(gcs_documents=documentai.GcsDocuments(documents=[
+            documentai.GcsDocument(gcs_uri=_gcs_uri(bucket, b.name), mime_type="application/pdf") for b in blobs
+        ])),
+        document_output_config=documentai.DocumentOutputConfig(
+            gcs_output_config=documentai.DocumentOutputConfig.GcsOutputConfig(gcs_uri=out_uri)),
+    )
+    operation = client.batch_process_documents(request=request)
+    try:
+        start = time.time()
+        while not operation.done():
+            elapsed = time.time() - start
+            if elapsed > timeout:
+                _cancel(operation)  # or it keeps writing output after the cleanup below
+                raise TimeoutError(f"DocAI batch job exceeded {timeout}s")
+            if progress_cb: progress_cb(elapsed)
+            time.sleep(poll_seconds)
+
+        names = {_gcs_uri(bucket, b.name): b.name for b in blobs}
+        docs = {}
+        for status in operation.metadata.individual_process_statuses:
+            name = names.get(status.input_gcs_source)
+            if name is None: continue
+            if status.status.code != 0:
+                print(f"DocAI Batch Error ({name}): {status.status.message}")
+                continue
+            try:
+                docs[name] = load_batch_document(bucket, status.output_gcs_destination)
+            except Exception as e:
+                print(f"DocAI Batch Output Error ({name}): {e}")
+        return docs
+    finally:
+        delete_prefix(bucket, out_prefix)
+
+def _cancel(operation):
+    try:
+        operation.cancel()
+    except Exception as e:
+        print(f"DocAI Batch Cancel Error: {e}")
+
+def delete_prefix(bucket, prefix):
+    """Deletes every blob under prefix; returns how many were deleted."""
+    deleted = 0
+    try:
+        for b in bucket.list_blobs(prefix=prefix):
+            b.delete()
+            deleted += 1
+    except Exception as e:
+        print(f"Batch Output Cleanup Error ({prefix}): {e}")
+    return deleted
+
+
+# --- CHUNKING ---
+_chunk_pool = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix="chunk")
+
+def page_texts(doc):
+    """Per-page text from the DocAI layout anchors; the whole text if there is no layout."""
+    pages = []
+    for page in doc.pages:
+        segs = page.layout.text_anchor.text_segments
+        if segs: pages.append("".join(doc.text[int(s.start_index):int(s.end_index)] for s in segs))
+    return pages or [doc.text]
+
+def _split_lines(text, max_chars):
+    pieces, cur = [], ""
+    for line in text.splitlines(keepends=True):
+        if cur and len(cur) + len(line) > max_chars:
+            pieces.append(cur); cur = ""
+        cur += line
+    if cur: pieces.append(cur)
+    return pieces
+
+def chunk_document(doc, max_chars=CHUNK_CHARS, pages=None):
+    """Groups whole pages into chunks of ~max_chars (an oversized page is split on line breaks)."""
+    units = []
+    for page in (pages if pages is not None else page_texts(doc)):
+        units.extend([page] if len(page) <= max_chars else _split_lines(page, max_chars))
+    chunks, cur = [], ""
+    for unit in units:
+        if cur and len(cur) + len(unit) > max_chars:
+            chunks.append(cur); cur = ""
+        cur += unit
+    if cur: chunks.append(cur)
+    return chunks or [""]
+
+def _chunk_prompt(chunks, i):
+    if len(chunks) == 1: return f"Invoice Text: {chunks[0]}"
+    parts = []
+    if i > 0:
+        parts.append(f"Invoice Header (page 1 - use ONLY for Retailer/Website, Retailer Invoice # and Purchase Date, do not extract its items):\n{chunks[0][:HEADER_CHARS]}")
+        tail = "".join(chunks[i - 1].splitlines(keepends=True)[-CONTEXT_LINES:])
+        parts.append(f"Previous Lines (context only - already extracted, do not extract):\n{tail}")
+    parts.append(f"Invoice Text (part {i + 1} of {len(chunks)} - extract items from this section only): {chunks[i]}")
+    return "\n\n".join(parts)
+
+
+# --- MERGE ---
+def _norm(val):
+    return str(val or "").strip().lower()
+
+def _item_key(item):
+    return "|".join(_norm(item.get(f)) for f in ("Retailer Item No.", "Year", "Mint Mark", "Denomination", "Condition", "Cost"))
+
+def _dedupe_chunks(chunk_items):
+    """
+    Yields each chunk's items (in page order) minus the copies a row
+    straddling a chunk boundary produces: the same grading cert anywhere, or
+    an identical SKU line at the edge of two adjacent chunks.
+    """
+    certs = set()
+    prev_last = None
+    for items in chunk_items:
+        kept = []
+        for pos, item in enumerate(items):
+            cert = _norm(item.get("Grading Cert #"))
+            if cert and cert in certs: continue
+            # Boundary duplicate: same SKU line ending one chunk and starting the next
+            if pos == 0 and _norm(item.get("Retailer Item No.")) and _item_key(item) == prev_last: continue
+            if cert: certs.add(cert)
+            kept.append(item)
+        if items: prev_last = _item_key(items[-1])
+        yield kept
+
+def merge_chunk_items(chunk_items):
+    merged = [item for kept in _dedupe_chunks(chunk_items) for item in kept]
+    return fill_header_fields(merged)
+
+def fill_header_fields(items):
+    """Propagates the most common retailer / invoice # / date to items lacking them."""
+    for field in HEADER_FIELDS:
+        values = [str(i.get(field)).strip() for i in items if _norm(i.get(field)) not in ("", "none", "null")]
+        if not values: continue
+        common = max(set(values), key=values.count)
+        for item in items:
+            if _norm(item.get(field)) in ("", "none", "null"): item[field] = common
+    return items
+
+
+# --- PRE-FILTER ---
+def prepare_document(doc, user=None):
+    """
+    Trims an OCR'd invoice to its header + line items (see invoice_prefilter)
+    and picks the dictionary entries it needs. Estimated prompt tokens before
+    and after are logged per invoice and returned with the filtered pages.
+    """
+    pages, method = filter_document(doc)
+    prompt = system_prompt("".join(pages))
+    before = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(doc.text)
+    after = estimate_tokens(prompt) + sum(estimate_tokens(p) for p in pages)
+    record_prompt_trim("invoice_extraction", before, after, user=user, detail=method)
+    return {"pages": pages, "system_prompt": prompt, "method": method, "tokens_before": before, "tokens_after": after}
+
+
+# --- EXTRACTION ---
+def extract_items(invoice_prompt, model, user=None, system=SYSTEM_PROMPT):
+    resp = call_model("invoice_extraction", [system, invoice_prompt], model=model, user=user,
+                      generation_config=json_config(INVOICE_ITEMS_SCHEMA))
+    # Tolerant parse - salvages complete items from a truncated list
+    return parse_model_json(resp.text, "invoice_extraction", expect=list)
+
+def extract_document_items(doc, model, user=None, max_chars=CHUNK_CHARS, prepared=None):
+    """
+    Short invoices: one call. Long ones: page chunks extracted concurrently
+    (latency ~ the largest chunk, and no single response hits the output
+    token limit), then merged in page order. The text is pre-filtered first
+    unless a prepare_document() result is passed in.
+    """
+    prepared = prepared or prepare_document(doc, user=user)
+    system = prepared["system_prompt"]
+    chunks = chunk_document(doc, max_chars, pages=prepared["pages"])
+    if len(chunks) == 1: return extract_items(_chunk_prompt(chunks, 0), model, user=user, system=system)
+    futures = [_chunk_pool.submit(extract_items, _chunk_prompt(chunks, i), model, user, system) for i in range(len(chunks))]
+    return merge_chunk_items([f.result() for f in futures])
+
+def stream_items(invoice_prompt, model, user=None, system=SYSTEM_PROMPT):
+    """Streams the model response and yields lists of items as each object completes."""
+    parser = JsonObjectStream()
+    found = False
+    stream = call_model("invoice_extraction", [system, invoice_prompt], model=model, user=user,
+                        generation_config=json_config(INVOICE_ITEMS_SCHEMA), stream=True)
+    for chunk in stream:
+        try:
+            text = chunk.text
+        except (ValueError, AttributeError):
+            continue  # e.g. the final chunk carrying only usage / finish reason
+        items = parser.feed(text)
+        if items:
+            found = True
+            yield items
+    if not found and parser.text.strip():
+        # Nothing object-shaped streamed; let the tolerant parser decide (records the failure)
+        yield parse_model_json(parser.text, "invoice_extraction", expect=list)
+
+def stream_document_items(doc, model, user=None, max_chars=CHUNK_CHARS):
+    """
+    Streaming counterpart of extract_document_items. Single-chunk invoices
+    yield items as the model writes them; long ones run their chunks
+    concurrently and yield each chunk's items in page order as it completes.
+    Header fields are not filled in (call fill_header_fields on the result).
+    """
+    prepared = prepare_document(doc, user=user)
+    system = prepared["system_prompt"]
+    chunks = chunk_document(doc, max_chars, pages=prepared["pages"])
+    if len(chunks) == 1:
+        for items in stream_items(_chunk_prompt(chunks, 0), model, user=user, system=system):
+            yield items
+        return
+    futures = [_chunk_pool.submit(extract_items, _chunk_prompt(chunks, i), model, user, system) for i in range(len(chunks))]
+    for kept in _dedupe_chunks(f.result() for f in futures):
+        if kept: yield kept
+
+def stream_invoice_data(file_bytes, model, user=None, bucket=None):
+    """
+    Streaming counterpart of extract_invoice_data: yields lists of new items.
+    A cache hit yields everything at once; a completed stream is cached.
+    """
+    sha = content_hash(file_bytes)
+    if bucket is not None:
+        items = get_cached_items(bucket, sha, EXTRACTION_VERSION)
+        if items is not None:
+            yield items
+            return
+    doc = ocr_document(file_bytes, bucket, sha=sha)
+    collected = []
+    for items in stream_document_items(doc, model, user=user):
+        collected.extend(copy.deepcopy(items))  # callers annotate the yielded dicts
+        yield items
+    if bucket is not None:
+        put_cached_items(bucket, sha, EXTRACTION_VERSION, fill_header_fields(collected), DEFAULT_MODEL_NAME)
+
+def ocr_document(file_bytes, bucket=None, client=None, sha=None):
+    """
+    Digital PDFs: the local text layer. Scans: DocAI OCR, served from the
+    content-hash cache when bucket is given.
+    """
+    doc = text_layer_document(file_bytes)
+    if doc is not None: return doc
+    if bucket is None: return process_invoice(file_bytes, client=client)
+    sha = sha or content_hash(file_bytes)
+    doc = get_cached_document(bucket, sha)
+    if doc is None:
+        doc = process_invoice(file_bytes, client=client)
+        put_cached_document(bucket, sha, doc)
+    return doc
+
+def extract_invoice_data(file_bytes, model, user=None, bucket=None):
+    """
+    Helper to run DocAI OCR + Gemini Extraction and return raw items list.
+    With a bucket, results are cached by content hash and a hit skips both calls.
+    """
+    if bucket is None:
+        return extract_document_items(ocr_document(file_bytes), model, user=user)
+    sha = content_hash(file_bytes)
+    items = get_cached_items(bucket, sha, EXTRACTION_VERSION)
+    if items is None:
+        items = extract_document_items(ocr_document(file_bytes, bucket, sha=sha), model, user=user)
+        put_cached_items(bucket, sha, EXTRACTION_VERSION, items, DEFAULT_MODEL_NAME)
+    return items
+
+
+# --- ROUTING ---
+def route_items(items, filename, id_prefix=None):
+    """
+    Splits extracted items into (process, review, holding) lists:
+    confident US coins go straight to the vault, unsure ones to the review
+    queue, paper/foreign currency to staging. Supplies are dropped.
+    With id_prefix, ids are deterministic (prefix + position) so a retried
+    commit overwrites its own documents instead of duplicating them.
+    """
+    process_list = []
+    holding_list = []
+    review_queue_list = []
+    for pos, item in enumerate(items):
+        cat = item.get('category', 'US Coin')
+        item['id'] = f"{id_prefix}-{pos:04d}" if id_prefix else str(uuid.uuid4())
+        item['source_file'] = filename # Link to GCS file
+
+        if cat == 'US Coin':
+            conf = item.get('confidence_score', 0.0) or 0.0
+            needs_review = item.get('needs_manual_review', True)
+
+            if conf >= AUTO_IMPORT_CONFIDENCE and not needs_review:
+                for col in DISPLAY_ORDER:
+                    if col not in item: item[col] = ""
+                process_list.append(item)
+            else:
+                item['review_reason'] = f"Low Confidence ({conf})" if conf < AUTO_IMPORT_CONFIDENCE else "Flagged by AI"
+                review_queue_list.append(item)
+
+        elif cat in ['Paper Currency', 'Foreign Currency']:
+            holding_list.append(item)
+    return process_list, review_queue_list, holding_list
+
+def route_duplicates(db, user_email, process_list, review_queue_list):
+    """
+    Moves items that match a vault coin (exact key, or a near duplicate at
+    NEAR_LIKELY confidence; persistent key index, no vault read) from
+    process_list to the review queue. Items whose document already exists
+    are this invoice's own earlier commit, not duplicates.
+    Returns (process_list, review_queue_list, n duplicates).
+    """
+    if db is None or not process_list: return process_list, review_queue_list, 0
+    index = load_index(db, user_email)
+    if index.empty: return process_list, review_queue_list, 0
+    main_ref = db.collection(f"users/{user_email}/coins")
+    committed = {snap.id for snap in db.get_all([main_ref.document(i['id']) for i in process_list]) if snap.exists}
+    candidates = [i for i in process_list if i['id'] not in committed]
+    if not candidates: return process_list, review_queue_list, 0
+    flagged = identify_duplicates(normalize_coin_data(pd.DataFrame(copy.deepcopy(candidates))), index=index)
+    flagged = annotate_near_duplicates(flagged, index=index)
+    reasons = {}
+    for item, status, why, near, near_why in zip(candidates, flagged['Status'], flagged['Duplicate Check Key'],
+                                                 flagged['Near Confidence'], flagged['Near Duplicate']):
+        if status == 'DUPLICATE':
+            reasons[item['id']] = "Possible Duplicate (invoice item)" if "[MATCH: INV]" in why else "Possible Duplicate"
+        elif near >= NEAR_LIKELY:
+            reasons[item['id']] = f"Possible Duplicate ({near_why})"
+    keep = []
+    for item in process_list:
+        if item['id'] in reasons:
+            item['review_reason'] = reasons[item['id']]
+            review_queue_list.append(item)
+        else:
+            keep.append(item)
+    return keep, review_queue_list, len(reasons)
+
+def commit_routed(db, user_email, process_list, review_queue_list, holding_list):
+    # Every document is written under its item id, so re-running a commit is idempotent
+    process_list, review_queue_list, dupes = route_duplicates(db, user_email, process_list, review_queue_list)
+    writes = []
+
+    # A. Staging (Paper/Foreign)
+    for h_item in holding_list:
+        h_item['user_email'] = user_email
+        writes.append((db.collection('staging_area').document(h_item['id']), h_item))
+
+    # B. Review Queue
+    for r_item in review_queue_list:
+        r_item['user_email'] = user_email
+        writes.append((db.collection('review_queue').document(r_item['id']), r_item))
+
+    # C. Main Collection (High Confidence)
+    main_ref = db.collection(f"users/{user_email}/coins")
+    for p_item in process_list:
+        if 'deep_dive_status' not in p_item: p_item['deep_dive_status'] = "PENDING"
+        writes.append((main_ref.document(p_item['id']), p_item))
+
+    for start in range(0, len(writes), COMMIT_BATCH_SIZE):
+        batch = db.batch()
+        for ref, data in writes[start:start + COMMIT_BATCH_SIZE]:
+            data['created_at'] = firestore.SERVER_TIMESTAMP
+            batch.set(ref, data)
+        if start + COMMIT_BATCH_SIZE >= len(writes) and process_list:
+            stage_index_writes(batch, db, user_email, process_list)  # duplicate-key index, with the last batch
+        batch.commit()
+    msg = f"Imported {len(process_list)}, Review {len(review_queue_list)}, Staged {len(holding_list)}"
+    return msg + (f" ({dupes} possible duplicates sent to review)" if dupes else "")
+
+
+# --- JOB CHECKPOINTS (invoice_jobs/{job id}) ---
+def job_id(user_email, sha):
+    return hashlib.sha256(f"{user_email}|{sha}".encode("utf-8")).hexdigest()[:32]
+
+def load_job(db, jid):
+    if db is None or not jid: return {}
+    try:
+        snap = db.collection(JOB_COLLECTION).document(jid).get()
+        return (snap.to_dict() or {}) if snap.exists else {}
+    except Exception as e:
+        print(f"Job Load Error ({jid}): {e}")
+        return {}
+
+def checkpoint(db, jid, stage=None, **fields):
+    """
+    Records that a job completed `stage` (queued -> ocr_done -> extracted ->
+    committed -> archived). The artifacts each stage needs to resume (OCR
+    document, extracted items) live in the content-hash cache.
+    """
+    if db is None or not jid: return
+    data = dict(fields, updated_at=datetime.now().isoformat())
+    if stage: data['stage'] = stage
+    try:
+        db.collection(JOB_COLLECTION).document(jid).set(data, merge=True)
+    except Exception as e:
+        print(f"Job Checkpoint Error ({jid}): {e}")
+
+def record_upload(db, user_email, sha, filename):
+    # Stage stays unset until a worker picks the file up, so the duplicate check still runs
+    checkpoint(db, job_id(user_email, sha), filename=filename, sha=sha, user_email=user_email,
+               uploaded_at=datetime.now().isoformat())
+
+def upload_feed(db, user_email, limit=50):
+    """
+    The user's most recent invoice jobs with a display status, newest first.
+    Reads at most `limit` documents (composite index user_email + updated_at
+    desc, see firestore.indexes.json), however long the user's history is.
+    """
+    try:
+        query = (db.collection(JOB_COLLECTION).where("user_email", "==", user_email)
+                 .order_by("updated_at", direction=firestore.Query.DESCENDING).limit(limit))
+        jobs = [d.to_dict() for d in query.stream()]
+    except Exception as e:
+        print(f"Upload Feed Error: {e}")
+        return []
+    feed = []
+    for job in jobs:
+        stage = job.get('stage')
+        if job.get('note'): status = "Duplicate"
+        elif stage in ("committed", "archived"): status = "Imported"
+        elif job.get('error'): status = "Failed" if job.get('attempts', 0) >= MAX_ATTEMPTS else "Retrying"
+        else: status = {None: "Uploaded", "queued": "Queued", "ocr_done": "Reading", "extracted": "Importing"}.get(stage, stage)
+        feed.append({
+            "file": (job.get('filename') or "").split('/')[-1],
+            "status": status,
+            "detail": job.get('note') or job.get('summary') or job.get('error') or "",
+            "updated": (job.get('updated_at') or "")[:19].replace("T", " "),
+        })
+    return feed
+
+def feed_active(feed):
+    """True while any upload in the feed is still being worked on."""
+    return any(item["status"] in ACTIVE_STATUSES for item in feed)
+
+def process_invoice_workflow(file_bytes, filename, user_email, db, model, bucket=None):
+    """One invoice through the same checkpoints as BatchRun (a half-finished job resumes)."""
+    try:
+        sha = content_hash(file_bytes)
+        jid = job_id(user_email, sha)
+        stage = load_job(db, jid).get('stage')
+        if stage in ("committed", "archived") or (stage is None and previous_import(db, sha, user_email)):
+            return True, "Already imported"
+        if stage is None: checkpoint(db, jid, "queued", filename=filename, sha=sha, user_email=user_email, attempts=0)
+        items = extract_invoice_data(file_bytes, model, user=user_email, bucket=bucket)
+        checkpoint(db, jid, "extracted", items=len(items))
+        msg = commit_routed(db, user_email, *route_items(items, filename, id_prefix=jid[:16]))
+        checkpoint(db, jid, "committed", summary=msg)
+        mark_imported(db, sha, user_email, filename, msg)
+        return True, msg
+    except Exception as e:
+        return False, str(e)
+
+
+# --- GCS QUEUE ---
+def list_queue(bucket, prefix=QUEUE_PREFIX):
+    try:
+        # Filter out the folder itself if returned
+        return [b for b in bucket.list_blobs(prefix=prefix) if not b.name.endswith('/')]
+    except Exception as e:
+        print(f"Queue List Error: {e}")
+        return []
+
+def queue_owner(blob):
+    """Email of the user who uploaded a queued blob ("uploader" metadata), or None for files dropped in directly."""
+    return (getattr(blob, "metadata", None) or {}).get("uploader")
+
+def archive_blob(bucket, blob, dest_prefix):
+    try:
+        bucket.rename_blob(blob, dest_prefix + blob.name.split('/')[-1])
+    except Exception as e:
+        print(f"Move Error: {e}")
+
+
+# --- BATCH ENGINE ---
+class BatchRun:
+    """
+    One drain of the invoice queue. run() blocks (headless use); start()
+    runs it on a daemon thread so it outlives Streamlit reruns and closed tabs.
+    Poll snapshot() for per-file status, throughput and ETA.
+    Only the user's own uploads are taken (plus files with no uploader, e.g.
+    copied into the queue by hand): everything is committed to this user's vault.
+    With names, only those queued blobs are processed (no listing) - used by
+    event-driven ingestion. Files are leased before any work (invoice_leases),
+    so concurrent runs on any node split the queue instead of repeating it.
+    """
+
+    def __init__(self, bucket, db, model, user_email, prefix=QUEUE_PREFIX,
+                 ocr_workers=OCR_WORKERS, extract_workers=EXTRACT_WORKERS, prefetch=PREFETCH,
+                 docai_client=None, batch_ocr_min=BATCH_OCR_MIN_FILES, batch_poll_seconds=BATCH_POLL_SECONDS,
+                 names=None):
+        self.bucket = bucket
+        self.db = db
+        self.model = model
+        self.user_email = user_email
+        self.prefix = prefix
+        self.ocr_workers = ocr_workers
+        self.extract_workers = extract_workers
+        self.prefetch = prefetch
+        self.docai_client = docai_client
+        self.batch_ocr_min = batch_ocr_min
+        self.batch_poll_seconds = batch_poll_seconds
+        self.names = names
+        self.leases = LeaseManager(db)
+
+        self.files = {}  # blob name -> {"status", "message", "started", "finished"}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- control ---
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"batch-{self.user_email}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # In-flight invoices finish; nothing new is started
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self.started_at is not None and self.finished_at is None
+
+    # --- status ---
+    def _set(self, name, status, message=""):
+        with self._lock:
+            entry = self.files.setdefault(name, {"status": "queued", "message": "", "started": None, "finished": None})
+            entry["status"] = status
+            entry["message"] = message
+            if status in ("ocr", "batch_ocr") and entry["started"] is None: entry["started"] = time.time()
+            if status in ("done", "failed", "retry", "duplicate"): entry["finished"] = time.time()
+        if status in ("done", "failed", "retry", "duplicate", "handed_off"): self.leases.release(name)
+
+    def snapshot(self):
+        with self._lock:
+            files = [dict(v, name=k) for k, v in self.files.items()]
+        total = len(files)
+        done = sum(1 for f in files if f["status"] == "done")
+        failed = sum(1 for f in files if f["status"] == "failed")
+        retrying = sum(1 for f in files if f["status"] == "retry")
+        duplicates = sum(1 for f in files if f["status"] == "duplicate")
+        finished = done + failed + retrying + duplicates
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        remaining = total - finished
+        return {
+            "running": self.running,
+            "stopping": self._stop.is_set() and self.running,
+            "total": total, "done": done, "failed": failed, "retrying": retrying, "duplicates": duplicates, "finished": finished,
+            "cache_hits": sum(1 for f in files if f.get("cached")),
+            "text_layer": sum(1 for f in files if f.get("source") == "text_layer"),
+            "tokens_before": sum(f.get("tokens_before", 0) for f in files),
+            "tokens_after": sum(f.get("tokens_after", 0) for f in files),
+            "in_flight": sum(1 for f in files if f["status"] in ("ocr", "batch_ocr", "extracting")),
+            "handed_off": sum(1 for f in files if f["status"] == "handed_off"),
+            "elapsed_s": round(elapsed, 1),
+            "per_minute": round(rate * 60, 2),
+            "eta_s": round(remaining / rate, 1) if rate > 0 and remaining else None,
+            "files": files,
+        }
+
+    # --- stages ---
+    def _lookup(self, blob):
+        """
+        Decides where a file resumes, before any remote OCR/model call:
+        archived (or imported before) -> duplicate; committed -> only the
+        archive move is left; otherwise cached items / OCR let later stages
+        skip Gemini and/or DocAI. Returns a plan dict or None when finished.
+        """
+        content = None
+        try:
+            if not (getattr(blob, "metadata", None) or {}).get("sha256"):
+                content = blob.download_as_bytes()  # older blob without a recorded hash: one download serves every stage
+            sha = content_hash(content) if content is not None else blob_hash(blob)
+            jid = job_id(self.user_email, sha)
+            job = load_job(self.db, jid)
+            stage = job.get('stage')
+
+            prev = previous_import(self.db, sha, self.user_email) if self.db is not None and stage in (None, "archived") else None
+            if stage == "archived" or prev:
+                prev = prev or job
+                archive_blob(self.bucket, blob, PROCESSED_PREFIX)
+                checkpoint(self.db, jid, "archived", note=f"Duplicate of {(prev.get('filename') or '').split('/')[-1]}")
+                self._set(blob.name, "duplicate", f"Already imported ({prev.get('filename')}, {(prev.get('imported_at') or prev.get('updated_at', ''))[:10]})")
+                return None
+            if stage == "committed":
+                # Crashed between commit and archive: coins are in, only the move is left
+                archive_blob(self.bucket, blob, PROCESSED_PREFIX)
+                checkpoint(self.db, jid, "archived")
+                self._set(blob.name, "done", f"{job.get('summary', '')} (resumed: archived)")
+                return None
+            if stage is None:
+                checkpoint(self.db, jid, "queued", filename=blob.name, sha=sha, user_email=self.user_email, attempts=0)
+
+            items = get_cached_items(self.bucket, sha, EXTRACTION_VERSION)
+            doc = cached = None
+            if items is None:
+                # Digital PDFs are read locally and never reach DocAI (batch or online)
+                if content is None: content = blob.download_as_bytes()
+                doc = text_layer_document(content)
+                if doc is None: doc = cached = get_cached_document(self.bucket, sha)
+            with self._lock:
+                entry = self.files[blob.name]
+                if items is not None or cached is not None: entry["cached"] = "items" if items is not None else "ocr"
+                if doc is not None and cached is None: entry["source"] = "text_layer"
+            # The downloaded bytes ride along only when online OCR still needs them
+            return {"sha": sha, "jid": jid, "attempts": job.get('attempts', 0), "items": items, "doc": doc,
+                    "content": content if doc is None else None}
+        except Exception as e:
+            print(f"Cache Lookup Error ({blob.name}): {e}")
+            return {"sha": None, "jid": None, "attempts": 0, "items": None, "doc": None}
+
+    def _ocr_stage(self, blob, plan, extract_pool, slots):
+        try:
+            content = plan.pop("content", None) or blob.download_as_bytes()
+            plan["sha"] = plan["sha"] or content_hash(content)
+            plan["jid"] = plan["jid"] or job_id(self.user_email, plan["sha"])
+            plan["doc"] = ocr_document(content, self.bucket, client=self.docai_client, sha=plan["sha"])
+            checkpoint(self.db, plan["jid"], "ocr_done")
+        except Exception as e:
+            self._fail(blob, plan, f"OCR: {e}")
+            slots.release()
+            return None
+        self._set(blob.name, "extracting")
+        return extract_pool.submit(self._extract_stage, blob, plan, slots)
+
+    def _extract_stage(self, blob, plan, slots):
+        try:
+            items = plan["items"]
+            if items is None:
+                prepared = prepare_document(plan["doc"], user=self.user_email)
+                with self._lock:
+                    self.files[blob.name].update(tokens_before=prepared["tokens_before"], tokens_after=prepared["tokens_after"])
+                items = extract_document_items(plan["doc"], self.model, user=self.user_email, prepared=prepared)
+                put_cached_items(self.bucket, plan["sha"], EXTRACTION_VERSION, items, DEFAULT_MODEL_NAME)
+                checkpoint(self.db, plan["jid"], "extracted", items=len(items))
+            id_prefix = plan["jid"][:16] if plan["jid"] else None
+            self.leases.verify(blob.name)  # fencing: don't commit a file another worker has taken over
+            msg = commit_routed(self.db, self.user_email, *route_items(items, blob.name, id_prefix=id_prefix))
+            checkpoint(self.db, plan["jid"], "committed", summary=msg)
+            mark_imported(self.db, plan["sha"], self.user_email, blob.name, msg)
+            archive_blob(self.bucket, blob, PROCESSED_PREFIX)
+            checkpoint(self.db, plan["jid"], "archived")
+            note = " (cached)" if plan["items"] is not None else f" (~{prepared['tokens_before']:,} -> {prepared['tokens_after']:,} prompt tokens)"
+            self._set(blob.name, "done", msg + note)
+        except LeaseLost as e:
+            self._set(blob.name, "handed_off", str(e))
+        except Exception as e:
+            self._fail(blob, plan, str(e))
+        finally:
+            slots.release()
+
+    def _batch_ocr_pass(self, blobs, plans):
+        for blob in blobs:
+            self._set(blob.name, "batch_ocr")
+        try:
+            docs = batch_ocr(self.bucket, blobs, client=self.docai_client, poll_seconds=self.batch_poll_seconds)
+        except Exception as e:
+            # Whole job failed - every file falls back to online OCR
+            print(f"DocAI Batch Job Error: {e}")
+            return {}
+        for name, doc in docs.items():
+            put_cached_document(self.bucket, plans[name]["sha"], doc)
+            checkpoint(self.db, plans[name]["jid"], "ocr_done")
+        return docs
+
+    def _owns(self, blob):
+        return queue_owner(blob) in (None, self.user_email)
+
+    def _pending(self):
+        with self._lock:
+            seen = set(self.files)
+        if self.names is None:
+            return [b for b in list_queue(self.bucket, self.prefix) if b.name not in seen and self._owns(b)]
+        # get_blob loads metadata (sha256, uploader) and is None once a file has left the queue
+        blobs = [self.bucket.get_blob(n) for n in dict.fromkeys(self.names) if n not in seen]
+        return [b for b in blobs if b is not None and self._owns(b)]
+
+    def _claim_some(self, blobs):
+        """
+        Leases up to one pass worth of files (enough to fill the pools or a DocAI
+        batch job), starting at a random offset so concurrent workers spread over
+        the queue. Files leased elsewhere are left to their holder.
+        """
+        limit = max(self.batch_ocr_min or 0, self.extract_workers + self.prefetch)
+        start = random.randrange(len(blobs)) if blobs else 0
+        claimed = []
+        for blob in blobs[start:] + blobs[:start]:
+            if len(claimed) >= limit: break
+            if not self._owns(blob) or not self.leases.claim(blob.name): continue
+            if blob.exists(): claimed.append(blob)
+            else: self.leases.release(blob.name)  # finished by another worker since the listing
+        return claimed
+
+    def _fail(self, blob, plan, message):
+        # Completed stages stay checkpointed; the file stays queued until MAX_ATTEMPTS
+        attempts = plan["attempts"] + 1
+        checkpoint(self.db, plan["jid"], attempts=attempts, error=message[:500])
+        if attempts >= MAX_ATTEMPTS or not plan["jid"]:
+            archive_blob(self.bucket, blob, FAILED_PREFIX)
+            self._set(blob.name, "failed", message)
+        else:
+            self._set(blob.name, "retry", f"{message} (attempt {attempts}/{MAX_ATTEMPTS}, resumes next run)")
+
+    def run(self):
+        self.started_at = time.time()
+        # Caps OCR'd-but-unextracted documents; OCR runs ahead by at most `prefetch`
+        slots = threading.BoundedSemaphore(self.extract_workers + self.prefetch)
+        ocr_pool = ThreadPoolExecutor(max_workers=self.ocr_workers, thread_name_prefix="ocr")
+        extract_pool = ThreadPoolExecutor(max_workers=self.extract_workers, thread_name_prefix="extract")
+        futures = []
+        self.leases.start()
+        try:
+            # One listing per pass (not per file); a later pass picks up files uploaded meanwhile
+            while not self._stop.is_set():
+                blobs = self._pending()
+                blobs = self._claim_some(blobs)
+                if not blobs: break
+                for blob in blobs:
+                    self._set(blob.name, "queued")
+                # Hash / cache lookups run concurrently on the OCR pool
+                plans = dict(zip([b.name for b in blobs], ocr_pool.map(self._lookup, blobs)))
+                blobs = [b for b in blobs if plans[b.name] is not None]
+                need_ocr = [b for b in blobs if plans[b.name]["items"] is None and plans[b.name]["doc"] is None]
+                if self.batch_ocr_min and len(need_ocr) >= self.batch_ocr_min:
+                    for name, doc in self._batch_ocr_pass(need_ocr, plans).items():
+                        plans[name]["doc"] = doc
+                        plans[name]["content"] = None  # batch OCR read the file from GCS
+                for blob in blobs:
+                    while not slots.acquire(timeout=0.5):
+                        if self._stop.is_set(): break
+                    if self._stop.is_set(): break
+                    plan = plans[blob.name]
+                    if plan["items"] is not None or plan["doc"] is not None:
+                        self._set(blob.name, "extracting")
+                        futures.append(extract_pool.submit(self._extract_stage, blob, plan, slots))
+                    else:
+                        self._set(blob.name, "ocr")
+                        futures.append(ocr_pool.submit(self._ocr_stage, blob, plan, extract_pool, slots))
+                # Wait for this pass before re-listing so in-flight files aren't picked up twice
+                for f in futures:
+                    while f is not None: f = f.result()  # OCR futures resolve to their extraction future
+                futures = []
+        except Exception as e:
+            print(f"Batch Run Error: {e}")
+        finally:
+            ocr_pool.shutdown(wait=True)
+            extract_pool.shutdown(wait=True)
+            self.leases.stop()
+            with self._lock:
+                for entry in self.files.values():
+                    if entry["status"] == "queued": entry["status"] = "skipped"
+            self.finished_at = time.time()
+        return self.snapshot()
+
+
+# --- RUN REGISTRY (one live run per user, shared across sessions) ---
+_runs_lock = threading.Lock()
+_runs = {}
+
+def start_batch(bucket, db, model, user_email, **kwargs):
+    with _runs_lock:
+        run = _runs.get(user_email)
+        if run is None or not run.running:
+            run = BatchRun(bucket, db, model, user_email, **kwargs).start()
+            _runs[user_email] = run
+        return run
+
+def get_batch(user_email):
+    with _runs_lock:
+        return _runs.get(user_email)
+
+
+if __name__ == "__main__":
+    from gcp_clients import get_bucket, get_firestore, get_model
+
+    if len(sys.argv) < 2:
+        print("usage: python invoice_pipeline.py <user_email>")
+        sys.exit(1)
+    run = BatchRun(get_bucket(), get_firestore(), get_model(), sys.argv[1])
+    run.start()
+    while run.running or run.started_at is None:
+        time.sleep(5)
+        s = run.snapshot()
+        print(f"  {s['finished']}/{s['total']} done ({s['failed']} failed) | {s['per_minute']}/min | ETA {s['eta_s']}s")
+    for f in run.snapshot()["files"]:
+        print(f"{f['status']:>9}  {f['name']}  {f['message']}")
@@ -0,0 +1,119 @@
+"""
+Local pre-filtering of OCR'd invoices before they are sent to Gemini.
+
+Dealer invoices carry a lot of text the extractor never needs: addresses,
+terms, return / shipping policy, marketing copy. filter_document() keeps the
+header fields (retailer, invoice #, date) and the line-item region, using the
+strongest structure DocAI returned:
+  entities  invoice parser line_item / header entities
+  layout    page tables (rendered one row per line) and page lines, trimmed to
+            the span between the first item-looking line and the last amount
+  text      the same line rules over the raw text (no layout, e.g. merged batch shards)
+If no amounts are found at all, the text is passed through unfiltered.
+"""
+import re
+
+FILTER_VERSION = "1"   # part of the extraction cache key; bump when the rules change
+HEADER_LINES = 15      # lines at the top of page 1 scanned for header fields
+LEAD_LINES = 2         # top lines always kept (dealer name / logo text)
+
+MONEY_RE = re.compile(r"\$\s?\d|\b\d{1,3}(?:,\d{3})*\.\d{2}\b")
+DATE_RE = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? \d{1,2},? \d{4}\b", re.I)
+HEADER_RE = re.compile(r"\b(invoice|order|receipt|purchase|sold by|seller|dealer|date|inc|llc|ltd)\b|\.com\b|#\s?\d", re.I)
+ITEM_HEADER_RE = re.compile(r"\b(description|qty|quantity|item|sku|unit price|amount)\b", re.I)
+COIN_RE = re.compile(
+    r"\b(1[6-9]\d{2}|20\d{2})(-?[a-z]{1,2})?\b.*\b(cent|penny|nickel|dime|quarter|half|dollar|eagle|proof|ms|pf|pr)\b"
+    r"|\b(pcgs|ngc|anacs|icg|cac|morgan|peace|buffalo|mercury|walking liberty|franklin|kennedy|lincoln|"
+    r"silver eagle|gold eagle|proof set|mint set|bullion|note|certificate)\b", re.I)
+BOILERPLATE_RE = re.compile(
+    r"\b(terms|conditions|policy|policies|refund|returns?|warranty|guarantee|privacy|copyright|all rights reserved|"
+    r"thank you|follow us|visit us|subscribe|newsletter|customer service|phone|tel|fax|e-?mail)\b|©|www\.|https?://|@",
+    re.I)
+
+# Invoice parser entity types worth keeping as header lines
+HEADER_ENTITIES = {
+    "supplier_name": "Retailer", "supplier_website": "Website", "invoice_id": "Invoice #",
+    "invoice_date": "Invoice Date", "purchase_order": "Order #",
+}
+
+
+# --- LAYOUT ---
+def _segments(layout):
+    return [(int(s.start_index), int(s.end_index)) for s in layout.text_anchor.text_segments]
+
+def _text(doc, layout):
+    return "".join(doc.text[a:b] for a, b in _segments(layout))
+
+def _text_lines(text, offset=0):
+    out = []
+    for line in text.splitlines(keepends=True):
+        out.append(((offset, 0), line))
+        offset += len(line)
+    return out
+
+def _page_units(doc, page):
+    """Page lines in reading order; table rows (cells joined by |) replace the lines they cover."""
+    units, spans = [], []
+    for table in page.tables:
+        segs = _segments(table.layout)
+        spans.extend(segs)
+        start = min((a for a, _ in segs), default=0)
+        for n, row in enumerate(list(table.header_rows) + list(table.body_rows)):
+            cells = [" ".join(_text(doc, c.layout).split()) for c in row.cells]
+            if any(cells): units.append(((start, n), " | ".join(cells)))
+    if page.lines:
+        for line in page.lines:
+            segs = _segments(line.layout)
+            if not segs or any(a <= segs[0][0] < b for a, b in spans): continue
+            units.append(((segs[0][0], 0), _text(doc, line.layout)))
+    else:
+        for a, b in _segments(page.layout):
+            units.extend(u for u in _text_lines(doc.text[a:b], a) if not any(x <= u[0][0] < y for x, y in spans))
+    units.sort(key=lambda u: u[0])
+    return [" ".join(text.split()) for _, text in units]
+
+
+# --- LINE RULES ---
+def _keep_lines(lines, first_page):
+    keep = [False] * len(lines)
+    if first_page:
+        for i, line in enumerate(lines[:HEADER_LINES]):
+            if i < LEAD_LINES or HEADER_RE.search(line) or DATE_RE.search(line): keep[i] = True
+    money = [i for i, line in enumerate(lines) if MONEY_RE.search(line)]
+    if money:
+        # Item region: from the column header / first item-looking line up to the last amount
+        start = next((i for i in range(money[0] + 1) if ITEM_HEADER_RE.search(lines[i]) or COIN_RE.search(lines[i])), money[0])
+        for i in range(start, money[-1] + 1):
+            if MONEY_RE.search(lines[i]) or not BOILERPLATE_RE.search(lines[i]): keep[i] = True
+    return [line for line, k in zip(lines, keep) if k and line]
+
+def _entity_pages(doc):
+    header, items = [], []
+    for ent in doc.entities:
+        text = " ".join((ent.mention_text or "").split())
+        if not text: continue
+        if ent.type_ == "line_item": items.append(text)
+        elif ent.type_ in HEADER_ENTITIES: header.append(f"{HEADER_ENTITIES[ent.type_]}: {text}")
+    return ["\n".join(header + items) + "\n"] if items else None
+
+
+def filter_document(doc):
+    """
+    Returns (page texts, method). Page texts keep page order so long invoices
+    can still be chunked by page; method is "entities", "layout", "text" or
+    "unfiltered".
+    """
+    pages = _entity_pages(doc)
+    if pages: return pages, "entities"
+
+    method, page_lines = "layout", [_page_units(doc, page) for page in doc.pages]
+    if not any(page_lines):
+        method, page_lines = "text", [[" ".join(t.split()) for _, t in _text_lines(doc.text)]]
+    if not any(MONEY_RE.search(line) for lines in page_lines for line in lines):
+        return [doc.text], "unfiltered"
+
+    pages = []
+    for n, lines in enumerate(page_lines):
+        kept = _keep_lines(lines, first_page=(n == 0))
+        if kept: pages.append("\n".join(kept) + "\n")
+    return pages, method
@@ -0,0 +1,79 @@
+"""
+Local fast path for digital (born-PDF) invoices.
+
+Most online dealers email PDFs with an embedded text layer; reading it with
+pypdf takes milliseconds and costs nothing, where DocAI OCR is a remote call.
+text_layer_document() returns a DocAI-shaped Document (text + per-page
+anchors, so chunking and pre-filtering work unchanged) when the text layer is
+usable, else None and the caller OCRs the file. Layout mode keeps table rows
+on one line; wide gaps between columns become " | ".
+
+Usable = enough pages carry real text (coverage) and little of it is
+undecodable glyph noise (garbage ratio), which is what scans and PDFs with
+broken font maps produce.
+"""
+import io
+import re
+
+from google.cloud import documentai
+from pypdf import PdfReader
+
+MIN_PAGE_CHARS = 40     # non-space characters for a page to count as having text
+MIN_COVERAGE = 0.8      # share of pages that must have text
+MAX_GARBAGE = 0.05      # share of characters allowed to be replacement / control / (cid:N) glyphs
+
+_CID_RE = re.compile(r"\(cid:\d+\)")
+_COLUMN_GAP_RE = re.compile(r"[ \t]{3,}")
+
+
+def _garbage_chars(text):
+    cid = sum(len(m) for m in _CID_RE.findall(text))
+    bad = sum(1 for ch in _CID_RE.sub("", text)
+              if ch == "\ufffd" or (ord(ch) < 32 and ch not in "\n\r\t") or 0xE000 <= ord(ch) <= 0xF8FF)
+    return cid + bad
+
+def text_quality(page_texts):
+    """{coverage, garbage_ratio, chars} for the extracted pages."""
+    chars = sum(len("".join(t.split())) for t in page_texts)
+    pages_with_text = sum(1 for t in page_texts if len("".join(t.split())) >= MIN_PAGE_CHARS)
+    return {
+        "coverage": pages_with_text / len(page_texts) if page_texts else 0.0,
+        "garbage_ratio": sum(_garbage_chars(t) for t in page_texts) / chars if chars else 1.0,
+        "chars": chars,
+    }
+
+def is_usable(quality):
+    return quality["coverage"] >= MIN_COVERAGE and quality["garbage_ratio"] <= MAX_GARBAGE
+
+def _page_text(page):
+    try:
+        text = page.extract_text(extraction_mode="layout")
+    except Exception:
+        text = page.extract_text()  # layout mode fails on some odd fonts
+    lines = [_COLUMN_GAP_RE.sub(" | ", line.strip()) for line in (text or "").splitlines()]
+    return "\n".join(line for line in lines if line) + "\n"
+
+def read_text_layer(file_bytes):
+    """Per-page text from the PDF text layer ([] when the file can't be parsed)."""
+    try:
+        reader = PdfReader(io.BytesIO(file_bytes))
+        if reader.is_encrypted: reader.decrypt("")
+        return [_page_text(page) for page in reader.pages]
+    except Exception as e:
+        print(f"PDF Text Layer Error: {e}")
+        return []
+
+def build_document(page_texts):
+    pages, offset = [], 0
+    for n, text in enumerate(page_texts):
+        anchor = documentai.Document.TextAnchor(text_segments=[
+            documentai.Document.TextAnchor.TextSegment(start_index=offset, end_index=offset + len(text))])
+        pages.append(documentai.Document.Page(page_number=n + 1, layout=documentai.Document.Page.Layout(text_anchor=anchor)))
+        offset += len(text)
+    return documentai.Document(text="".join(page_texts), pages=pages)
+
+def text_layer_document(file_bytes):
+    """Document built from the text layer, or None if the PDF needs OCR."""
+    page_texts = read_text_layer(file_bytes)
+    if not page_texts or not is_usable(text_quality(page_texts)): return None
+    return build_document(page_texts)
@@ -0,0 +1,275 @@
+"""
+Single entry point for every Gemini call.
+Records latency histograms, token counts, retries, JSON-parse failures and
+estimated cost per feature/user, and exposes them as a snapshot, Prometheus
+text, structured log lines (opt-in, LLM_CALL_LOG=1) and a per-session call
+log for the debug panel.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from google.api_core import exceptions as gexc
+
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+
+# USD per 1M tokens (input, output)
+MODEL_PRICING = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)  # seconds
+RETRYABLE_ERRORS = (
+    gexc.ResourceExhausted,
+    gexc.ServiceUnavailable,
+    gexc.DeadlineExceeded,
+    gexc.InternalServerError,
+    gexc.TooManyRequests,
+)
+MAX_RETRIES = 2
+RETRY_BACKOFF = 2.0  # seconds, doubled per attempt
+RECENT_CALLS = 500
+MAX_TRACKED_USERS = 50  # per feature; calls by further users are counted under "other"
+LLM_CALL_LOG = os.environ.get("LLM_CALL_LOG", "") == "1"  # one JSON line per call on stdout
+CHARS_PER_TOKEN = 4     # rough estimate for English text
+
+_lock = threading.Lock()
+_features = {}
+_recent = deque(maxlen=RECENT_CALLS)
+_context = threading.local()
+
+
+# --- CALL CONTEXT (user/session tags for the current Streamlit script thread) ---
+def set_call_context(user=None, session=None):
+    _context.user = user
+    _context.session = session
+
+def _ctx(name):
+    return getattr(_context, name, None)
+
+
+# --- METRICS ---
+def _feature_stats(feature):
+    stats = _features.get(feature)
+    if stats is None:
+        stats = {
+            "calls": 0, "errors": 0, "retries": 0, "parse_failures": 0, "parse_repairs": 0, "partial_salvages": 0,
+            "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+            "prompt_tokens_before_trim": 0, "prompt_tokens_after_trim": 0,
+            "latency_sum": 0.0, "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            "latencies": deque(maxlen=RECENT_CALLS),
+            "users": {},
+        }
+        _features[feature] = stats
+    return stats
+
+def estimate_tokens(text):
+    """Approximate prompt tokens for text (shared by every local prompt-budget check)."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    price_in, price_out = MODEL_PRICING.get(model_name, MODEL_PRICING[DEFAULT_MODEL_NAME])
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+def _usage(response):
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None: return 0, 0
+    return int(getattr(meta, "prompt_token_count", 0) or 0), int(getattr(meta, "candidates_token_count", 0) or 0)
+
+def record_call(feature, latency, input_tokens=0, output_tokens=0, retries=0, error=None,
+                user=None, session=None, model_name=DEFAULT_MODEL_NAME):
+    user = user or _ctx("user") or "system"
+    session = session or _ctx("session")
+    cost = estimate_cost(model_name, input_tokens, output_tokens)
+    with _lock:
+        stats = _feature_stats(feature)
+        stats["calls"] += 1
+        stats["retries"] += retries
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["cost_usd"] += cost
+        stats["latency_sum"] += latency
+        stats["latencies"].append(latency)
+        if error: stats["errors"] += 1
+        bucket = next((i for i, b in enumerate(LATENCY_BUCKETS) if latency <= b), len(LATENCY_BUCKETS))
+        stats["latency_buckets"][bucket] += 1
+        users = stats["users"]
+        tracked = user if user in users or len(users) < MAX_TRACKED_USERS else "other"
+        users[tracked] = users.get(tracked, 0) + 1
+
+        entry = {
+            "ts": datetime.now().strftime("%H:%M:%S"), "feature": feature, "user": user, "session": session,
+            "latency_s": round(latency, 3), "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "retries": retries, "cost_usd": round(cost, 6), "error": str(error) if error else None,
+        }
+        _recent.append(entry)
+    _log("llm_call", entry)
+
+def record_parse_failure(feature, user=None, detail=None):
+    with _lock:
+        _feature_stats(feature)["parse_failures"] += 1
+    print(json.dumps({"llm_parse_failure": {"feature": feature, "user": user or _ctx("user") or "system", "detail": str(detail)[:200]}}))
+
+def record_parse_repair(feature, partial=False):
+    # Output was not clean JSON but was recovered locally (no extra model call)
+    with _lock:
+        stats = _feature_stats(feature)
+        stats["parse_repairs"] += 1
+        if partial: stats["partial_salvages"] += 1
+
+def record_prompt_trim(feature, tokens_before, tokens_after, user=None, detail=None):
+    # Local pre-filtering shrank a prompt before the call (estimated tokens)
+    with _lock:
+        stats = _feature_stats(feature)
+        stats["prompt_tokens_before_trim"] += tokens_before
+        stats["prompt_tokens_after_trim"] += tokens_after
+    _log("llm_prompt_trim", {
+        "feature": feature, "user": user or _ctx("user") or "system", "tokens_before": tokens_before,
+        "tokens_after": tokens_after, "detail": detail,
+    })
+
+def _log(kind, payload):
+    # Structured log line (picked up by Cloud Logging / log-based metrics when enabled)
+    if LLM_CALL_LOG: print(json.dumps({kind: payload}, default=str))
+
+
+# --- THE WRAPPER ---
+def call_model(feature, contents, model=None, chat=None, user=None, session=None,
+               generation_config=None, stream=False, max_retries=MAX_RETRIES,
+               model_name=DEFAULT_MODEL_NAME):
+    """
+    Sends `contents` through chat.send_message (if a chat is given) or
+    model.generate_content, retrying transient errors with backoff.
+    Non-streaming calls return the response; streaming calls return a
+    generator of chunks and record metrics once the stream is exhausted.
+    """
+    target = chat.send_message if chat is not None else model.generate_content
+    kwargs = {}
+    if generation_config is not None: kwargs["generation_config"] = generation_config
+    if stream: kwargs["stream"] = True
+
+    if stream:
+        return _stream_call(feature, target, contents, kwargs, user, session, max_retries, model_name)
+
+    start = time.perf_counter()
+    retries = 0
+    while True:
+        try:
+            response = target(contents, **kwargs)
+            break
+        except RETRYABLE_ERRORS as e:
+            if retries >= max_retries:
+                record_call(feature, time.perf_counter() - start, retries=retries, error=e,
+                            user=user, session=session, model_name=model_name)
+                raise
+            time.sleep(RETRY_BACKOFF * (2 ** retries))
+            retries += 1
+        except Exception as e:
+            record_call(feature, time.perf_counter() - start, retries=retries, error=e,
+                        user=user, session=session, model_name=model_name)
+            raise
+
+    in_tok, out_tok = _usage(response)
+    record_call(feature, time.perf_counter() - start, in_tok, out_tok, retries,
+                user=user, session=session, model_name=model_name)
+    return response
+
+def _stream_call(feature, target, contents, kwargs, user, session, max_retries, model_name):
+    # Retries only apply before the first chunk arrives
+    start = time.perf_counter()
+    retries = 0
+    while True:
+        try:
+            chunks = iter(target(contents, **kwargs))
+            first = next(chunks, None)
+            break
+        except RETRYABLE_ERRORS as e:
+            if retries >= max_retries:
+                record_call(feature, time.perf_counter() - start, retries=retries, error=e,
+                            user=user, session=session, model_name=model_name)
+                raise
+            time.sleep(RETRY_BACKOFF * (2 ** retries))
+            retries += 1
+        except Exception as e:
+            record_call(feature, time.perf_counter() - start, retries=retries, error=e,
+                        user=user, session=session, model_name=model_name)
+            raise
+
+    in_tok = out_tok = 0
+    error = None
+    try:
+        chunk = first
+        while chunk is not None:
+            c_in, c_out = _usage(chunk)
+            if c_in or c_out: in_tok, out_tok = c_in, c_out  # usage arrives on the last chunk
+            yield chunk
+            chunk = next(chunks, None)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        record_call(feature, time.perf_counter() - start, in_tok, out_tok, retries, error=error,
+                    user=user, session=session, model_name=model_name)
+
+
+# --- EXPORT ---
+def _percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def get_metrics_snapshot():
+    """Per-feature totals plus p50/p95 latency and parse-failure rate."""
+    with _lock:
+        out = {}
+        for feature, s in _features.items():
+            lat = list(s["latencies"])
+            out[feature] = {
+                "calls": s["calls"], "errors": s["errors"], "retries": s["retries"],
+                "parse_failures": s["parse_failures"],
+                "parse_repairs": s["parse_repairs"], "partial_salvages": s["partial_salvages"],
+                "parse_failure_rate": round(s["parse_failures"] / s["calls"], 4) if s["calls"] else 0.0,
+                "input_tokens": s["input_tokens"], "output_tokens": s["output_tokens"],
+                "prompt_tokens_before_trim": s["prompt_tokens_before_trim"],
+                "prompt_tokens_after_trim": s["prompt_tokens_after_trim"],
+                "cost_usd": round(s["cost_usd"], 4),
+                "avg_latency_s": round(s["latency_sum"] / s["calls"], 3) if s["calls"] else 0.0,
+                "p50_latency_s": round(_percentile(lat, 50), 3),
+                "p95_latency_s": round(_percentile(lat, 95), 3),
+                "latency_buckets": dict(zip([f"le_{b}" for b in LATENCY_BUCKETS] + ["le_inf"], s["latency_buckets"])),
+                "users": dict(s["users"]),
+            }
+        return out
+
+def get_recent_calls(session=None, limit=50):
+    with _lock:
+        calls = [c for c in _recent if session is None or c["session"] == session]
+    return calls[-limit:]
+
+def render_prometheus():
+    """Prometheus text exposition of the per-feature counters and latency histogram."""
+    lines = []
+    with _lock:
+        for feature, s in _features.items():
+            lbl = f'feature="{feature}"'
+            lines.append(f'llm_calls_total{{{lbl}}} {s["calls"]}')
+            lines.append(f'llm_errors_total{{{lbl}}} {s["errors"]}')
+            lines.append(f'llm_retries_total{{{lbl}}} {s["retries"]}')
+            lines.append(f'llm_parse_failures_total{{{lbl}}} {s["parse_failures"]}')
+            lines.append(f'llm_parse_repairs_total{{{lbl}}} {s["parse_repairs"]}')
+            lines.append(f'llm_input_tokens_total{{{lbl}}} {s["input_tokens"]}')
+            lines.append(f'llm_output_tokens_total{{{lbl}}} {s["output_tokens"]}')
+            lines.append(f'llm_prompt_tokens_trimmed_total{{{lbl}}} {s["prompt_tokens_before_trim"] - s["prompt_tokens_after_trim"]}')
+            lines.append(f'llm_cost_usd_total{{{lbl}}} {s["cost_usd"]:.6f}')
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], s["latency_buckets"]):
+                cumulative += n
+                lines.append(f'llm_latency_seconds_bucket{{{lbl},le="{bound}"}} {cumulative}')
+            lines.append(f'llm_latency_seconds_sum{{{lbl}}} {s["latency_sum"]:.3f}')
+            lines.append(f'llm_latency_seconds_count{{{lbl}}} {s["calls"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,229 @@
+"""
+Structured-output schemas for model calls and a tolerant local JSON parser.
+
+Calls request response_mime_type="application/json" against a declared
+schema; parse_model_json() then handles whatever still comes back wrong
+(code fences, stray prose, a lone object instead of a list, a truncated
+array) without spending another model call.
+"""
+import json
+import re
+
+from vertexai.generative_models import GenerationConfig
+
+from llm_client import record_parse_failure, record_parse_repair
+
+_STR = {"type": "string", "nullable": True}
+
+# --- SCHEMAS (OpenAPI subset accepted by Vertex response_schema) ---
+APPRAISAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "AI Estimated Value": {"type": "string"},
+        "Program/Series": _STR,
+        "Theme/Subject": _STR,
+        "Metal Content": _STR,
+        "Mint Mark": _STR,
+        "Numismatic Report": {"type": "string"},
+        "potentialVariety": {
+            "type": "object",
+            "nullable": True,
+            "properties": {
+                "name": {"type": "string"},
+                "description": {"type": "string"},
+                "estimatedValue": {"type": "string"},
+            },
+            "required": ["name", "description", "estimatedValue"],
+        },
+    },
+    "required": ["AI Estimated Value", "Numismatic Report"],
+}
+
+INVOICE_ITEM_FIELDS = [
+    "Country", "Year", "Denomination", "Mint Mark", "Quantity", "Program/Series", "Theme/Subject",
+    "Condition", "Surface & Strike Quality", "Grading Service", "Grading Cert #", "Cost",
+    "Purchase Date", "Retailer/Website", "Retailer Invoice #", "Retailer Item No.",
+    "Metal Content", "Melt Value", "Personal Notes", "Personal Ref #", "AI Estimated Value",
+    "inventoryStatus", "Storage Location",
+]
+
+INVOICE_ITEMS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": dict(
+            {
+                "category": {"type": "string", "enum": ["US Coin", "Paper Currency", "Foreign Currency", "Supply/Other"]},
+                "confidence_score": {"type": "number"},
+                "needs_manual_review": {"type": "boolean"},
+            },
+            **{f: _STR for f in INVOICE_ITEM_FIELDS}
+        ),
+        "required": ["category", "confidence_score", "needs_manual_review", "Denomination"],
+    },
+}
+
+def column_mapping_schema(target_columns):
+    # Dynamic keys can't be declared, so the model returns pairs and we fold them into a dict
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "source": {"type": "string"},
+                "target": {"type": "string", "enum": list(target_columns) + ["EXTRA_METADATA"]},
+            },
+            "required": ["source", "target"],
+        },
+    }
+
+def json_config(schema, **kwargs):
+    return GenerationConfig(response_mime_type="application/json", response_schema=schema, **kwargs)
+
+
+# --- TOLERANT PARSER ---
+_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _loads_lenient(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", text)
+    fixed = re.sub(r"\bTrue\b", "true", fixed)
+    fixed = re.sub(r"\bFalse\b", "false", fixed)
+    fixed = re.sub(r"\bNone\b", "null", fixed)
+    return json.loads(fixed)
+
+def _balanced_spans(text, start, opener="{", closer="}"):
+    """
+    Yields (begin, end) of every complete top-level `opener..closer` span after
+    `start`, string/escape aware. An unterminated final span is dropped.
+    """
+    depth = 0; in_str = False; esc = False; begin = None
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if esc: esc = False
+            elif ch == "\\": esc = True
+            elif ch == '"': in_str = False
+            continue
+        if ch == '"': in_str = True
+        elif ch == opener:
+            if depth == 0: begin = i
+            depth += 1
+        elif ch == closer and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield begin, i + 1
+
+def _salvage_objects(text):
+    items = []
+    for begin, end in _balanced_spans(text, 0):
+        try:
+            obj = _loads_lenient(text[begin:end])
+        except (json.JSONDecodeError, ValueError):
+            continue
+        if isinstance(obj, dict): items.append(obj)
+    return items
+
+def _shape(data, expect):
+    if expect is list:
+        if isinstance(data, list): return data
+        if isinstance(data, dict):
+            # {"items": [...]} style wrappers
+            lists = [v for v in data.values() if isinstance(v, list)]
+            if len(lists) == 1 and all(isinstance(x, dict) for x in lists[0]): return lists[0]
+            return [data]
+    if expect is dict:
+        if isinstance(data, dict): return data
+        if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict): return data[0]
+    raise ValueError(f"Expected JSON {expect.__name__}, got {type(data).__name__}")
+
+def parse_model_json(text, feature, expect=list):
+    """
+    Parses model output into `expect` (list or dict).
+    1. strict json.loads  2. strip fences/prose and decode the first JSON value
+    3. (lists) salvage every complete object from a truncated/garbled array.
+    Repairs and failures are recorded against `feature`. Raises ValueError when
+    nothing usable could be recovered.
+    """
+    text = text or ""
+    try:
+        return _shape(json.loads(text), expect)
+    except (json.JSONDecodeError, ValueError):
+        pass
+
+    cleaned = _FENCE_RE.sub("", text).strip()
+    starts = [i for i in (cleaned.find("["), cleaned.find("{")) if i != -1]
+    if starts:
+        begin = min(starts)
+        try:
+            data, _ = json.JSONDecoder().raw_decode(cleaned[begin:])
+            data = _shape(data, expect)
+            record_parse_repair(feature)
+            return data
+        except (json.JSONDecodeError, ValueError):
+            pass
+        try:
+            closer = "]" if cleaned[begin] == "[" else "}"
+            data = _shape(_loads_lenient(cleaned[begin:cleaned.rfind(closer) + 1]), expect)
+            record_parse_repair(feature)
+            return data
+        except (json.JSONDecodeError, ValueError):
+            pass
+
+    if expect is list:
+        items = _salvage_objects(cleaned)
+        if items:
+            record_parse_repair(feature, partial=True)
+            return items
+
+    record_parse_failure(feature, detail=text[:200])
+    raise ValueError(f"Unparseable model output for {feature}")
+
+
+# --- STREAMING PARSER ---
+class JsonObjectStream:
+    """
+    Incremental parser for a streamed JSON array of objects: feed() text as it
+    arrives and get back every top-level object completed so far. Whatever is
+    already returned survives a stream that dies or truncates later.
+    """
+
+    def __init__(self):
+        self.text = ""       # everything fed so far (for a final fallback parse)
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0; self._in_str = False; self._esc = False; self._begin = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        self._buf += chunk
+        out = []
+        for i in range(self._pos, len(self._buf)):
+            ch = self._buf[i]
+            if self._in_str:
+                if self._esc: self._esc = False
+                elif ch == "\\": self._esc = True
+                elif ch == '"': self._in_str = False
+                continue
+            if ch == '"': self._in_str = True
+            elif ch == "{":
+                if self._depth == 0: self._begin = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = _loads_lenient(self._buf[self._begin:i + 1])
+                        if isinstance(obj, dict): out.append(obj)
+                    except (json.JSONDecodeError, ValueError):
+                        pass
+        # Keep only the unfinished object
+        if self._depth == 0:
+            self._buf = ""; self._pos = 0
+        else:
+            self._buf = self._buf[self._begin:]; self._pos = len(self._buf); self._begin = 0
+        return out
@@ -0,0 +1,381 @@
+"""
+Local stand-ins for the GCS bucket, Document AI client and Firestore.
+
+They implement only the calls the app's headless modules make (bucket and
+DocAI backed by a local directory, Firestore in memory), so queue / batch-OCR
+/ lease / import logic can be exercised without GCP access:
+    bucket = LocalBucket("./local_bucket")
+    docai = LocalDocAIClient(bucket)
+    db = LocalFirestore()
+"""
+import copy
+import itertools
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+from google.api_core import exceptions as gexc
+from google.cloud import documentai, firestore
+
+SHARD_CHARS = 4000  # batch output is split into shards of this many characters
+
+
+# --- STORAGE ---
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def metadata(self):
+        # Custom metadata is kept per bucket in memory (not on disk)
+        return self.bucket.metadata.get(self.name)
+
+    @metadata.setter
+    def metadata(self, value):
+        self.bucket.metadata[self.name] = dict(value) if value else None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    def exists(self):
+        return os.path.isfile(self._path)
+
+    def download_as_bytes(self):
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def upload_from_string(self, data, content_type=None):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def upload_from_file(self, file_obj, content_type=None):
+        self.upload_from_string(file_obj.read(), content_type)
+
+    def delete(self):
+        os.remove(self._path)
+        self.bucket.metadata.pop(self.name, None)
+
+
+class LocalBucket:
+    def __init__(self, root, name="local-bucket"):
+        self.root = root
+        self.name = name
+        self.metadata = {}  # blob name -> custom metadata
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=""):
+        out = []
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                name = os.path.relpath(os.path.join(dirpath, fn), self.root).replace(os.sep, "/")
+                if name.startswith(prefix): out.append(LocalBlob(self, name))
+        return sorted(out, key=lambda b: b.name)
+
+    def rename_blob(self, blob, new_name):
+        dest = os.path.join(self.root, new_name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(blob._path, dest)
+        self.metadata[new_name] = self.metadata.pop(blob.name, None)
+        return LocalBlob(self, new_name)
+
+    def name_from_uri(self, uri):
+        return uri.split(f"gs://{self.name}/", 1)[-1]
+
+
+# --- DOCUMENT AI ---
+def printable_text(content):
+    # Crude `strings`-style text recovery; good enough for a stand-in
+    runs = re.findall(rb"[\x20-\x7e]{4,}", content)
+    return "\n".join(r.decode("ascii") for r in runs)
+
+
+class _ProcessResponse:
+    def __init__(self, document):
+        self.document = document
+
+
+class LocalOperation:
+    """Mimics google.api_core.operation.Operation; done() after `polls` checks."""
+
+    def __init__(self, metadata, polls=1):
+        self.metadata = metadata
+        self._polls = polls
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+    def done(self):
+        self._polls -= 1
+        return self._polls < 0
+
+    def result(self, timeout=None):
+        return None
+
+
+class LocalDocAIClient:
+    def __init__(self, bucket, text_fn=printable_text, polls=1):
+        self.bucket = bucket
+        self.text_fn = text_fn
+        self.polls = polls
+        self.online_calls = 0
+        self.batch_calls = 0
+
+    def processor_path(self, project, location, processor):
+        return f"projects/{project}/locations/{location}/processors/{processor}"
+
+    def process_document(self, request):
+        self.online_calls += 1
+        return _ProcessResponse(documentai.Document(text=self.text_fn(request.raw_document.content)))
+
+    def batch_process_documents(self, request):
+        """Runs synchronously; writes sharded Document JSON like the real service."""
+        self.batch_calls += 1
+        out_uri = request.document_output_config.gcs_output_config.gcs_uri.rstrip("/")
+        statuses = []
+        for i, gcs_doc in enumerate(request.input_documents.gcs_documents.documents):
+            dest = f"{out_uri}/{i}"
+            try:
+                text = self.text_fn(self.bucket.blob(self.bucket.name_from_uri(gcs_doc.gcs_uri)).download_as_bytes())
+                shards = [text[o:o + SHARD_CHARS] for o in range(0, len(text), SHARD_CHARS)] or [""]
+                for n, chunk in enumerate(shards):
+                    shard = documentai.Document(text=chunk, shard_info=documentai.Document.ShardInfo(
+                        shard_index=n, shard_count=len(shards), text_offset=n * SHARD_CHARS))
+                    name = self.bucket.name_from_uri(f"{dest}/doc-{n}.json")
+                    self.bucket.blob(name).upload_from_string(documentai.Document.to_json(shard))
+                code = 0
+            except Exception as e:
+                print(f"Local DocAI Error: {e}")
+                code = 13
+            statuses.append(documentai.BatchProcessMetadata.IndividualProcessStatus(
+                input_gcs_source=gcs_doc.gcs_uri, output_gcs_destination=dest, status={"code": code}))
+        metadata = documentai.BatchProcessMetadata(
+            state=documentai.BatchProcessMetadata.State.SUCCEEDED, individual_process_statuses=statuses)
+        self.last_operation = LocalOperation(metadata, polls=self.polls)
+        return self.last_operation
+
+
+# --- FIRESTORE ---
+def _apply(target, data):
+    # Nested merge with the write transforms the app uses
+    for key, value in data.items():
+        if value is firestore.DELETE_FIELD: target.pop(key, None)
+        elif value is firestore.SERVER_TIMESTAMP: target[key] = datetime.now()
+        elif isinstance(value, firestore.Increment): target[key] = target.get(key, 0) + value.value
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict): target[key] = {}
+            _apply(target[key], value)
+        else: target[key] = copy.deepcopy(value)
+
+def _field(data, path):
+    for part in path.strip("`").split("."):
+        if not isinstance(data, dict) or part not in data: return None
+        data = data[part]
+    return data
+
+_OPS = {"==": lambda a, b: a == b, "!=": lambda a, b: a != b, "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b, ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b, "in": lambda a, b: a in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a}
+
+
+class LocalSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field):
+        return _field(self._data or {}, field)
+
+
+class LocalDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return LocalCollection(self._db, f"{self.path}/{name}")
+
+    def get(self):
+        with self._db._lock:
+            self._db.reads += 1
+            return LocalSnapshot(self, copy.deepcopy(self._db.docs.get(self.path)), self._db.versions.get(self.path))
+
+    def _check(self, option):
+        # write_option(last_update_time=...) is a compare-and-swap on the snapshot's update_time
+        expected = getattr(option, "_last_update_time", None)
+        if option is not None and expected != self._db.versions.get(self.path):
+            raise gexc.FailedPrecondition(f"{self.path} changed since {expected}")
+
+    def _write(self, data):
+        self._db.writes += 1
+        self._db.versions[self.path] = next(self._db._clock)
+        if data is None:
+            self._db.docs.pop(self.path, None)
+            self._db.versions.pop(self.path, None)
+        else:
+            self._db.docs[self.path] = data
+
+    def set(self, data, merge=False):
+        with self._db._lock:
+            doc = copy.deepcopy(self._db.docs.get(self.path, {})) if merge else {}
+            _apply(doc, data)
+            self._write(doc)
+
+    def create(self, data):
+        with self._db._lock:
+            if self.path in self._db.docs: raise gexc.AlreadyExists(f"{self.path} already exists")
+            doc = {}
+            _apply(doc, data)
+            self._write(doc)
+
+    def update(self, data, option=None):
+        with self._db._lock:
+            if self.path not in self._db.docs: raise gexc.NotFound(f"{self.path} not found")
+            self._check(option)
+            doc = copy.deepcopy(self._db.docs[self.path])
+            _apply(doc, data)
+            self._write(doc)
+
+    def delete(self, option=None):
+        with self._db._lock:
+            self._check(option)
+            self._write(None)
+
+
+class LocalQuery:
+    def __init__(self, db, path, filters=(), order=(), limit=None, fields=None):
+        self._db = db
+        self._path = path
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit
+        self._fields = fields
+
+    def _copy(self, **changes):
+        args = dict(filters=self._filters, order=self._order, limit=self._limit, fields=self._fields)
+        args.update(changes)
+        return LocalQuery(self._db, self._path, **args)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction=firestore.Query.ASCENDING):
+        return self._copy(order=self._order + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, fields):
+        return self._copy(fields=[f.strip("`") for f in fields])
+
+    def stream(self):
+        prefix = self._path + "/"
+        with self._db._lock:
+            rows = [(p, copy.deepcopy(d), self._db.versions.get(p)) for p, d in self._db.docs.items()
+                    if p.startswith(prefix) and "/" not in p[len(prefix):]]
+        rows = [r for r in rows if all(_OPS[op](_field(r[1], f), v) for f, op, v in self._filters)]
+        for field, direction in reversed(self._order):
+            # Like Firestore, documents missing an order_by field are left out
+            rows = [r for r in rows if _field(r[1], field) is not None]
+            rows.sort(key=lambda r: _field(r[1], field), reverse=direction == firestore.Query.DESCENDING)
+        if self._limit is not None: rows = rows[:self._limit]
+        with self._db._lock:
+            self._db.reads += len(rows)
+        for path, data, version in rows:
+            if self._fields is not None: data = {k: v for k, v in data.items() if k in self._fields}
+            yield LocalSnapshot(LocalDocument(self._db, path), data, version)
+
+    def get(self):
+        return list(self.stream())
+
+
+class LocalCollection(LocalQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id=None):
+        return LocalDocument(self._db, f"{self._path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+
+class LocalBatch:
+    """Applies staged writes together on commit() (no other writer runs in between)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref.set, (data,), {"merge": merge}))
+
+    def update(self, ref, data):
+        self._ops.append((ref.update, (data,), {}))
+
+    def delete(self, ref):
+        self._ops.append((ref.delete, (), {}))
+
+    def commit(self):
+        with self._db._lock:
+            if self._db.fail_commits:
+                self._db.fail_commits -= 1
+                raise gexc.ServiceUnavailable("local commit failure")
+            self._db.commits += 1
+            for fn, args, kwargs in self._ops:
+                fn(*args, **kwargs)
+        self._ops = []
+
+
+class LocalFirestore:
+    """
+    In-memory Firestore client: documents keyed by path, update times from a
+    counter (so write_option preconditions work), reads / writes / commits
+    counted. Set fail_commits=n to make the next n batch commits fail.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.versions = {}
+        self.reads = self.writes = self.commits = 0
+        self.fail_commits = 0
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def collection(self, path):
+        return LocalCollection(self, path)
+
+    def document(self, path):
+        return LocalDocument(self, path)
+
+    def batch(self):
+        return LocalBatch(self)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def paths(self, prefix):
+        """Document paths directly under a collection path."""
+        prefix = prefix.rstrip("/") + "/"
+        with self._lock:
+            return sorted(p for p in self.docs if p.startswith(prefix) and "/" not in p[len(prefix):])
@@ -0,0 +1,87 @@
+"""
+Deterministic melt-value calculator.
+Looks every coin up in COIN_COMPOSITIONS in one vectorized pass instead of
+asking the model to do (Weight * Purity * Spot) arithmetic.
+"""
+import numpy as np
+import pandas as pd
+
+from coin_standards import COIN_STANDARDS, COIN_COMPOSITIONS, METAL_FAMILIES, TROY_OZ_GRAMS
+
+
+def _alias_map(category):
+    # lowercase alias/canonical -> canonical
+    lookup = {}
+    for canonical, aliases in COIN_STANDARDS[category].items():
+        lookup[canonical.lower()] = canonical
+        for alias in aliases:
+            lookup[alias.lower()] = canonical
+    return lookup
+
+DENOM_LOOKUP = _alias_map('denominations')
+METAL_LOOKUP = _alias_map('metals')
+
+COMPOSITION_DF = pd.DataFrame(
+    COIN_COMPOSITIONS,
+    columns=['denomination', 'start_year', 'end_year', 'weight_g', 'metal', 'fineness', 'requires_metal']
+)
+COMPOSITION_DF['pure_oz'] = COMPOSITION_DF['weight_g'] * COMPOSITION_DF['fineness'] / TROY_OZ_GRAMS
+COMPOSITION_DF['priority'] = COMPOSITION_DF['requires_metal'].notna().astype(int)
+
+
+def _canonical(series, lookup):
+    return series.astype(str).str.strip().str.lower().map(lookup)
+
+def _year(series):
+    # Handles 1881, "1881", "1881-CC", 1881.0
+    return pd.to_numeric(series.astype(str).str.extract(r'(\d{4})', expand=False), errors='coerce')
+
+def lookup_compositions(df):
+    """
+    Returns a frame aligned to df.index with 'metal' and 'pure_oz' (troy oz of
+    precious metal per coin). Rows with no precious composition are NaN.
+    """
+    out = pd.DataFrame(index=df.index, columns=['metal', 'pure_oz'])
+    out['pure_oz'] = np.nan
+    if df.empty or 'Denomination' not in df.columns or 'Year' not in df.columns:
+        return out
+
+    coins = pd.DataFrame({
+        '_row': np.arange(len(df)),
+        'denomination': _canonical(df['Denomination'], DENOM_LOOKUP).to_numpy(),
+        'year': _year(df['Year']).to_numpy(),
+        'coin_metal': (_canonical(df['Metal Content'], METAL_LOOKUP).to_numpy()
+                       if 'Metal Content' in df.columns else None),
+    })
+    coins = coins.dropna(subset=['denomination', 'year'])
+
+    m = coins.merge(COMPOSITION_DF, on='denomination', how='inner')
+    m = m[(m['year'] >= m['start_year']) & (m['year'] <= m['end_year'])]
+    m = m[m['requires_metal'].isna() | (m['requires_metal'] == m['coin_metal'])]
+    # A stated Metal Content of another metal rules the row out (e.g. a cupro-nickel 1868 Shield nickel)
+    family = m['coin_metal'].map(METAL_FAMILIES)
+    m = m[family.isna() | (family == m['metal'])]
+    # A metal-gated row (e.g. silver proof) beats the plain year-range row
+    m = m.sort_values('priority', ascending=False).drop_duplicates('_row')
+
+    rows = m['_row'].to_numpy()
+    out.iloc[rows, out.columns.get_loc('metal')] = m['metal'].to_numpy()
+    out.iloc[rows, out.columns.get_loc('pure_oz')] = m['pure_oz'].to_numpy()
+    out['pure_oz'] = out['pure_oz'].astype(float)
+    return out
+
+def precious_mask(df):
+    """True for coins whose composition contains silver or gold."""
+    return lookup_compositions(df)['pure_oz'].notna()
+
+def compute_melt_numeric(df, silver_p, gold_p):
+    """Melt value per coin as floats (NaN when not precious)."""
+    comp = lookup_compositions(df)
+    spot = comp['metal'].map({'silver': float(silver_p), 'gold': float(gold_p)}).astype(float)
+    return comp['pure_oz'] * spot
+
+def compute_melt_values(df, silver_p, gold_p):
+    """Melt value per coin formatted like the rest of the vault ("$18.42" / "N/A")."""
+    melt = compute_melt_numeric(df, silver_p, gold_p)
+    formatted = melt.map(lambda v: f"${v:,.2f}" if pd.notna(v) else "N/A")
+    return formatted.astype(object)
@@ -0,0 +1,148 @@
+"""
+Precomputed US Mint program histories.
+
+Histories are identical for every user, so they are generated once (build
+time or from the admin button in Settings) and served from:
+  1. program_histories.json  - versioned static asset shipped with the image
+  2. catalog/program_histories - shared Firestore document (admin regenerations)
+Each entry carries a hash of its catalog entry; when the catalog changes the
+entry is stale and is regenerated on demand.
+
+Run headless:  python program_histories.py [--force] [--no-firestore]
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from coin_programs import US_PROGRAMS
+from llm_client import call_model
+
+HISTORY_ASSET = os.environ.get("PROGRAM_HISTORY_ASSET", "program_histories.json")
+HISTORY_DOC = ("catalog", "program_histories")
+HISTORY_PROMPT = "Provide a brief, engaging history of the US Mint '{name}' coin program. Include authorization (law), years, designer info if key, and purpose. Format with markdown."
+BUILD_WORKERS = 4
+
+_lock = threading.Lock()
+_histories = None  # id -> {"hash", "markdown", "generated_at"}
+
+
+# --- CATALOG VERSIONING ---
+def iter_programs(programs=None):
+    for progs in (programs or US_PROGRAMS).values():
+        for p in progs:
+            yield p
+
+def find_program(prog_id, programs=None):
+    return next((p for p in iter_programs(programs) if p['id'] == prog_id), None)
+
+def program_hash(program):
+    key = json.dumps({k: program.get(k) for k in ('name', 'years', 'url', 'coins')}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def catalog_version(programs=None):
+    joined = "|".join(f"{p['id']}:{program_hash(p)}" for p in iter_programs(programs))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()[:16]
+
+
+# --- LOAD ---
+def _read_asset(path=HISTORY_ASSET):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("histories", {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"History Asset Error: {e}")
+        return {}
+
+def _read_shared(db):
+    try:
+        snap = db.collection(HISTORY_DOC[0]).document(HISTORY_DOC[1]).get()
+        return (snap.to_dict() or {}).get("histories", {}) if snap.exists else {}
+    except Exception as e:
+        print(f"History Doc Error: {e}")
+        return {}
+
+def load_histories(db=None, refresh=False):
+    """Process-wide memo of all histories (static asset, overlaid by the shared doc)."""
+    global _histories
+    with _lock:
+        if _histories is not None and not refresh: return _histories
+    merged = _read_asset()
+    if db is not None:
+        for pid, entry in _read_shared(db).items():
+            current = merged.get(pid)
+            if not current or entry.get("generated_at", "") >= current.get("generated_at", ""):
+                merged[pid] = entry
+    with _lock:
+        _histories = merged
+    return merged
+
+def get_program_history(program, db=None):
+    """Markdown history, or None if missing or generated for an older catalog entry."""
+    entry = load_histories(db).get(program['id'])
+    if entry and entry.get("hash") == program_hash(program):
+        return entry.get("markdown")
+    return None
+
+
+# --- GENERATE / STORE ---
+def generate_program_history(program, model, db=None):
+    """One model call; result is stored in the shared doc so every user gets it."""
+    response = call_model("program_history", HISTORY_PROMPT.format(name=program['name']), model=model)
+    entry = {
+        "hash": program_hash(program),
+        "markdown": response.text,
+        "generated_at": datetime.now().isoformat(),
+    }
+    with _lock:
+        if _histories is not None: _histories[program['id']] = entry
+    if db is not None:
+        try:
+            db.collection(HISTORY_DOC[0]).document(HISTORY_DOC[1]).set(
+                {"histories": {program['id']: entry}, "catalog_version": catalog_version()}, merge=True)
+        except Exception as e:
+            print(f"History Save Error: {e}")
+    return entry["markdown"]
+
+def build_program_histories(model, db=None, force=False, asset_path=HISTORY_ASSET, progress_cb=None):
+    """
+    Generates histories for every US_PROGRAMS id (only stale/missing ones unless
+    force), then writes the versioned static asset. Returns (#generated, #total).
+    """
+    existing = load_histories(db, refresh=True)
+    programs = list(iter_programs())
+    todo = [p for p in programs if force or existing.get(p['id'], {}).get("hash") != program_hash(p)]
+
+    # Progress is reported from this thread (a Streamlit progress bar only updates from the script thread)
+    with ThreadPoolExecutor(max_workers=BUILD_WORKERS) as pool:
+        futures = {pool.submit(generate_program_history, p, model, db=db): p for p in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"History Build Error ({futures[future]['id']}): {e}")
+            if progress_cb: progress_cb(done, len(todo))
+
+    histories = load_histories()
+    asset = {
+        "catalog_version": catalog_version(),
+        "generated_at": datetime.now().isoformat(),
+        "histories": {p['id']: histories[p['id']] for p in programs if p['id'] in histories},
+    }
+    with open(asset_path, "w", encoding="utf-8") as f:
+        json.dump(asset, f, indent=2, ensure_ascii=False)
+    return len(todo), len(programs)
+
+
+if __name__ == "__main__":
+    from gcp_clients import get_firestore, get_model
+
+    db = None if "--no-firestore" in sys.argv else get_firestore()
+    n, total = build_program_histories(get_model(), db=db, force="--force" in sys.argv,
+                                       progress_cb=lambda d, t: print(f"  {d}/{t}"))
+    print(f"Generated {n} of {total} program histories -> {HISTORY_ASSET} (catalog {catalog_version()})")
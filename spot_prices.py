@@ -0,0 +1,179 @@
+"""
+Spot-price service: pluggable providers, a TTL cache, a stored daily history
+and incremental melt revaluation when spot moves.
+
+Providers are plain callables returning {"silver": float, "gold": float}.
+Pick one with SPOT_PRICE_PROVIDER ("file", "http", "fixed"); the default is
+the local spot_prices.json file, falling back to the fixed defaults.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from melt_calculator import compute_melt_values, precious_mask
+
+DEFAULT_SPOT = {"silver": 72.56, "gold": 3100.00}
+SPOT_FILE = os.environ.get("SPOT_PRICES_FILE", "spot_prices.json")
+SPOT_PRICE_URL = os.environ.get("SPOT_PRICE_URL", "")
+SPOT_CACHE_TTL = int(os.environ.get("SPOT_CACHE_TTL", 15 * 60))  # seconds
+REVALUE_THRESHOLD = float(os.environ.get("SPOT_REVALUE_THRESHOLD", 0.02))  # 2% move
+REVALUE_BATCH_SIZE = 400
+
+
+# --- PROVIDERS ---
+def fetch_fixed():
+    return dict(DEFAULT_SPOT)
+
+def fetch_from_file(path=None):
+    with open(path or SPOT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {"silver": float(data["silver"]), "gold": float(data["gold"])}
+
+def fetch_from_http(url=None):
+    # Any JSON endpoint that returns {"silver": .., "gold": ..}
+    url = url or SPOT_PRICE_URL
+    if not url: raise ValueError("SPOT_PRICE_URL not configured")
+    resp = requests.get(url, timeout=5)
+    resp.raise_for_status()
+    data = resp.json()
+    return {"silver": float(data["silver"]), "gold": float(data["gold"])}
+
+SPOT_PROVIDERS = {
+    "fixed": fetch_fixed,
+    "file": fetch_from_file,
+    "http": fetch_from_http,
+}
+
+def get_provider(name=None):
+    name = name or os.environ.get("SPOT_PRICE_PROVIDER")
+    if not name:
+        name = "file" if os.path.exists(SPOT_FILE) else "fixed"
+    return name, SPOT_PROVIDERS[name]
+
+
+# --- TTL CACHE ---
+_cache_lock = threading.Lock()
+_cache = {"prices": None, "fetched_at": 0.0}
+_history_written = set()
+
+def get_spot_prices(provider=None, ttl=SPOT_CACHE_TTL, db=None, force=False):
+    """
+    Returns {"silver", "gold", "source", "as_of"} from the TTL cache, refreshing
+    from the provider when stale. On provider failure the last good value (or
+    the defaults) is served. If db is given, today's price is stored in history.
+    """
+    with _cache_lock:
+        cached = _cache["prices"]
+        if cached and not force and (time.time() - _cache["fetched_at"]) < ttl:
+            return dict(cached)
+
+        name, fetch = get_provider(provider)
+        try:
+            prices = fetch()
+            prices["source"] = name
+        except Exception as e:
+            print(f"Spot Provider Error ({name}): {e}")
+            prices = dict(cached) if cached else dict(DEFAULT_SPOT, source="fixed")
+            prices["source"] = prices["source"].replace(" (stale)", "") + " (stale)"
+        prices["as_of"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+        _cache["prices"] = prices
+        _cache["fetched_at"] = time.time()
+
+    if db is not None:
+        record_daily_spot(db, prices)
+    return dict(prices)
+
+
+# --- DAILY HISTORY (Firestore: market_data/spot_history/days/{YYYY-MM-DD}) ---
+def _history_ref(db):
+    return db.collection("market_data").document("spot_history").collection("days")
+
+def record_daily_spot(db, prices, day=None):
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    if day in _history_written: return
+    try:
+        _history_ref(db).document(day).set({
+            "date": day,
+            "silver": prices["silver"],
+            "gold": prices["gold"],
+            "source": prices.get("source", ""),
+        }, merge=True)
+        _history_written.add(day)
+    except Exception as e:
+        print(f"Spot History Error: {e}")
+
+def load_spot_history(db, days=90):
+    """Most recent `days` entries, oldest first."""
+    try:
+        docs = _history_ref(db).order_by("date", direction="DESCENDING").limit(days).stream()
+        rows = [d.to_dict() for d in docs]
+    except Exception as e:
+        print(f"Spot History Load Error: {e}")
+        rows = []
+    return sorted(rows, key=lambda r: r.get("date", ""))
+
+
+# --- INCREMENTAL MELT REVALUATION ---
+def spot_moved(last, current, threshold=REVALUE_THRESHOLD):
+    if not last: return True
+    for metal in ("silver", "gold"):
+        old = float(last.get(metal) or 0)
+        new = float(current.get(metal) or 0)
+        if old <= 0: return True
+        if abs(new - old) / old >= threshold: return True
+    return False
+
+def revalue_precious_coins(db, path, df, silver_p, gold_p, batch_size=REVALUE_BATCH_SIZE, progress_cb=None):
+    """
+    Rewrites Melt Value only for coins with precious-metal content, and only
+    where the value actually changed. Commits in batches. Returns #coins updated.
+    """
+    if df.empty: return 0
+    precious = df[precious_mask(df)]
+    if precious.empty: return 0
+
+    new_melt = compute_melt_values(precious, silver_p, gold_p)
+    changed = precious[precious['Melt Value'].astype(str) != new_melt]
+    total = len(changed)
+
+    batch = db.batch(); count = 0; done = 0
+    for index, row in changed.iterrows():
+        ref = db.collection(path).document(row['id'])
+        batch.set(ref, {"Melt Value": new_melt.loc[index]}, merge=True)
+        count += 1; done += 1
+        if count >= batch_size:
+            batch.commit(); batch = db.batch(); count = 0
+            if progress_cb: progress_cb(done, total)
+    if count > 0: batch.commit()
+    if progress_cb: progress_cb(done, total)
+    return total
+
+def revalue_if_spot_moved(db, path, df, prices, threshold=REVALUE_THRESHOLD, progress_cb=None):
+    """
+    Compares current spot with the spot last used for this vault (stored next to
+    the coins under meta/melt_spot) and revalues precious coins if it moved.
+    Returns #coins updated (0 when nothing moved).
+    """
+    meta_ref = db.collection(path.rsplit("/", 1)[0] + "/meta").document("melt_spot")  # users/{email}/meta
+    try:
+        snap = meta_ref.get()
+        last = snap.to_dict() if snap.exists else None
+    except Exception as e:
+        print(f"Melt Spot Load Error: {e}")
+        return 0
+
+    if not spot_moved(last, prices, threshold): return 0
+
+    updated = revalue_precious_coins(db, path, df, prices["silver"], prices["gold"], progress_cb=progress_cb)
+    meta_ref.set({
+        "silver": prices["silver"],
+        "gold": prices["gold"],
+        "revalued_at": datetime.now().isoformat(),
+        "coins_updated": updated,
+    }, merge=True)
+    return updated
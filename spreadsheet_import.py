@@ -0,0 +1,340 @@
+"""
+Headless spreadsheet (Excel / CSV) import.
+
+map_dataframe() applies a column mapping to a whole sheet with columnar
+DataFrame operations (one pass per column, not one Python call per row):
+mapped columns fill the DISPLAY_ORDER fields, unmapped ones are packed into
+extra_metadata, Year is converted per column, and rows that carry no mapped
+value are reported as failed via masks (fully blank rows, e.g. Excel's
+formatted-but-empty tail, are only counted).
+
+stream_import() is the constant-memory mode for very large files: xlsx is
+read with openpyxl's read-only row iterator and CSV with read_csv(chunksize),
+and every chunk is mapped, normalized, dedup-checked and committed before the
+next one is read. Progress is checkpointed in users/{email}/imports/{id}
+(keyed by user + file hash) and coin ids are derived from the row number, so
+re-uploading an interrupted file resumes after the last committed chunk and a
+re-run chunk only overwrites the same documents.
+"""
+import hashlib
+import io
+import itertools
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from google.cloud import firestore
+
+from coin_dedup import NEAR_LIKELY
+from coin_standards import DISPLAY_ORDER
+from dedup_index import stage_index_writes
+
+EXTRA_METADATA = "EXTRA_METADATA"
+DEFAULTS = {"Cost": "$0.00", "AI Estimated Value": "Pending"}  # every other field defaults to ""
+
+IMPORT_COLLECTION = "imports"   # under users/{email}/
+CHUNK_ROWS = 5000
+STREAM_MIN_BYTES = 2 * 1024 * 1024  # larger uploads skip the in-memory preview
+COMMIT_BATCH_SIZE = 400             # Firestore batches cap at 500 writes
+MAX_FAILED_KEPT = 1000              # failed rows kept for the download; the rest are only counted
+TEMP_COLUMNS = ("Status", "Duplicate Check Key", "Near Duplicate", "Near Confidence", "_index")
+
+
+def _clean(col):
+    """Stripped strings (object dtype) with NaN / blank / 'nan' cells as NaN."""
+    text = col.astype(str).str.strip()
+    blank = col.isna() | text.isna() | text.eq("") | text.str.lower().eq("nan")
+    return text.astype(object).where(~blank)
+
+def _to_year(col):
+    # int(float(x)) where possible, the original text otherwise (e.g. "1921-S", "")
+    num = pd.to_numeric(col, errors="coerce")
+    ok = num.notna() & np.isfinite(num)
+    out = col.copy()
+    out[ok] = num[ok].astype("int64").astype(object)
+    return out
+
+def new_ids(n):
+    """n random uuid4 strings, generated in bulk (uuid.uuid4() per row dominates large imports)."""
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    h = raw.tobytes().hex()
+    return [f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}" for i in range(0, 32 * n, 32)]
+
+def map_dataframe(df, mapping, file_ref=None, id_prefix=None):
+    """
+    Returns (coins DataFrame, failed rows [{Row Index, Data, Error}], stats).
+    mapping is {source column: DISPLAY_ORDER field or EXTRA_METADATA}; when
+    several columns map to one field, the last non-blank one wins. With
+    id_prefix, coin ids are "{id_prefix}-{row index}" instead of random.
+    """
+    start = time.time()
+    cleaned = {src: _clean(df[src]) for src in df.columns}
+
+    fields = {col: pd.Series(DEFAULTS.get(col, ""), index=df.index, dtype=object) for col in DISPLAY_ORDER}
+    mapped_any = np.zeros(len(df), dtype=bool)
+    extra_cols = []
+    for src, vals in cleaned.items():
+        target = mapping.get(src, mapping.get(str(src), EXTRA_METADATA))
+        if target in DISPLAY_ORDER:
+            present = vals.notna()
+            fields[target] = vals.where(present, fields[target])
+            mapped_any |= present.to_numpy()
+        else:
+            extra_cols.append(src)
+    fields["Year"] = _to_year(fields["Year"])
+
+    # --- row errors (masks) ---
+    any_value = mapped_any.copy()
+    for src in extra_cols:
+        any_value |= cleaned[src].notna().to_numpy()
+    failed = [{"Row Index": idx, "Data": str(df.loc[idx].to_dict()), "Error": "No values in mapped columns"}
+              for idx in df.index[any_value & ~mapped_any]]
+
+    # --- assemble ---
+    keep = mapped_any
+    n = int(keep.sum())
+    coins = pd.DataFrame({col: s[keep] for col, s in fields.items()}).reset_index(drop=True)
+    coins.insert(0, "id", [f"{id_prefix}-{i}" for i in df.index[keep]] if id_prefix else new_ids(n))
+    coins["deep_dive_status"] = "PENDING"
+    coins["inventoryStatus"] = "UNCHECKED"
+    if extra_cols:
+        extra = pd.DataFrame({src: cleaned[src][keep] for src in extra_cols})
+        records = extra.astype(object).where(extra.notna(), None).to_dict("records")
+        coins["extra_metadata"] = [{k: v for k, v in r.items() if v is not None} for r in records]
+    else:
+        coins["extra_metadata"] = [{} for _ in range(n)]
+    if file_ref: coins["file_ref"] = file_ref
+
+    elapsed = time.time() - start
+    stats = {"rows": len(df), "mapped": n, "failed": len(failed), "blank": int((~any_value).sum()), "seconds": round(elapsed, 3),
+             "rows_per_s": int(len(df) / elapsed) if elapsed > 0 else None}
+    return coins, failed, stats
+
+
+# --- STREAMING READERS ---
+def _is_csv(name):
+    return str(name).lower().endswith(".csv")
+
+def _is_xlsx(name):
+    return str(name).lower().endswith((".xlsx", ".xlsm"))
+
+def _rewind(file_obj):
+    if hasattr(file_obj, "seek"): file_obj.seek(0)
+    return file_obj
+
+@contextmanager
+def _csv_text(file_obj):
+    # pandas closes the buffer it reads from when a chunked reader is abandoned; the upload must stay readable
+    f = _rewind(file_obj)
+    if isinstance(f, (io.RawIOBase, io.BufferedIOBase)):
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        try:
+            yield text
+        finally:
+            text.detach()
+    else:
+        yield f
+
+def _header(values):
+    cols = [str(v).strip() if v is not None and str(v).strip() else f"Unnamed: {i}" for i, v in enumerate(values)]
+    seen = {}
+    for i, c in enumerate(cols):  # same de-duplication as pandas ("Cost", "Cost.1")
+        if c in seen:
+            seen[c] += 1
+            cols[i] = f"{c}.{seen[c]}"
+        else:
+            seen[c] = 0
+    return cols
+
+def read_header(file_obj, name):
+    """Column names only (the mapping step never needs the rows)."""
+    if _is_csv(name):
+        with _csv_text(file_obj) as f:
+            return list(pd.read_csv(f, nrows=0).columns)
+    if _is_xlsx(name):
+        from openpyxl import load_workbook
+        wb = load_workbook(_rewind(file_obj), read_only=True, data_only=True)
+        try:
+            return _header(next(wb.active.iter_rows(values_only=True), ()))
+        finally:
+            wb.close()
+    return list(pd.read_excel(_rewind(file_obj), nrows=0).columns)
+
+def estimate_rows(file_obj, name):
+    """Data-row count for progress (CSV: line count; xlsx: sheet dimension), or None."""
+    try:
+        if _is_csv(name):
+            f = _rewind(file_obj)
+            lines, last = 0, b"\n"
+            for block in iter(lambda: f.read(1 << 20), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+            return max(lines - 1 + (last != b"\n"), 0)
+        if _is_xlsx(name):
+            from openpyxl import load_workbook
+            wb = load_workbook(_rewind(file_obj), read_only=True, data_only=True)
+            try:
+                return max((wb.active.max_row or 1) - 1, 0) or None
+            finally:
+                wb.close()
+    except Exception as e:
+        print(f"Row Estimate Error ({name}): {e}")
+    return None
+
+def iter_chunks(file_obj, name, chunk_rows=CHUNK_ROWS, skip_rows=0):
+    """
+    Yields DataFrames of at most chunk_rows data rows, indexed by their row
+    number in the file (0 = first row under the header), starting at skip_rows.
+    """
+    if _is_csv(name):
+        # dtype=str keeps each cell as written, so chunks never disagree on inferred types;
+        # empty lines stay (blank) rows, since skiprows counts them when resuming
+        with _csv_text(file_obj) as f:
+            reader = pd.read_csv(f, dtype=str, chunksize=chunk_rows, skip_blank_lines=False,
+                                 skiprows=range(1, skip_rows + 1) if skip_rows else None)
+            start = skip_rows
+            for chunk in reader:
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+    elif _is_xlsx(name):
+        from openpyxl import load_workbook
+        wb = load_workbook(_rewind(file_obj), read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            cols = _header(next(rows, ()))
+            start = skip_rows
+            rows = itertools.islice(rows, skip_rows, None)
+            while True:
+                block = list(itertools.islice(rows, chunk_rows))
+                if not block: break
+                block = [(r + (None,) * len(cols))[:len(cols)] for r in block]
+                yield pd.DataFrame(block, columns=cols, index=pd.RangeIndex(start, start + len(block)))
+                start += len(block)
+        finally:
+            wb.close()
+    else:
+        # Legacy .xls has no row-streaming reader; it is loaded once and sliced
+        df = pd.read_excel(_rewind(file_obj))
+        df.index = pd.RangeIndex(0, len(df))
+        for start in range(skip_rows, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+
+# --- IMPORT CHECKPOINTS (users/{email}/imports/{import id}) ---
+def import_id(user_email, sha):
+    return hashlib.sha256(f"{user_email}|{sha}".encode("utf-8")).hexdigest()[:32]
+
+def _import_ref(db, user_email, iid):
+    return db.collection(f"users/{user_email}/{IMPORT_COLLECTION}").document(iid)
+
+def load_import(db, user_email, iid):
+    if db is None or not iid: return {}
+    try:
+        snap = _import_ref(db, user_email, iid).get()
+        return (snap.to_dict() or {}) if snap.exists else {}
+    except Exception as e:
+        print(f"Import Load Error ({iid}): {e}")
+        return {}
+
+def _checkpoint(db, user_email, iid, state):
+    if db is None: return
+    try:
+        _import_ref(db, user_email, iid).set(dict(state, updated_at=datetime.now().isoformat()), merge=True)
+    except Exception as e:
+        print(f"Import Checkpoint Error ({iid}): {e}")
+
+def _commit_coins(db, user_email, coins, iid):
+    ref = db.collection(f"users/{user_email}/coins")
+    drop = [c for c in TEMP_COLUMNS if c in coins.columns]
+    records = coins.drop(columns=drop).to_dict("records")
+    for start in range(0, len(records), COMMIT_BATCH_SIZE):
+        batch = db.batch()
+        for doc in records[start:start + COMMIT_BATCH_SIZE]:
+            doc["created_at"] = firestore.SERVER_TIMESTAMP
+            doc["import_id"] = iid
+            batch.set(ref.document(doc["id"]), doc, merge=True)
+        if start + COMMIT_BATCH_SIZE >= len(records):
+            stage_index_writes(batch, db, user_email, coins)  # duplicate-key index, with the chunk's last batch
+        batch.commit()
+    return len(records)
+
+
+# --- STREAMING IMPORT ---
+def stream_import(file_obj, name, mapping, db, user_email, iid, file_ref=None, normalize=None, dedupe=None,
+                  skip_duplicates=True, chunk_rows=CHUNK_ROWS, total_rows=None, progress=None):
+    """
+    Imports a spreadsheet chunk by chunk and returns the import state
+    {status, rows_done, imported, duplicates, failed, blank, failed_rows, ...}.
+
+    normalize(coins_df) -> coins_df and dedupe(coins_df) -> coins_df with a
+    'Status' column (NEW / DUPLICATE) are applied per chunk; with
+    skip_duplicates only NEW rows are written. progress(state) is called
+    after every committed chunk. Only one chunk is held in memory at a time.
+    """
+    state = load_import(db, user_email, iid)
+    if state.get("status") == "done": return state
+    resumed = state.get("rows_done", 0)
+    state.update({"file": name, "file_ref": file_ref, "status": "running",
+                  "rows_done": resumed, "total_rows": total_rows or state.get("total_rows"),
+                  "resumed_from": resumed or None, "started_at": state.get("started_at") or datetime.now().isoformat()})
+    for key in ("imported", "duplicates", "near_duplicates", "failed", "blank"): state.setdefault(key, 0)
+    failed_rows = []
+    start = time.time()
+    _checkpoint(db, user_email, iid, state)
+
+    try:
+        for chunk in iter_chunks(file_obj, name, chunk_rows=chunk_rows, skip_rows=resumed):
+            coins, failed, stats = map_dataframe(chunk, mapping, file_ref=file_ref, id_prefix=iid[:16])
+            if not coins.empty:
+                if normalize is not None: coins = normalize(coins)
+                if dedupe is not None: coins = dedupe(coins)
+                is_dupe = coins["Status"].eq("DUPLICATE") if "Status" in coins.columns else pd.Series(False, index=coins.index)
+                state["duplicates"] += int(is_dupe.sum())
+                if "Near Confidence" in coins.columns:
+                    state["near_duplicates"] += int((coins["Near Confidence"].ge(NEAR_LIKELY) & ~is_dupe).sum())
+                state["imported"] += _commit_coins(db, user_email, coins[~is_dupe] if skip_duplicates else coins, iid)
+            state["failed"] += stats["failed"]
+            state["blank"] += stats["blank"]
+            failed_rows.extend(failed[:MAX_FAILED_KEPT - len(failed_rows)])
+            state["rows_done"] = int(chunk.index[-1]) + 1
+            elapsed = time.time() - start
+            state["rows_per_s"] = int((state["rows_done"] - resumed) / elapsed) if elapsed > 0 else None
+            _checkpoint(db, user_email, iid, state)
+            if progress is not None: progress(dict(state, failed_rows=failed_rows))
+    except Exception as e:
+        # Counters stay as of the last committed chunk; the failed chunk is redone on resume
+        _checkpoint(db, user_email, iid, {"status": "interrupted", "error": str(e)})
+        raise
+    state["status"] = "done"
+    state["finished_at"] = datetime.now().isoformat()
+    _checkpoint(db, user_email, iid, state)
+    return dict(state, failed_rows=failed_rows)
+
+
+if __name__ == "__main__":
+    from column_mapping import resolve_column_mapping
+    from gcp_clients import get_firestore, get_model, init_vertex
+
+    if len(sys.argv) < 3:
+        print("usage: python spreadsheet_import.py <file.xlsx|file.csv> <user_email>")
+        sys.exit(1)
+    path, user = sys.argv[1], sys.argv[2]
+    init_vertex()
+    db = get_firestore()
+    with open(path, "rb") as f:
+        digest = hashlib.sha256()
+        for block in iter(lambda: f.read(1 << 20), b""): digest.update(block)
+        sha = digest.hexdigest()
+        mapping, _ = resolve_column_mapping(read_header(f, path), db=db, user_email=user, model=get_model())
+        total = estimate_rows(f, path)
+        result = stream_import(f, os.path.basename(path), mapping, db, user, import_id(user, sha), total_rows=total,
+                               progress=lambda s: print(f"  {s['rows_done']:,}/{s['total_rows'] or '?'} rows | "
+                                                        f"{s['imported']:,} imported | {s['rows_per_s']} rows/s"))
+    print(f"{result['status']}: {result['imported']:,} imported, {result['duplicates']:,} duplicates, {result['failed']:,} failed")
@@ -0,0 +1,79 @@
+import ast
+import re
+
+import column_mapping as cm
+from local_gcp import LocalFirestore
+
+# Resolution order (exact -> synonym -> fuzzy -> signature cache -> model) with a stub model that counts calls
+print("Running Column Mapping Resolution Test...")
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+class StubModel:
+    """Answers from a fixed table and records which headers it was asked about."""
+
+    def __init__(self, answers, fail=False):
+        self.answers = answers
+        self.fail = fail
+        self.asked = []
+
+    def generate_content(self, prompt, generation_config=None):
+        columns = ast.literal_eval(re.search(r"Source Columns: (\[.*\])", prompt).group(1))
+        self.asked.append(columns)
+        if self.fail: raise ValueError("model unavailable")
+        pairs = [{"source": c, "target": self.answers.get(c, cm.EXTRA_METADATA)} for c in columns]
+        return _Response(str(pairs).replace("'", '"'))
+
+def fresh_process():
+    # What a new app instance starts with: nothing learned or cached in memory
+    with cm._lock:
+        cm._learned = None
+        cm._mapping_cache.clear()
+
+db = LocalFirestore()
+HEADERS = ["Year", " denomination", "Price Paid", "Mint Markk", "Coin Grde", "Widget Code", "Acquired From"]
+ANSWERS = {"Widget Code": cm.EXTRA_METADATA, "Acquired From": "Retailer/Website"}
+
+# --- 1. Local steps first; the model is asked only about what they can't resolve ---
+fresh_process()
+model = StubModel(ANSWERS)
+mapping, info = cm.resolve_column_mapping(HEADERS, db=db, user_email="a@example.com", model=model)
+print(f"  first upload: {info}")
+assert model.asked == [["Widget Code", "Acquired From"]]
+assert info == {"methods": {"exact": 2, "synonym": 1, "fuzzy": 2, "model": 2}, "model_calls": 1}
+assert mapping == {"Year": "Year", " denomination": "Denomination", "Price Paid": "Cost", "Mint Markk": "Mint Mark",
+                   "Coin Grde": "Condition", "Widget Code": cm.EXTRA_METADATA, "Acquired From": "Retailer/Website"}
+
+# --- 2. Same layout again: learned synonym + signature cache, no model call ---
+model = StubModel(ANSWERS)
+again, info = cm.resolve_column_mapping(HEADERS, db=db, user_email="a@example.com", model=model)
+print(f"  same layout: {info}")
+assert again == mapping and model.asked == [] and info["model_calls"] == 0
+assert info["methods"] == {"exact": 2, "synonym": 2, "fuzzy": 2, "cached": 1}
+
+# --- 3. New process, another user: both come back from Firestore (global cache) ---
+fresh_process()
+model = StubModel(ANSWERS)
+other, info = cm.resolve_column_mapping(HEADERS, db=db, user_email="b@example.com", model=model)
+print(f"  new process, other user: {info}")
+assert other == mapping and model.asked == [] and info["methods"].get("cached") == 1
+
+# --- 4. Precedence: exact beats fuzzy, built-in synonyms beat learned ones ---
+assert cm.match_header("Mint Mark") == ("Mint Mark", "exact")
+assert cm.match_header("GRADE", {"grade": "Personal Notes"}) == ("Condition", "synonym")
+assert cm.match_header("Acquired From", {"acquired from": "Retailer/Website"}) == ("Retailer/Website", "synonym")
+assert cm.match_header("Widget Code") == (None, None)
+
+# --- 5. Model failure or no model: unresolved headers are kept as extra metadata, nothing cached ---
+fresh_process()
+db_fail = LocalFirestore()
+model = StubModel(ANSWERS, fail=True)
+failed, info = cm.resolve_column_mapping(["Year", "Mystery Column"], db=db_fail, user_email="a@example.com", model=model)
+assert model.asked == [["Mystery Column"]] and failed["Mystery Column"] == cm.EXTRA_METADATA
+assert info["methods"].get("unresolved") == 1 and not db_fail.paths(cm.GLOBAL_COLLECTION)
+offline, info = cm.resolve_column_mapping(["Year", "Mystery Column"], db=None, model=None)
+assert offline["Mystery Column"] == cm.EXTRA_METADATA and info["model_calls"] == 0
+print("\nSUCCESS: Logic Verified")
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from google.cloud import firestore
+
+import dedup_index as di
+from coin_dedup import attr_keys, identify_duplicates, inv_keys
+from local_gcp import LocalFirestore
+
+# Incremental dedup index vs a full rebuild, on the local Firestore stand-in
+print("Running Dedup Index Test...")
+
+USER = "collector@example.com"
+db = LocalFirestore()
+coins_ref = db.collection(f"users/{USER}/coins")
+meta_ref = db.collection(f"users/{USER}/{di.INDEX_COLLECTION}").document(di.META_DOC)
+
+def make_coins(n, start, seed):
+    rng = np.random.default_rng(seed)
+    pick = lambda opts: [opts[i] for i in rng.integers(0, len(opts), n)]
+    return pd.DataFrame({
+        'id': [f"c{i:05d}" for i in range(start, start + n)],
+        'Year': rng.integers(1870, 2024, n).astype(str),
+        'Mint Mark': pick(['D', 'S', 'P', '']),
+        'Denomination': pick(['Morgan Silver Dollar', 'Dime', 'Quarter', 'Lincoln Cent']),
+        'Condition': [f"MS-{g}" for g in rng.integers(60, 70, n)],
+        'Retailer Invoice #': pick(['INV-1', 'INV-2', '']),
+        'Retailer Item No.': [f"SKU{i}" for i in range(start, start + n)],
+        'Cost': rng.integers(1, 500, n).astype(str),
+        'Personal Notes': '',
+    })
+
+def write_coins(df, before=None):
+    # Same shape as the app's save paths: coin writes + index writes in one batch
+    batch = db.batch()
+    for row in df.to_dict("records"):
+        batch.set(coins_ref.document(row['id']), row, merge=True)
+    di.stage_index_writes(batch, db, USER, df, before=before)
+    batch.commit()
+
+def vault():
+    return pd.DataFrame([s.to_dict() for s in coins_ref.stream()])
+
+def index_state(index):
+    return index.attr, index.inv, {b: recs for b, recs in index.blocks.items() if recs}
+
+def fresh_load():
+    with di._lock:
+        di._cache.clear()  # as a new process would: read the shards, not the in-memory copy
+    return di.load_index(db, USER)
+
+def assert_matches_rebuild(label):
+    incremental = fresh_load()
+    assert not meta_ref.get().to_dict().get("dirty"), f"{label}: index unexpectedly dirty"
+    rebuilt = di.rebuild_index(db, USER, incremental.generation)
+    assert index_state(incremental) == index_state(rebuilt), f"{label}: incremental index != rebuild"
+    print(f"  {label}: {len(incremental.attr)} attr / {len(incremental.inv)} inv keys match rebuild_index")
+
+# --- 1. Writes: two import batches ---
+di.load_index(db, USER)  # builds the empty index
+first, second = make_coins(300, 0, 1), make_coins(200, 300, 2)
+write_coins(first)
+write_coins(second)
+assert_matches_rebuild("after writes")
+
+# Known coins are exact duplicates; repeated loads cost one meta read
+index = di.load_index(db, USER)
+flagged = identify_duplicates(second.drop(columns='id').head(20).copy(), index=index)
+assert (flagged['Status'] == 'DUPLICATE').all()
+reads = db.reads
+assert di.load_index(db, USER) is index and db.reads - reads == 1
+
+# --- 2. Edit that keeps every key (notes only): stays incremental ---
+edited = first.head(25).copy()
+edited['Personal Notes'] = 'rechecked'
+write_coins(edited, before=first.head(25))
+assert_matches_rebuild("after a key-preserving edit")
+
+# --- 3. Edit that changes keys: dirty flag -> next load rebuilds ---
+edited = first.head(25).copy()
+edited['Condition'] = 'VF-20'
+write_coins(edited, before=first.head(25))
+assert meta_ref.get().to_dict()["dirty"] is True
+generation = meta_ref.get().to_dict()["generation"]
+index = di.load_index(db, USER)
+meta = meta_ref.get().to_dict()
+assert meta["dirty"] is False and meta["generation"] == generation + 1 and meta["coins"] == 500
+new_keys = identify_duplicates(edited.drop(columns='id').copy(), index=index)
+old_attr = set(di.key_digests(attr_keys(first.head(25))))
+still_in_vault = old_attr & set(di.key_digests(attr_keys(vault())))
+print(f"  after a re-keying edit: rebuilt; {len(old_attr & index.attr)} of 25 old ATTR keys left "
+      f"({len(still_in_vault)} still used by other coins)")
+assert old_attr & index.attr == still_in_vault
+assert (new_keys['Status'] == 'DUPLICATE').all()
+assert_matches_rebuild("after the rebuild")
+
+# --- 4. Delete: dirty flag -> rebuild drops the coins ---
+gone = second.tail(10)
+batch = db.batch()
+for cid in gone['id']: batch.delete(coins_ref.document(cid))
+di.mark_index_dirty(db, USER, batch=batch)
+batch.commit()
+assert meta_ref.get().to_dict()["dirty"] is True
+index = di.load_index(db, USER)
+assert meta_ref.get().to_dict()["coins"] == 490
+expected = di.rebuild_index(db, USER, index.generation)
+assert index_state(index) == index_state(expected)
+assert not any(cid in recs for recs in index.blocks.values() for cid in gone['id'])
+assert not set(di.key_digests(inv_keys(gone)).dropna()) & index.inv
+print(f"  after deleting {len(gone)} coins: rebuilt from {len(vault())} coins")
+
+# --- 5. A write that lands during a rebuild: generation only goes up, next load rebuilds again ---
+late = make_coins(5, 900, 5)
+vault_shards = di._vault_shards
+def racing_shards(db_, user):
+    out = vault_shards(db_, user)
+    write_coins(late)  # commits after the projection was read, before the rebuild's batch
+    return out
+di._vault_shards = racing_shards
+generation = meta_ref.get().to_dict()["generation"]
+raced = di.rebuild_index(db, USER, generation)
+di._vault_shards = vault_shards
+meta = meta_ref.get().to_dict()
+assert meta["generation"] == generation + 3 and meta["dirty"] is True  # write +1, rebuild +1, re-dirtied +1
+assert set(di.key_digests(attr_keys(late))) - raced.attr and di._cache.get(USER) is not raced
+index = di.load_index(db, USER)
+assert set(di.key_digests(attr_keys(late))) <= index.attr and not meta_ref.get().to_dict()["dirty"]
+print(f"  write during a rebuild: index re-dirtied, next load has all {meta_ref.get().to_dict()['coins']} coins")
+
+# --- 6. Unreadable index: duplicates still found from the vault; a failed vault read raises ---
+get_all = db.get_all
+db.get_all = lambda refs: (_ for _ in ()).throw(RuntimeError("shards unavailable"))
+meta_ref.set({"generation": firestore.Increment(1)}, merge=True)  # force a shard read
+fallback = di.load_index(db, USER)
+assert index_state(fallback) == index_state(index) and fallback.generation == -1
+assert (identify_duplicates(late.drop(columns='id').copy(), index=fallback)['Status'] == 'DUPLICATE').all()
+select = type(coins_ref).select
+type(coins_ref).select = lambda self, fields: (_ for _ in ()).throw(RuntimeError("vault unavailable"))
+try:
+    di.load_index(db, USER)
+    raise AssertionError("load_index hid a failed vault read")
+except RuntimeError as e:
+    print(f"  unreadable index and vault: raises ({e})")
+finally:
+    type(coins_ref).select = select
+    db.get_all = get_all
+print("\nSUCCESS: Logic Verified")
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+
+import invoice_pipeline as ip
+from local_gcp import LocalBucket, LocalDocAIClient
+
+# Runs the DocAI batch path end-to-end against the local stand-ins (no GCP calls)
+print("Running DocAI Batch OCR Test...")
+
+root = tempfile.mkdtemp()
+bucket = LocalBucket(root)
+for fn in ["sample-invoice.pdf", "test_scan.pdf"]:
+    bucket.blob(ip.QUEUE_PREFIX + fn).upload_from_string(open(fn, "rb").read())
+bucket.blob(ip.QUEUE_PREFIX + "broken.pdf").upload_from_string(b"")
+
+client = LocalDocAIClient(bucket, polls=2)
+blobs = ip.list_queue(bucket)
+docs = ip.batch_ocr(bucket, blobs, client=client, poll_seconds=0)
+
+for b in blobs:
+    doc = docs.get(b.name)
+    online = ip.process_invoice(b.download_as_bytes(), client=client).text
+    status = "MISSING" if doc is None else ("MATCH" if doc.text == online else "MISMATCH")
+    print(f"{b.name}: {status} ({len(doc.text) if doc else 0} chars)")
+
+print(f"Batch jobs: {client.batch_calls}, online calls: {client.online_calls}")
+assert client.batch_calls == 1
+assert all(docs[b.name].text for b in blobs if b.name.endswith("invoice.pdf"))
+assert not bucket.list_blobs(ip.BATCH_OUTPUT_PREFIX), "batch output left in the bucket"
+
+# A job that times out is cancelled and its output still cleaned up
+slow = LocalDocAIClient(bucket, polls=100)
+try:
+    ip.batch_ocr(bucket, blobs, client=slow, poll_seconds=0, timeout=0)
+    raise AssertionError("timeout not raised")
+except TimeoutError as e:
+    print(f"Timed out: {e}")
+assert slow.last_operation.cancelled and not bucket.list_blobs(ip.BATCH_OUTPUT_PREFIX)
+
+shutil.rmtree(root)
+print("Done.")
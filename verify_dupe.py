@@ -1,22 +1,79 @@
+import time
+
+import numpy as np
 import pandas as pd
 
-def identify_duplicates(new_df, existing_df):
+from coin_dedup import identify_duplicates
+
+def identify_duplicates_reference(new_df, existing_df):
+    # The previous apply(axis=1) implementation, kept here as the parity reference
     if existing_df.empty:
         new_df['Status'] = 'NEW'
+        new_df['Duplicate Check Key'] = 'No Existing Data'
         return new_df
 
-    # Create composite keys for comparison
-    def create_key(row):
+    # --- Helper 1: Attribute Key (Legacy compatible) ---
+    def get_attr_key(row):
         y = str(row.get('Year', '')).strip()
         m = str(row.get('Mint Mark', '')).strip().replace('None', '').replace('nan', '')
         d = str(row.get('Denomination', '')).strip()
-        c = str(row.get('Condition', '')).strip()
-        return f"{y}|{m}|{d}|{c}".lower()
+        mt = str(row.get('Metal Content', '')).strip()
+
+        # Condition Normalization (Remove CAC/Sticker noise)
+        raw_c = str(row.get('Condition', '')).upper()
+        c = raw_c.replace("CAC", "").replace("STICKER", "").replace("APPROVED", "").replace("CERTIFIED", "").strip()
+        
+        # Strike Normalization
+        raw_s = str(row.get('Surface & Strike Quality', '')).upper()
+        s = raw_s.replace("CAC", "").replace("APPROVED", "").replace("CERTIFIED", "").strip()
+
+        # Aggressive Denomination Normalization
+        d_lower = d.lower()
+        if d_lower == "dollar":
+            try:
+                yi = int(y)
+                if 1878 <= yi <= 1921: d = "Morgan Silver Dollar"
+                elif 1921 < yi <= 1935: d = "Peace Silver Dollar"
+            except: pass
+
+        return f"{y}|{m}|{d}|{c}|{mt}|{s}".lower()
+
+    # --- Helper 2: Invoice Key (New strict logic) ---
+    def get_inv_key(row):
+        inv = str(row.get('Retailer Invoice #', '')).strip().lower()
+        item = str(row.get('Retailer Item No.', '')).strip().lower()
+        
+        if inv and item and inv != 'nan' and item != 'nan':
+            return f"{inv}|{item}"
+        return None
 
-    existing_keys = set(existing_df.apply(create_key, axis=1))
+    # --- Build Indices ---
+    existing_attr_keys = set(existing_df.apply(get_attr_key, axis=1))
+    existing_inv_keys = set(existing_df.apply(get_inv_key, axis=1))
+    # Remove None from set to avoid false positives
+    existing_inv_keys.discard(None) 
+
+    # --- Check New Rows ---
+    def check_dupe(row):
+        k_attr = get_attr_key(row)
+        k_inv = get_inv_key(row)
+        
+        # HYBRID CHECK: If EITHER matches, it's a duplicate
+        is_dupe_attr = k_attr in existing_attr_keys
+        is_dupe_inv = (k_inv is not None) and (k_inv in existing_inv_keys)
+        
+        status = 'DUPLICATE' if (is_dupe_attr or is_dupe_inv) else 'NEW'
+        
+        # Debug String
+        debug_str = f"ATTR: {k_attr}"
+        if k_inv: debug_str += f" || INV: {k_inv}"
+        if is_dupe_inv: debug_str += " [MATCH: INV]"
+        elif is_dupe_attr: debug_str += " [MATCH: ATTR]"
+        
+        return pd.Series([status, debug_str])
+
+    new_df[['Status', 'Duplicate Check Key']] = new_df.apply(check_dupe, axis=1)
     
-    # Apply status
-    new_df['Status'] = new_df.apply(lambda x: 'DUPLICATE' if create_key(x) in existing_keys else 'NEW', axis=1)
     return new_df
 
 # Test Case
@@ -42,3 +99,34 @@ if result.iloc[0]['Status'] == 'DUPLICATE' and result.iloc[2]['Status'] == 'NEW'
     print("\nSUCCESS: Logic Verified")
 else:
     print("\nFAIL: Logic Incorrect")
+
+# --- parity with the apply version ---
+def make_coins(n, seed):
+    rng = np.random.default_rng(seed)
+    pick = lambda opts: [opts[i] for i in rng.integers(0, len(opts), n)]
+    years = rng.integers(1870, 1940, n).astype(object)
+    years[rng.random(n) < 0.05] = "1921.0"
+    years[rng.random(n) < 0.05] = None
+    return pd.DataFrame({
+        'Year': years,
+        'Mint Mark': pick(['D', 'S', ' CC', None, np.nan, 'None', '']),
+        'Denomination': pick(['Dollar', 'dollar ', 'Morgan Silver Dollar', 'Peace Silver Dollar', 'Dime', None]),
+        'Condition': pick(['MS-63', 'ms-63 cac', 'MS63 CAC APPROVED', 'VF-20', None, '']),
+        'Metal Content': pick(['90% Silver', '', None]),
+        'Surface & Strike Quality': pick(['Full Strike', 'CAC Certified', None]),
+        'Retailer Invoice #': pick(['INV-1', 'inv-2 ', '', None, np.nan]),
+        'Retailer Item No.': pick(['A1', 'B2', 'nan', None]),
+    })
+
+existing_big, incoming = make_coins(20000, 1), make_coins(5000, 2)
+fast = identify_duplicates(incoming.copy(), existing_big)
+ref = identify_duplicates_reference(incoming.copy(), existing_big)
+mismatch = int((fast[['Status', 'Duplicate Check Key']] != ref[['Status', 'Duplicate Check Key']]).sum().sum())
+print(f"Parity: {len(incoming)} rows vs {len(existing_big)} coins, {int((fast['Status'] == 'DUPLICATE').sum())} duplicates, {mismatch} mismatched cells")
+assert mismatch == 0
+
+# --- throughput (20k-coin vault, 5k-row import) ---
+start = time.time(); identify_duplicates(incoming.copy(), existing_big); fast_s = time.time() - start
+start = time.time(); identify_duplicates_reference(incoming.copy(), existing_big); ref_s = time.time() - start
+print(f"20k vault x 5k import: vectorized {fast_s:.3f}s vs apply {ref_s:.2f}s ({ref_s / fast_s:.0f}x)")
+print("Done.")
@@ -0,0 +1,73 @@
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from coin_standards import DISPLAY_ORDER
+from spreadsheet_import import map_dataframe
+
+# Checks the columnar mapper against the old per-row logic and measures throughput
+print("Running Import Mapping Test...")
+
+def process_row_reference(row, mapping):
+    # The previous per-row implementation (iterrows), kept here as the parity reference
+    data = {'id': str(uuid.uuid4())}
+    for col in DISPLAY_ORDER: data[col] = ""
+    data['deep_dive_status'] = "PENDING"; data['inventoryStatus'] = "UNCHECKED"
+    data['AI Estimated Value'] = "Pending"; data['Cost'] = "$0.00"
+    extra = {}
+    for src, val in row.items():
+        if pd.isna(val) or val == "" or str(val).lower() == 'nan': continue
+        target = mapping.get(src, "EXTRA_METADATA")
+        if target in DISPLAY_ORDER: data[target] = str(val).strip()
+        else: extra[src] = str(val).strip()
+    try: data['Year'] = int(float(data['Year']))
+    except: pass
+    data['extra_metadata'] = extra
+    return data
+
+def make_sheet(n, seed=7):
+    rng = np.random.default_rng(seed)
+    years = rng.integers(1878, 2024, n).astype(object)
+    years[rng.random(n) < 0.05] = "1921-S"
+    cost = rng.uniform(1, 500, n).round(2).astype(object)
+    cost[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "Yr": years,
+        "Denom": rng.choice(["Morgan Dollar", "Dime", "Penny", " Quarter "], n),
+        "MM": rng.choice(["", "D", "S", "P", None], n),
+        "Grade": rng.choice(["MS-63", "VF-20", "nan", "AU-58"], n),
+        "Price": cost,
+        "Bought": rng.choice(["2024-01-05", "03/14/2023", None], n),
+        "Box": rng.choice(["A1", "B2", None], n),
+        "Notes": rng.choice(["toned", None, "  "], n),
+    })
+
+mapping = {"Yr": "Year", "Denom": "Denomination", "MM": "Mint Mark", "Grade": "Condition",
+           "Price": "Cost", "Bought": "Purchase Date", "Box": "Storage Location", "Notes": "EXTRA_METADATA"}
+
+# --- parity ---
+sheet = make_sheet(2000)
+sheet.loc[5] = [None] * len(sheet.columns)              # empty row
+sheet.loc[6] = [None] * (len(sheet.columns) - 1) + ["only extra"]
+coins, failed, stats = map_dataframe(sheet, mapping)
+ref = [process_row_reference(r, mapping) for _, r in sheet.drop(index=[5, 6]).iterrows()]
+cols = DISPLAY_ORDER + ["deep_dive_status", "inventoryStatus", "extra_metadata"]
+ref_df = pd.DataFrame(ref)[cols]
+# Whitespace-only cells now count as blank (the per-row code stored them as "")
+ref_df["extra_metadata"] = [{k: v for k, v in e.items() if v != ""} for e in ref_df["extra_metadata"]]
+mismatch = sum(1 for c in cols for a, b in zip(coins[c], ref_df[c]) if a != b)
+print(f"Parity: {len(coins)} coins, {len(failed)} failed, {stats['blank']} blank rows, {mismatch} mismatched cells")
+assert mismatch == 0 and len(failed) == 1 and stats['blank'] == 1
+
+# --- throughput ---
+big = make_sheet(40000)
+start = time.time()
+sample = big.head(2000)
+for _, r in sample.iterrows(): process_row_reference(r, mapping)
+per_row_rate = len(sample) / (time.time() - start)
+coins, failed, stats = map_dataframe(big, mapping, file_ref="gs://bucket/sheet.xlsx")
+print(f"40k rows: columnar {stats['seconds']}s ({stats['rows_per_s']:,} rows/s) vs per-row ~{len(big) / per_row_rate:.1f}s ({int(per_row_rate):,} rows/s)")
+assert len(coins) == 40000 and coins['file_ref'].eq("gs://bucket/sheet.xlsx").all()
+print("Done.")
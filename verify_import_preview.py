@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from import_preview import apply_deltas, delta_counts, merge_page, new_deltas, page_bounds, view_labels
+
+# Test Case: edits, removals and added rows round-trip through page diffs
+print("Running Import Preview Delta Test...")
+
+n = 500
+staged = pd.DataFrame({
+    'Status': np.where(np.arange(n) % 10 == 0, 'DUPLICATE', 'NEW'),
+    'Year': np.arange(1900, 1900 + n).astype(str),
+    'Cost': '$1.00',
+    'id': [f"c{i}" for i in range(n)],
+})
+original = staged.copy()
+deltas = new_deltas("stage-1")
+
+def open_page(view, page):
+    view_df = apply_deltas(staged, deltas)
+    labels = view_labels(view_df, view)
+    start, end = page_bounds(page, len(labels))
+    return view_df.loc[labels[start:end]]
+
+# Page 2 of "All": edit a cost, remove a row, add a row (the editor gives new rows no label)
+shown = open_page("All", 2)
+edited = shown.copy()
+edited.loc['51', 'Cost'] = '$5.00'
+edited = edited.drop(index='53')
+edited = pd.concat([edited, pd.DataFrame([{'Year': '2024', 'Cost': '$2.00'}], index=[None])])
+assert merge_page(deltas, shown, edited)
+assert not merge_page(deltas, open_page("All", 2), open_page("All", 2))  # re-render without changes
+
+# "Duplicates" view, page 3: mark a duplicate as NEW so "Import New Only" keeps it
+shown = open_page("Duplicates", 3)
+label = shown.index[0]
+edited = shown.copy()
+edited.loc[label, 'Status'] = 'NEW'
+assert merge_page(deltas, shown, edited)
+assert label not in view_labels(apply_deltas(staged, deltas), "Duplicates")
+
+# Last page of "All" shows the added row: edit it, then an unrelated page is unaffected
+shown = open_page("All", 99)
+assert shown.index[-1] == 'added-0', shown.index[-1]
+edited = shown.copy()
+edited.loc['added-0', 'Cost'] = '$3.00'
+assert merge_page(deltas, shown, edited)
+
+final = apply_deltas(staged, deltas)
+print(f"  deltas: {delta_counts(deltas)} (edited, removed, added) -> {len(final)} rows")
+assert delta_counts(deltas) == (2, 1, 1)
+assert len(final) == n
+assert final.loc['51', 'Cost'] == '$5.00' and '53' not in final.index
+assert final.loc[label, 'Status'] == 'NEW'
+added = final.loc['added-0']
+assert added['Cost'] == '$3.00' and added['Status'] == 'NEW' and pd.isna(added['id'])
+untouched = final.drop(index=['51', label, 'added-0'])
+assert untouched.equals(original.set_axis(original.index.astype(str)).drop(index=['51', '53', label]).astype(untouched.dtypes))
+assert staged.equals(original)  # the staged frame itself is never modified
+
+# Removing the added row drops it instead of recording a deletion
+shown = open_page("All", 99)
+assert merge_page(deltas, shown, shown.drop(index='added-0'))
+assert delta_counts(deltas) == (2, 1, 0) and 'added-0' not in apply_deltas(staged, deltas).index
+
+# A fresh stage starts from empty deltas
+assert delta_counts(new_deltas("stage-2")) == (0, 0, 0)
+print("\nSUCCESS: Logic Verified")
@@ -0,0 +1,123 @@
+import copy
+import shutil
+import tempfile
+
+import invoice_pipeline as ip
+from dedup_index import load_index
+from invoice_cache import content_hash, put_cached_items
+from local_gcp import LocalBucket, LocalFirestore
+
+# The same invoice job committed twice against the local stand-ins: ids are
+# deterministic per job, so the re-run overwrites instead of duplicating
+print("Running Invoice Commit Idempotency Test...")
+
+USER = "collector@example.com"
+ITEMS = [
+    {"category": "US Coin", "Year": "1881", "Mint Mark": "S", "Denomination": "Morgan Dollar", "Cost": "$95",
+     "confidence_score": 0.98, "needs_manual_review": False},
+    {"category": "US Coin", "Year": "1921", "Mint Mark": "", "Denomination": "Peace Dollar", "Cost": "$40",
+     "confidence_score": 0.97, "needs_manual_review": False},
+    {"category": "US Coin", "Year": "1916", "Mint Mark": "D", "Denomination": "Mercury Dime", "Cost": "$900",
+     "confidence_score": 0.60, "needs_manual_review": True},
+    {"category": "Paper Currency", "Year": "1899", "Denomination": "$1 Silver Certificate", "Cost": "$120"},
+    {"category": "Supplies", "Denomination": "2x2 flips", "Cost": "$5"},
+]
+
+def counts(db):
+    return {"coins": len(db.paths(f"users/{USER}/coins")), "review": len(db.paths("review_queue")),
+            "staging": len(db.paths("staging_area"))}
+
+# --- 1. route_items: ids are job prefix + position, stable across runs ---
+jid = ip.job_id(USER, "a" * 64)
+assert jid == ip.job_id(USER, "a" * 64) and jid != ip.job_id("other@example.com", "a" * 64)
+first = ip.route_items(copy.deepcopy(ITEMS), "invoices/queue/a.pdf", id_prefix=jid[:16])
+again = ip.route_items(copy.deepcopy(ITEMS), "invoices/queue/a.pdf", id_prefix=jid[:16])
+ids = [[i["id"] for i in part] for part in first]
+assert ids == [[i["id"] for i in part] for part in again]
+assert ids == [[f"{jid[:16]}-0000", f"{jid[:16]}-0001"], [f"{jid[:16]}-0002"], [f"{jid[:16]}-0003"]], ids
+loose = ip.route_items(copy.deepcopy(ITEMS), "a.pdf")[0]
+assert loose[0]["id"] != ip.route_items(copy.deepcopy(ITEMS), "a.pdf")[0][0]["id"]  # no prefix: fresh uuids
+
+# --- 2. commit_routed twice: same documents, no self-duplicates, one index entry per coin ---
+db = LocalFirestore()
+msg1 = ip.commit_routed(db, USER, *first)
+after_first = counts(db)
+index = load_index(db, USER)
+msg2 = ip.commit_routed(db, USER, *again)
+print(f"  first: {msg1} | second: {msg2} | {counts(db)}")
+assert after_first == {"coins": 2, "review": 1, "staging": 1}
+assert counts(db) == after_first
+assert msg2 == msg1 and "duplicates" not in msg2  # its own earlier commit is not a duplicate
+rerun = load_index(db, USER)
+assert len(index.attr) == 2 and rerun.attr == index.attr and rerun.inv == index.inv
+
+# --- 3. checkpoint merges fields and advances the stage ---
+ip.checkpoint(db, jid, "queued", filename="a.pdf", attempts=0)
+ip.checkpoint(db, jid, "committed", summary=msg1)
+job = ip.load_job(db, jid)
+assert job["stage"] == "committed" and job["filename"] == "a.pdf" and job["summary"] == msg1 and job["attempts"] == 0
+ip.checkpoint(None, jid, "archived")  # no db: no-op
+assert ip.load_job(db, jid)["stage"] == "committed"
+
+# --- 4. Full workflow: a crash after the commit but before its checkpoint re-runs the commit ---
+root = tempfile.mkdtemp()
+try:
+    bucket = LocalBucket(root)
+    db = LocalFirestore()
+    content = b"%PDF-1.4 invoice b"
+    put_cached_items(bucket, content_hash(content), ip.EXTRACTION_VERSION, ITEMS)
+    ok, msg = ip.process_invoice_workflow(content, "b.pdf", USER, db, None, bucket=bucket)
+    assert ok, msg
+    after_first = counts(db)
+    jid = ip.job_id(USER, content_hash(content))
+    assert ip.load_job(db, jid)["stage"] == "committed"
+
+    # The import ledger already has the file; the job stage decides that the commit re-runs
+    db.collection(ip.JOB_COLLECTION).document(jid).set({"stage": "extracted"}, merge=True)
+    ok, msg = ip.process_invoice_workflow(content, "b.pdf", USER, db, None, bucket=bucket)
+    assert ok and msg != "Already imported", msg
+    assert counts(db) == after_first == {"coins": 2, "review": 1, "staging": 1}, counts(db)
+    ok, msg = ip.process_invoice_workflow(content, "b.pdf", USER, db, None, bucket=bucket)
+    assert ok and msg == "Already imported"
+    assert counts(db) == after_first
+finally:
+    shutil.rmtree(root)
+
+# --- 5. Two users sharing the queue: each run takes only its own uploads ---
+root = tempfile.mkdtemp()
+try:
+    bucket = LocalBucket(root)
+    db = LocalFirestore()
+    OTHER = "other@example.com"
+    for user, n in ((USER, 3), (OTHER, 2)):
+        for k in range(n):
+            content = f"%PDF-1.4 {user} invoice {k}".encode()
+            name = f"{ip.QUEUE_PREFIX}{user.split('@')[0]}-{k}.pdf"
+            blob = bucket.blob(name)
+            blob.metadata = {"sha256": content_hash(content), "uploader": user}
+            blob.upload_from_string(content)
+            ip.record_upload(db, user, content_hash(content), name)
+            put_cached_items(bucket, content_hash(content), ip.EXTRACTION_VERSION, ITEMS[:1])
+    loose = b"%PDF-1.4 copied in by hand"
+    bucket.blob(f"{ip.QUEUE_PREFIX}manual.pdf").upload_from_string(loose)  # no uploader: any run may take it
+    put_cached_items(bucket, content_hash(loose), ip.EXTRACTION_VERSION, ITEMS[:1])
+
+    snap = ip.BatchRun(bucket, db, None, USER, batch_ocr_min=0).run()
+    assert snap["done"] == 4, snap
+    assert len(db.paths(f"users/{USER}/coins")) == 4 and not db.paths(f"users/{OTHER}/coins")
+    assert sorted(b.name.split("/")[-1] for b in ip.list_queue(bucket)) == ["other-0.pdf", "other-1.pdf"]
+    assert [f["status"] for f in ip.upload_feed(db, OTHER)] == ["Uploaded", "Uploaded"]
+    assert ip.feed_active(ip.upload_feed(db, OTHER))
+
+    # Event-driven runs over explicit names are scoped the same way
+    snap = ip.BatchRun(bucket, db, None, USER, batch_ocr_min=0, names=[b.name for b in ip.list_queue(bucket)]).run()
+    assert snap["total"] == 0 and len(ip.list_queue(bucket)) == 2
+
+    snap = ip.BatchRun(bucket, db, None, OTHER, batch_ocr_min=0).run()
+    assert snap["done"] == 2 and len(db.paths(f"users/{OTHER}/coins")) == 2 and not ip.list_queue(bucket)
+    feed = ip.upload_feed(db, OTHER)
+    print(f"  shared queue: {USER} 4 coins, {OTHER} feed {[f['status'] for f in feed]}")
+    assert [f["status"] for f in feed] == ["Imported", "Imported"] and not ip.feed_active(feed)
+finally:
+    shutil.rmtree(root)
+print("\nSUCCESS: Logic Verified")
@@ -0,0 +1,135 @@
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import invoice_pipeline as ip
+from invoice_cache import content_hash, put_cached_items
+from invoice_leases import LEASE_COLLECTION, LeaseLost, LeaseManager
+from local_gcp import LocalBucket, LocalFirestore
+
+# Two workers drain one queue against the local stand-ins (no GCP / model calls:
+# every file has cached extraction items, so only leasing and commits run)
+print("Running Invoice Lease Test...")
+
+USER = "collector@example.com"
+N_FILES = 12
+
+root = tempfile.mkdtemp()
+bucket = LocalBucket(root)
+db = LocalFirestore()
+for n in range(N_FILES):
+    content = f"%PDF-1.4 invoice {n}".encode()
+    bucket.blob(f"{ip.QUEUE_PREFIX}invoice-{n:02d}.pdf").upload_from_string(content)
+    put_cached_items(bucket, content_hash(content), ip.EXTRACTION_VERSION, [{
+        "category": "US Coin", "Year": str(1900 + n), "Denomination": "Dime", "Mint Mark": "D",
+        "confidence_score": 0.99, "needs_manual_review": False,
+    }])
+
+commits = Counter()
+committed_by = {}
+commit_routed = ip.commit_routed
+def counted_commit(db_, user, process, review, holding):
+    for item in process + review + holding:
+        commits[item["source_file"]] += 1
+        committed_by[item["source_file"]] = user
+    time.sleep(0.05)  # widen the window for the other worker to race
+    return commit_routed(db_, user, process, review, holding)
+ip.commit_routed = counted_commit
+
+# --- 1. Two concurrent workers: each file processed exactly once ---
+runs = [ip.BatchRun(bucket, db, None, USER, batch_ocr_min=0, extract_workers=2, prefetch=1) for _ in range(2)]
+threads = [threading.Thread(target=r.run) for r in runs]
+for t in threads: t.start()
+for t in threads: t.join()
+
+per_run = [r.snapshot()["done"] for r in runs]
+coins = db.paths(f"users/{USER}/coins")
+print(f"  worker split: {per_run}, commits per file: {sorted(set(commits.values()))}, coins: {len(coins)}")
+assert sum(per_run) == N_FILES
+assert len(commits) == N_FILES and set(commits.values()) == {1}
+assert len(coins) == N_FILES
+assert not ip.list_queue(bucket) and len(bucket.list_blobs(ip.PROCESSED_PREFIX)) == N_FILES
+assert not db.paths(LEASE_COLLECTION)  # all released
+
+# --- 2. An expired lease is taken over; the stale holder is fenced off ---
+stale = LeaseManager(db, owner="worker-a", ttl=0.2)
+fresh = LeaseManager(db, owner="worker-b", ttl=60)
+name = ip.QUEUE_PREFIX + "late.pdf"
+assert stale.claim(name)
+assert not fresh.claim(name)               # live lease: not taken
+time.sleep(0.3)
+assert fresh.claim(name)                   # expired: taken over
+lease = fresh._ref(name).get().to_dict()
+assert lease["owner"] == "worker-b" and lease["previous_owner"] == "worker-a"
+try:
+    stale.verify(name)
+    raise AssertionError("stale holder passed the fencing check")
+except LeaseLost as e:
+    print(f"  stale holder: LeaseLost ({e})")
+stale.renew_all()                          # must not extend worker-b's lease
+stale.release(name)                        # must not delete worker-b's lease
+assert fresh._ref(name).get().to_dict()["owner"] == "worker-b"
+fresh.verify(name)
+
+# Of two racing takeovers from the same snapshot, only one write lands
+snap = fresh._ref(name).get()
+fresh.renew_all()
+try:
+    stale._write_if_unchanged(stale._ref(name), snap, stale._data(name))
+    raise AssertionError("write from a stale snapshot succeeded")
+except Exception as e:
+    assert type(e).__name__ == "FailedPrecondition", e
+fresh.stop()
+assert not fresh._ref(name).get().exists
+
+# --- 3. A BatchRun that lost its lease mid-file commits nothing ---
+content = b"%PDF-1.4 invoice handoff"
+blob = bucket.blob(ip.QUEUE_PREFIX + "handoff.pdf")
+blob.upload_from_string(content)
+put_cached_items(bucket, content_hash(content), ip.EXTRACTION_VERSION, [{
+    "category": "US Coin", "Year": "1950", "Denomination": "Dime", "confidence_score": 0.99, "needs_manual_review": False}])
+slow = ip.BatchRun(bucket, db, None, USER)
+slow.leases = LeaseManager(db, owner="worker-slow", ttl=0.2)
+slow.files[blob.name] = {"status": "queued", "message": "", "started": None, "finished": None}
+assert slow.leases.claim(blob.name)
+plan = slow._lookup(blob)
+time.sleep(0.3)                            # stalled past its lease...
+assert LeaseManager(db, owner="worker-fast").claim(blob.name)  # ...and another worker took the file
+slot = threading.BoundedSemaphore(1)
+slot.acquire()
+slow._extract_stage(blob, plan, slot)
+print(f"  stale BatchRun: {slow.files[blob.name]['status']} ({slow.files[blob.name]['message']})")
+assert slow.files[blob.name]["status"] == "handed_off"
+assert commits[blob.name] == 0 and blob.exists()
+
+# --- 4. Two users, two workers each, one queue: every run commits only its user's uploads ---
+USERS = ["alice@example.com", "bob@example.com"]
+uploads = {}
+for n in range(N_FILES):
+    user = USERS[n % 2]
+    content = f"%PDF-1.4 shared invoice {n}".encode()
+    name = f"{ip.QUEUE_PREFIX}shared-{n:02d}.pdf"
+    blob = bucket.blob(name)
+    blob.metadata = {"sha256": content_hash(content), "uploader": user}
+    blob.upload_from_string(content)
+    uploads[name] = user
+    put_cached_items(bucket, content_hash(content), ip.EXTRACTION_VERSION, [{
+        "category": "US Coin", "Year": str(1800 + n), "Denomination": "Cent", "confidence_score": 0.99, "needs_manual_review": False}])
+runs = [ip.BatchRun(bucket, db, None, user, batch_ocr_min=0, extract_workers=2, prefetch=1) for user in USERS * 2]
+threads = [threading.Thread(target=r.run) for r in runs]
+for t in threads: t.start()
+for t in threads: t.join()
+for run in runs:
+    assert all(uploads[f["name"]] == run.user_email for f in run.snapshot()["files"]), run.user_email
+shared = {name: user for name, user in committed_by.items() if name in uploads}
+print(f"  two users: {[r.snapshot()['done'] for r in runs]} files per run, "
+      f"coins {[len(db.paths(f'users/{u}/coins')) for u in USERS]}")
+assert shared == uploads and all(commits[name] == 1 for name in uploads)
+assert [len(db.paths(f"users/{u}/coins")) for u in USERS] == [N_FILES // 2, N_FILES // 2]
+assert not set(uploads) & {b.name for b in ip.list_queue(bucket)}
+
+ip.commit_routed = commit_routed
+shutil.rmtree(root)
+print("\nSUCCESS: Logic Verified")
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from melt_calculator import compute_melt_values
+
+# Test Case: coins whose year range is shared by a silver and a non-silver issue
+print("Running Melt Value Test...")
+
+coins = pd.DataFrame([
+    {'Year': '1868', 'Denomination': 'Nickel', 'Metal Content': 'Cupro-Nickel'},  # Shield nickel: no melt
+    {'Year': '1868', 'Denomination': 'Half Dime', 'Metal Content': '90% Silver'},  # half dime: silver
+    {'Year': '1868', 'Denomination': 'Nickel', 'Metal Content': ''},               # unknown metal: half dime
+    {'Year': '1851', 'Denomination': 'Dollar', 'Metal Content': 'Gold'},          # gold dollar
+    {'Year': '1851', 'Denomination': 'Dollar', 'Metal Content': '90% Silver'},    # Seated dollar
+    {'Year': '1881', 'Denomination': 'Morgan Dollar', 'Metal Content': None},      # Morgan, no metal given
+    {'Year': '1943', 'Denomination': 'Nickel', 'Metal Content': 'Cupro-Nickel'},  # not a war nickel
+    {'Year': '1964', 'Denomination': 'Dime', 'Metal Content': ''},
+    {'Year': '1965', 'Denomination': 'Dime', 'Metal Content': 'Clad'},
+])
+expected = ["N/A", "$1.08", "$1.08", "$120.95", "$23.20", "$23.20", "N/A", "$2.17", "N/A"]
+melt = compute_melt_values(coins, 30, 2500)
+print(pd.DataFrame({'Year': coins['Year'], 'Denomination': coins['Denomination'], 'Metal': coins['Metal Content'],
+                    'Melt': melt, 'Expected': expected}))
+assert melt.tolist() == expected, melt.tolist()
+print("\nSUCCESS: Logic Verified")
@@ -1,20 +1,14 @@
+import time
 from datetime import datetime
+
+import numpy as np
 import pandas as pd
 
-COIN_STANDARDS = {
-    "denominations": {
-        "Penny": ["1c", "Cent", "One Cent"],
-        "Nickel": ["5c", "Five Cents", "V Nickel"],
-        "Dime": ["10c", "Mercury Dime"],
-        "Dollar": ["$1", "Silver Dollar"]
-    },
-    "metals": {
-        "90% Silver": ["Fine Silver"],
-        "Cupro-Nickel": ["Copper-Nickel"]
-    }
-}
+from coin_normalize import normalize_coin_data
+from coin_standards import COIN_STANDARDS
 
-def normalize_coin_data(df):
+def normalize_coin_data_reference(df):
+    # The previous per-cell implementation (apply), kept here as the parity reference
     if df.empty: return df
     
     def get_canonical(val, category):
@@ -71,3 +65,32 @@ if normalized.iloc[0]['Denomination'] == 'Nickel' and normalized.iloc[0]['Metal
     print("\nSUCCESS: Normalization Works")
 else:
     print("\nFAIL: Mappings Incorrect")
+
+# --- parity with the per-cell version ---
+def make_rows(n, seed=3):
+    rng = np.random.default_rng(seed)
+    pick = lambda opts: [opts[i] for i in rng.integers(0, len(opts), n)]
+    return pd.DataFrame({
+        'Denomination': pick(['5c', ' silver dollar ', 'Morgan Dollar', 'Quarter', 'Trade Dollar', '', None, np.nan, 'ASE']),
+        'Metal Content': pick(['Copper-Nickel', 'clad', '90% Silver', 'Unknown', '', None]),
+        'Purchase Date': pick(['2023-01-01', '03/14/2023', 'Jan 5, 2024', datetime(2022, 7, 4), pd.Timestamp('2021-02-03'),
+                               'not a date', 'NaT', '', None, np.nan]),
+        'Theme/Subject': pick(['N/A', 'Liberty', ' blank ', None, np.nan, 'None']),
+        'Program/Series': pick(['America the Beautiful', 'n/a', '']),
+        'Mint Mark': pick(['D', 'S', 'none', None, '']),
+    })
+
+rows = make_rows(5000)
+fast = normalize_coin_data(rows.copy())
+ref = normalize_coin_data_reference(rows.copy())
+same = lambda a, b: a == b or (pd.isna(a) and pd.isna(b))
+mismatch = sum(1 for c in rows.columns for a, b in zip(fast[c], ref[c]) if not same(a, b))
+print(f"Parity: {len(rows)} rows, {mismatch} mismatched cells")
+assert mismatch == 0
+
+# --- throughput ---
+big = make_rows(100000)
+start = time.time(); normalize_coin_data(big.copy()); fast_s = time.time() - start
+start = time.time(); normalize_coin_data_reference(big.head(5000).copy()); ref_s = (time.time() - start) * 20
+print(f"100k rows: vectorized {fast_s:.2f}s vs per-cell ~{ref_s:.1f}s")
+print("Done.")
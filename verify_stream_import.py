@@ -0,0 +1,111 @@
+import io
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import spreadsheet_import as si
+from local_gcp import LocalBatch, LocalFirestore
+
+# Streams generated CSV / xlsx files into the local Firestore stand-in, fails a
+# commit mid-file, resumes, and checks that every row was written exactly once
+print("Running Streaming Import Test...")
+
+USER = "collector@example.com"
+MAPPING = {"Yr": "Year", "Denom": "Denomination", "Price": "Cost", "Notes": "EXTRA_METADATA"}
+
+def make_sheet(n, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Yr": rng.integers(1878, 2024, n).astype(str),
+        "Denom": rng.choice(["Morgan Dollar", "Dime", "Quarter"], n),
+        "Price": rng.uniform(1, 500, n).round(2).astype(str),
+        "Notes": rng.choice(["toned", ""], n),
+    })
+    df.loc[df.index % 97 == 5, ["Yr", "Denom", "Price"]] = ""   # notes only: a failed row
+    df.loc[df.index % 89 == 7, :] = ""                          # fully blank row
+    return df
+
+def dedupe(coins):
+    return coins.assign(Status=np.where(coins["Year"].astype(str) == "1900", "DUPLICATE", "NEW"))
+
+def expected_rows(df):
+    mapped = df[["Yr", "Denom", "Price"]].ne("").any(axis=1)
+    return set(df.index[mapped & df["Yr"].ne("1900")])
+
+class CommitFailure(Exception):
+    pass
+
+def run_interrupted(file_obj, name, df, chunk_rows, fail_after_rows):
+    db = LocalFirestore()
+    iid = si.import_id(USER, name)
+    commit = LocalBatch.commit
+
+    # 1. First attempt: a commit fails part-way through the chunk after `fail_after_rows`
+    armed = {"after": None}
+    def progress(state):
+        if state["rows_done"] >= fail_after_rows and armed["after"] is None: armed["after"] = db.commits + 1
+    def flaky_commit(batch):
+        if armed["after"] is not None and db.commits >= armed["after"]:
+            armed["after"] = float("inf")
+            raise CommitFailure("connection reset")
+        commit(batch)
+    LocalBatch.commit = flaky_commit
+    try:
+        si.stream_import(file_obj, name, MAPPING, db, USER, iid, dedupe=dedupe, chunk_rows=chunk_rows,
+                         total_rows=len(df), progress=progress)
+        raise AssertionError("import was not interrupted")
+    except CommitFailure:
+        pass
+    finally:
+        LocalBatch.commit = commit
+    state = si.load_import(db, USER, iid)
+    written_before = len(db.paths(f"users/{USER}/coins"))
+    assert state["status"] == "interrupted" and state["rows_done"] % chunk_rows == 0
+    assert written_before > state["imported"]  # the failed chunk was partly written
+
+    # 2. Re-upload: resumes after the last committed chunk and rewrites the partial one in place
+    tracemalloc.start()
+    start = time.time()
+    result = si.stream_import(file_obj, name, MAPPING, db, USER, iid, dedupe=dedupe, chunk_rows=chunk_rows, total_rows=len(df))
+    seconds, peak = time.time() - start, tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    paths = db.paths(f"users/{USER}/coins")
+    ids = [p.rsplit("/", 1)[1] for p in paths]
+    want = {f"{iid[:16]}-{row}" for row in expected_rows(df)}
+    print(f"  {name}: interrupted at row {state['rows_done']:,} ({written_before:,} coins written), "
+          f"resumed -> {result['imported']:,} imported, {result['duplicates']:,} duplicates, {result['failed']:,} failed, "
+          f"{result['blank']:,} blank; {len(df):,} rows in {seconds:.2f}s, peak {peak / 1e6:.1f} MB")
+    assert result["status"] == "done" and result["resumed_from"] == state["rows_done"]
+    assert result["rows_done"] == len(df)
+    assert set(ids) == want, f"{len(set(ids) ^ want)} coin ids differ from one per imported row"
+    assert result["imported"] == len(want)
+    mapped, filled = df[["Yr", "Denom", "Price"]].ne("").any(axis=1), df.ne("").any(axis=1)
+    assert result["failed"] == int((filled & ~mapped).sum())
+    assert result["blank"] == int((~filled).sum())
+    assert result["duplicates"] == int(df["Yr"].eq("1900").sum())
+    assert all(db.docs[p]["import_id"] == iid for p in paths[:50])
+
+    # 3. A finished import is not re-run
+    commits = db.commits
+    assert si.stream_import(file_obj, name, MAPPING, db, USER, iid)["status"] == "done" and db.commits == commits
+
+# --- CSV (with raw empty lines, which must not shift resumed row numbers) ---
+sheet = make_sheet(20000, 1)
+buf = io.BytesIO()
+sheet.to_csv(buf, index=False)
+text = buf.getvalue().decode().splitlines()
+for row in sheet.index[sheet.index % 89 == 7]: text[row + 1] = ""  # header is line 0
+csv = io.BytesIO(("\n".join(text) + "\n").encode())
+assert si.estimate_rows(csv, "vault.csv") == len(sheet)
+run_interrupted(csv, "vault.csv", sheet, chunk_rows=1000, fail_after_rows=7000)
+
+# --- xlsx (openpyxl read-only rows) ---
+sheet = make_sheet(3000, 2)
+xlsx = io.BytesIO()
+sheet.replace("", None).to_excel(xlsx, index=False)
+run_interrupted(xlsx, "vault.xlsx", sheet, chunk_rows=500, fail_after_rows=1500)
+
+print("\nSUCCESS: Logic Verified")